@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+import argparse, json, os, glob
+from datetime import datetime
+import cv2, numpy as np
+import segmentation
+import utils
+
+# CONSTANTS
+
+# Labelled regions are stored next to the frames in this file
+SAMPLES_FILE = "samples.json"
+# Share of sample pixels cut off at each end of a channel (glare, shadows, mislabelled edges)
+TAIL = 0.01
+# Added around the fitted hue and saturation/value bounds
+HUE_MARGIN = 3
+SV_MARGIN = 15
+IMAGE_TYPES = (".png", ".jpg", ".jpeg", ".bmp")
+
+def load_samples(directory: str) -> list[dict]:
+	path = os.path.join(directory, SAMPLES_FILE)
+	if not os.path.isfile(path):
+		return []
+	with open(path, "r") as file:
+		return json.load(file)
+
+def label(directory: str, colors: list[str]):
+	"""
+	Select sample regions of every color in the recorded frames with the mouse and add them to the samples file.
+
+	Parameters:
+	  directory (str): Directory with the recorded frames.
+	  colors (list[str]): The colors to ask for in every frame.
+	"""
+	samples = load_samples(directory)
+	paths = sorted(path for path in glob.glob(os.path.join(directory, "*")) if path.lower().endswith(IMAGE_TYPES))
+	for path in paths:
+		frame = cv2.imread(path)
+		for color in colors:
+			title = f"{os.path.basename(path)}: {color} (drag regions, Enter after each, Esc when done)"
+			for x, y, w, h in cv2.selectROIs(title, frame, showCrosshair=False):
+				samples.append({"image": os.path.basename(path), "color": color, "rect": [int(x), int(y), int(w), int(h)]})
+			cv2.destroyWindow(title)
+	with open(os.path.join(directory, SAMPLES_FILE), "w") as file:
+		json.dump(samples, file, indent=1)
+	print(f"{len(samples)} regions in {SAMPLES_FILE}")
+
+def collect_pixels(directory: str, samples: list[dict]) -> dict[str, np.ndarray]:
+	"""Returns the HSV pixels (N x 3) inside the labelled regions, per color."""
+	regions = {}
+	for sample in samples:
+		regions.setdefault(sample["image"], []).append(sample)
+	pixels = {}
+	for image, image_samples in regions.items():
+		hsv = cv2.cvtColor(cv2.imread(os.path.join(directory, image)), cv2.COLOR_BGR2HSV)
+		for sample in image_samples:
+			x, y, w, h = sample["rect"]
+			pixels.setdefault(sample["color"], []).append(hsv[y:y + h, x:x + w].reshape(-1, 3))
+	return {color: np.concatenate(parts) for color, parts in pixels.items()}
+
+def histogram_bounds(histogram: np.ndarray, tail: float) -> tuple[int, int]:
+	"""Returns the bins at which the cumulative histogram passes tail and 1 - tail."""
+	cumulative = np.cumsum(histogram) / histogram.sum()
+	# The lower bin is the first past tail, so empty bins in front of the samples never count (tail 0)
+	return int(np.searchsorted(cumulative, tail, side="right")), int(np.searchsorted(cumulative, 1 - tail))
+
+def fit_hue(hue: np.ndarray, tail: float, margin: int) -> tuple[int, int]:
+	"""
+	Fit hue bounds. Hue is circular (red sits at both 0 and 179), so the histogram is rotated
+	around the circular mean before cutting the tails.
+
+	Returns:
+	  tuple[int, int]: Lower and upper hue, never wrapping around (the smaller side of a wrapping range is dropped).
+	"""
+	histogram = np.bincount(hue, minlength=180)[:180]
+	angles = np.arange(180) * (2 * np.pi / 180)
+	center = int(round(np.arctan2(histogram @ np.sin(angles), histogram @ np.cos(angles)) / (2 * np.pi / 180))) % 180
+	shift = 90 - center
+	lower, upper = histogram_bounds(np.roll(histogram, shift), tail)
+	lower = (lower - margin - shift) % 180
+	upper = (upper + margin - shift) % 180
+	if lower > upper:
+		# Ranges are single intervals, keep the side with more pixels
+		if histogram[lower:].sum() >= histogram[:upper + 1].sum():
+			print(f"  hue range wraps around, using {lower}-180 (dropping 0-{upper})")
+			return lower, 180
+		print(f"  hue range wraps around, using 0-{upper} (dropping {lower}-180)")
+		return 0, upper
+	return lower, upper
+
+def fit_colors(pixels: dict[str, np.ndarray], tail: float = TAIL, hue_margin: int = HUE_MARGIN,
+			   sv_margin: int = SV_MARGIN) -> dict[str, dict[str, int]]:
+	"""
+	Fit HSV bounds to the sample pixels of every color from their channel histograms.
+
+	Returns:
+	  dict[str, dict[str, int]]: Ranges like utils.COLORS.
+	"""
+	colors = {}
+	for color, values in pixels.items():
+		print(f"{color}: {len(values)} pixels")
+		lower_hue, upper_hue = fit_hue(values[:, 0], tail, hue_margin)
+		lower_saturation, upper_saturation = histogram_bounds(np.bincount(values[:, 1], minlength=256), tail)
+		lower_value, upper_value = histogram_bounds(np.bincount(values[:, 2], minlength=256), tail)
+		colors[color] = {
+			"lower_hue": lower_hue,
+			"upper_hue": upper_hue,
+			"lower_saturation": max(0, lower_saturation - sv_margin),
+			"upper_saturation": min(255, upper_saturation + sv_margin),
+			"lower_value": max(0, lower_value - sv_margin),
+			"upper_value": min(255, upper_value + sv_margin),
+		}
+	return colors
+
+def check(colors: dict[str, dict[str, int]], pixels: dict[str, np.ndarray]):
+	"""Prints which share of every color's samples falls into its own range and into the others."""
+	names = list(colors)
+	lut = segmentation.build_lut(colors)
+	for color, values in pixels.items():
+		labels = lut[values[:, 0], values[:, 1], values[:, 2]]
+		shares = [f"{other} {np.count_nonzero(labels & (1 << bit)) / len(values) * 100:.1f}%" for bit, other in enumerate(names)]
+		print(f"  {color} samples hit: {', '.join(shares)}")
+
+def fit(directory: str, output: str = segmentation.CALIBRATION_FILE):
+	"""Fit the ranges of all labelled colors and write them to the calibration file."""
+	samples = load_samples(directory)
+	if not samples:
+		print(f"No labelled regions in {directory}, run the label command first.")
+		return
+	pixels = collect_pixels(directory, samples)
+	fitted = fit_colors(pixels)
+	for color in fitted:
+		if color not in utils.COLORS:
+			print(f"Warning: {color} is not one of utils.COLORS, the robot ignores its range")
+	uncalibrated = [color for color in utils.COLORS if color not in fitted]
+	for color in uncalibrated:
+		print(f"Warning: no labelled regions of {color}, the robot keeps its hand-tuned range")
+	check(dict(utils.COLORS, **fitted), pixels)
+	calibration = {
+		"version": segmentation.CALIBRATION_VERSION,
+		"created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+		# Relative to the calibration file, which is synced to the robot without the frames
+		"frames": os.path.relpath(os.path.abspath(directory), os.path.dirname(os.path.abspath(output))).replace(os.sep, "/"),
+		"pixels": {color: len(values) for color, values in pixels.items()},
+		"colors": fitted,
+		"uncalibrated": uncalibrated,
+	}
+	with open(output + ".tmp", "w") as file:
+		json.dump(calibration, file, indent=1)
+	os.replace(output + ".tmp", output)
+	print(f"Written to {output}")
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Fit the HSV ranges of the cup colors to labelled regions of recorded frames.")
+	commands = parser.add_subparsers(dest="command", required=True)
+	label_parser = commands.add_parser("label", help="select sample regions in the frames with the mouse")
+	label_parser.add_argument("frames", help="directory with the recorded frames")
+	label_parser.add_argument("--color", action="append", help="only label this color (can be given multiple times)")
+	fit_parser = commands.add_parser("fit", help="fit the ranges and write the calibration file")
+	fit_parser.add_argument("frames", help="directory with the recorded frames and their samples file")
+	fit_parser.add_argument("--output", default=segmentation.CALIBRATION_FILE, help="calibration file to write")
+	args = parser.parse_args()
+
+	if args.command == "label":
+		label(args.frames, args.color or list(utils.COLORS))
+	else:
+		fit(args.frames, args.output)
@@ -0,0 +1,185 @@
+#!/usr/bin/python3
+import collections, glob, os, threading, time
+import cv2, numpy as np
+
+# CONSTANTS
+
+# Frames kept in the ring buffer
+BUFFER_SIZE = 5
+# Frames thrown away after opening the camera, while auto exposure settles
+WARMUP_FRAMES = 5
+
+class OpenCVBackend:
+	"""Reads frames from a camera device through cv2.VideoCapture."""
+	def __init__(self, index: int = 0):
+		self.capture = cv2.VideoCapture(index)
+		if not self.capture.isOpened():
+			raise RuntimeError(f"Could not access the camera {index}.")
+		# Keep the driver from queueing old frames, we want the newest one
+		self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+	def read(self) -> np.ndarray:
+		ret, frame = self.capture.read()
+		return frame if ret else None
+
+	def release(self):
+		self.capture.release()
+
+class FakeCamera:
+	"""
+	Replays image files as if they came from a camera, for testing without the robot.
+
+	Parameters:
+	  source (str | list[str]): A directory, a glob pattern or a list of image paths.
+	  fps (float): Frames per second to replay at, 0 replays as fast as possible.
+	  loop (bool): Start over after the last image instead of ending the stream.
+	"""
+	def __init__(self, source, fps: float = 30, loop: bool = True):
+		if isinstance(source, str):
+			pattern = os.path.join(source, "*") if os.path.isdir(source) else source
+			source = sorted(path for path in glob.glob(pattern) if path.lower().endswith((".png", ".jpg", ".jpeg", ".bmp")))
+		if not source:
+			raise RuntimeError("FakeCamera: no images found.")
+		self.frames = [cv2.imread(path) for path in source]
+		self.interval = 1 / fps if fps else 0
+		self.loop = loop
+		self.position = 0
+		self.next_time = time.monotonic()
+
+	def read(self) -> np.ndarray:
+		if self.position >= len(self.frames):
+			if not self.loop:
+				return None
+			self.position = 0
+		# Pace like a real camera
+		delay = self.next_time - time.monotonic()
+		if delay > 0:
+			time.sleep(delay)
+		self.next_time = max(self.next_time, time.monotonic()) + self.interval
+		frame = self.frames[self.position]
+		self.position += 1
+		return frame.copy()
+
+	def release(self):
+		pass
+
+class CameraService:
+	"""
+	Opens the camera once and grabs frames continuously in a background thread into a small
+	ring buffer, so callers get a current frame without waiting for the device. The backend is
+	released by the grab thread once it ends, never while it might still be reading.
+
+	Parameters:
+	  backend: Where frames come from, e.g. OpenCVBackend or FakeCamera.
+	  buffer_size (int): How many of the newest frames are kept.
+	  warmup_frames (int): Frames dropped after opening, while auto exposure settles.
+	"""
+	def __init__(self, backend, buffer_size: int = BUFFER_SIZE, warmup_frames: int = WARMUP_FRAMES):
+		self.backend = backend
+		self.warmup_frames = warmup_frames
+		self.frames = collections.deque(maxlen=buffer_size)
+		self.sequence = 0
+		self.condition = threading.Condition()
+		self.running = False
+		self.released = False
+		self.thread = None
+
+	def start(self) -> "CameraService":
+		if not self.running:
+			self.running = True
+			self.thread = threading.Thread(target=self._grab, daemon=True)
+			self.thread.start()
+		return self
+
+	def _grab(self):
+		dropped = 0
+		while self.running:
+			frame = self.backend.read()
+			if frame is None:
+				# Stream ended (fake camera) or the device failed
+				break
+			if dropped < self.warmup_frames:
+				dropped += 1
+				continue
+			with self.condition:
+				self.sequence += 1
+				self.frames.append((self.sequence, time.monotonic(), frame))
+				self.condition.notify_all()
+		with self.condition:
+			self.running = False
+			self.condition.notify_all()
+		self._release()
+
+	def _release(self):
+		with self.condition:
+			if self.released:
+				return
+			self.released = True
+		self.backend.release()
+
+	def wait_for_frame(self, after: int = 0, timeout: float = 2.0) -> tuple[int, float, np.ndarray]:
+		"""
+		Wait for a frame newer than the given sequence number.
+
+		Parameters:
+		  after (int): Sequence number of the last frame the caller has seen.
+		  timeout (float): Seconds to wait at most.
+
+		Returns:
+		  tuple: The sequence number, grab time (monotonic) and frame, or None on timeout or end of stream.
+		"""
+		with self.condition:
+			self.condition.wait_for(lambda: (self.frames and self.frames[-1][0] > after) or not self.running, timeout)
+			if self.frames and self.frames[-1][0] > after:
+				return self.frames[-1]
+			return None
+
+	def latest(self, timeout: float = 2.0) -> np.ndarray:
+		"""Returns the newest frame, waiting for the first one if necessary (None on timeout)."""
+		entry = self.wait_for_frame(0, timeout)
+		return entry[2] if entry else None
+
+	def median(self, count: int = 3, timeout: float = 2.0) -> np.ndarray:
+		"""
+		Returns the per-pixel median of the newest frames, which removes sensor noise and flicker.
+
+		Parameters:
+		  count (int): Number of frames to combine (at most the buffer size).
+		  timeout (float): Seconds to wait at most for the buffer to hold that many frames.
+
+		Returns:
+		  np.ndarray: The median frame, or None if no frame arrived in time.
+		"""
+		count = min(count, self.frames.maxlen)
+		with self.condition:
+			self.condition.wait_for(lambda: len(self.frames) >= count or not self.running, timeout)
+			frames = [frame for _, _, frame in list(self.frames)[-count:]]
+		if not frames:
+			return None
+		if len(frames) == 1:
+			return frames[0]
+		return np.median(np.stack(frames), axis=0).astype(np.uint8)
+
+	def stop(self):
+		self.running = False
+		thread, self.thread = self.thread, None
+		if thread is not None:
+			thread.join(1)
+			if thread.is_alive():
+				# Still inside a slow read(), the thread releases the backend once that returns
+				print("Camera read still running, released once it returns")
+				return
+		self._release()
+
+_shared = None
+
+def shared_camera(index: int = 0) -> CameraService:
+	"""Returns the camera service used by the whole process, opening the camera on the first call."""
+	global _shared
+	if _shared is None or not _shared.running:
+		_shared = CameraService(OpenCVBackend(index)).start()
+	return _shared
+
+def active_camera() -> CameraService:
+	"""Returns the shared camera service if it is running, else None."""
+	return _shared if _shared is not None and _shared.running else None
@@ -1,22 +1,39 @@
 import sys
+import os
 sys.path.append("/usr/lib")
+# Synced next to this file on the robot, found in the repository when run locally
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "shared"))
 import kipr as k
 import threading
 import subprocess
 import time
+import asyncio
 import utils
-import os
+import camera
+import debug_stream
+from trajectory import ServoEngine
+from mission import Mission, rehearse
+from schedule import Scheduler, MATCH_TIME, measured_estimates
+from channel import Channel
 
 k.enable_servos()
 
-def delta_time_move(port: int, position: int, interval: float) -> None:
+# Servo moves, all updated from one thread
+servos = ServoEngine()
+
+# Events shared with the janitor: this robot signals cups_placed, the janitor bottles_dropped and beverages_clear
+channel = Channel("bartender")
+
+# Steps of the game, durations are tuned there without touching this file
+MISSION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mission.yaml")
+# Timing profiles of the runs, their median phase durations are the estimates of phases without one
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".profiles")
+
+def delta_time_move(port: int, position: int, interval: float, profile: str = "linear") -> None:
+    # Takes interval seconds per tick of distance, as the old tick by tick loop was meant to
     k.enable_servo(port)
-    current_position = k.get_servo_position(port)
-    steps = 1 if current_position < position else -1
-    for i in range(current_position, position + steps, steps):
-        k.set_servo_position(port, i)
-        print(k.get_servo_position(port))
-        time.sleep(interval)
+    distance = abs(position - k.get_servo_position(port))
+    servos.move(port, position, distance * interval, profile).result()
 
 def dead_end_test() -> None:
     start_pos = 900
@@ -45,6 +62,16 @@ def wind(up: bool, speed: float) -> None:
     time.sleep(8 * calibration)
     k.off(1)
 
+def wind_up(duration: float, speed: float = 100) -> None:
+    k.motor(1, -speed)
+    time.sleep(duration)
+    k.off(1)
+
+def wind_down(duration: float, speed: float = 100) -> None:
+    k.motor(1, speed)
+    time.sleep(duration)
+    k.off(1)
+
 def wind_test() -> None:
     for i in range(5):
         wind(True, 100)
@@ -103,9 +130,9 @@ def collect_drinkpods() -> None:
     move(True, True, 100, 0.3) #! ACTIVATE
     # magazine up
     delta_time_move(1, 925, 0.001)
-    # wait for assistant
+    # wait for assistant (at most the 10 s this waited before)
     print("wait for assistant ..")
-    time.sleep(10)
+    channel.wait("beverages_clear", 10)
     # rotate to the left
     move(False, True, 100, 3.3975) #! ACTIVATE
     # prepare magazine level
@@ -132,96 +159,70 @@ def collect_drinkpods() -> None:
     k.off(3)
     k.off(2)
 
-def grab_cups(correct_cup) -> None:
-    # if targeted cup is index 2 take 0 as secondary cup
-    # if targeted cup is index 1 take 0 as secondary cup
-    if correct_cup == 0 or correct_cup == 1 or correct_cup == 2:
-        # turn sligthy to the left
-        move(False, True, 50, 0.485)
-        # move forward
-        move(True, True, 100, 1.6275)
-        time.sleep(0.2)
-        # close grabber
-        delta_time_move(0, 1560, 0.001)
-        # back up
-        move(True, True, -100, 1.9)
-        # wind up to very high position
-        k.motor(1, -100)
-        time.sleep(MOTOR_WIND_LENGTH + 2)
-        k.off(1)
-        # level magazines
-        delta_time_move(1, 550, 0.001)  # was 550 before
-        # wait for assistant
-        print("wait for assistant ..")
-        time.sleep(9.5)
-        # rotate to the right
-        move(True, False, 100, 4.005)
-        time.sleep(0.1)
-        # move forward
-        move(True, True, 100, 0.5)
-        time.sleep(0.1)
-        # wind down to place cups
-        k.motor(1, 100)
-        time.sleep(MOTOR_WIND_LENGTH - 0.25)
-        k.off(1)
-        # level magazine
-        delta_time_move(1, 450, 0.001)
-        time.sleep(0.1)
-        # open grabbers
-        delta_time_move(0, 700, 0.001)
-        # wind up
-        k.motor(1, -100)
-        time.sleep(MOTOR_WIND_LENGTH - 2)
-        k.off(1)
-        # magazine up
-        delta_time_move(1, 700, 0.001)
-        # rotate to the left
-        move(True, False, -100, 3.9)  #* 1st RUN: 4.0 before
-        # level magazine
-        delta_time_move(1, 570, 0.001)
-        # wind down
-        k.motor(1, 100)
-        time.sleep(MOTOR_WIND_LENGTH - 1.3 + 0.2)
-        k.off(1)
-        # move forward
-        move(True, True, 100, 2.2)
-        # close grabber
-        delta_time_move(0, 1560, 0.001)
-        # back up
-        move(True, True, -100, 2)
-        # wind up
-        k.motor(1, -100)
-        time.sleep(MOTOR_WIND_LENGTH - 1)
-        k.off(1)
-        # rotate to the right
-        move(True, False, 100, 3.95)
-        time.sleep(0.1)
-        # back up
-        move(True, True, -100, 0.75)
-        # wind down
-        k.motor(1, 100)
-        time.sleep(MOTOR_WIND_LENGTH - 1)
-        k.off(1)
-        # open grabbers
-        delta_time_move(0, 700, 0.001)
-        # wind up
-        k.motor(1, -100)
-        time.sleep(MOTOR_WIND_LENGTH - 1)
-        k.off(1)
-    
-    # if targeted cup is index 0 take 2 as secondary cup
-
 def detect_cup() -> int:
     try:
-        frame, masks, contours = utils.detect_contours()
-        correct_cup, sorted_contours = utils.find_cups(frame, masks, contours)
-        print(correct_cup)
-        print(sorted_contours)
+        # Vote over the frames of the camera opened at startup (if it could be opened)
+        cam = camera.active_camera()
+        if cam:
+            start = time.monotonic()
+            correct_cup, share, frames = utils.vote_cup(cam)
+            print(f"Cup {correct_cup}: {share * 100:.0f}% of the votes, {frames} frames in {(time.monotonic() - start) * 1000:.0f} ms")
+            if correct_cup is None:
+                return 2
+        else:
+            frame, masks, contours = utils.detect_contours()
+            correct_cup, sorted_contours = utils.find_cups(frame, masks, contours)
+            print(correct_cup)
+            print(sorted_contours)
     except Exception:
         return 2
 
+    if correct_cup not in (0, 1, 2):
+        # More blobs than cups passed the filters, use the same fallback as when detection fails
+        print(f"Cup index {correct_cup} out of range, using 2")
+        return 2
     return correct_cup  # cup index (from left to right)
 
+def release_camera() -> None:
+    # Camera is not needed anymore, free the CPU
+    if camera.active_camera():
+        camera.active_camera().stop()
+    if debug_stream.active_stream():
+        debug_stream.active_stream().stop()
+
+def load_mission(path: str = MISSION_FILE) -> Mission:
+    steps = {
+        "move": move,
+        "servo": delta_time_move,
+        "set_servo": k.set_servo_position,
+        "wind_up": wind_up,
+        "wind_down": wind_down,
+        "sleep": time.sleep,
+        "signal": channel.signal,
+        "wait_for_peer": channel.wait,
+        "detect_cup": detect_cup,
+        "release_camera": release_camera,
+        "starting_sequence": starting_sequence,
+        "collect_drinkpods": collect_drinkpods,
+        "fill_cups": fill_cups,
+    }
+    # The numeric constants of this file can be used in the mission's expressions
+    constants = {name: value for name, value in globals().items() if name.isupper() and isinstance(value, (int, float))}
+    return Mission(path, steps, constants)
+
+def match_scheduler() -> Scheduler:
+    # Skips or cuts low-priority phases so the later high-priority ones still fit into the match
+    # Steps block, so a phase is only cut between its steps, then the motors are stopped
+    return Scheduler(MATCH_TIME, PROFILE_DIR, halt=k.ao, estimates=measured_estimates(PROFILE_DIR))
+
+def reset() -> None:
+    # Before every rehearsal run: motors off and some time to put the robot back to its start
+    k.ao()
+    # A new run of the channel, so events of the last rehearsal run are not taken as this one's
+    channel.stop()
+    channel.start()
+    time.sleep(3)
+
 def off(wait_time: float = 0):
     time.sleep(wait_time)
     print(f"Turning off, {wait_time} s passed!")
@@ -242,17 +243,24 @@ k.disable_servos()
 MOTOR_WIND_LENGTH = 4.75 + 1.45  # 4.75 standard
 if __name__ == "__main__":
     # delta_time_move(1, 1560, 0.001)  #! DEBUG
+    # Compile the mission before the game, so mistakes in it show up now
+    mission = load_mission()
+    # Open the camera now, so it has settled when the light goes on
+    try:
+        camera.shared_camera(utils.CAM_INDEX)
+    except RuntimeError as e:
+        print(e)
+    if utils.DEBUG_STREAM:
+        debug_stream.shared_stream(utils.DEBUG_STREAM)
+    # Let the janitor know about this run before the game starts
+    channel.start()
+    if "--rehearse" in sys.argv:
+        # Run the mission again every time mission.yaml changes, without the light-signal and timer
+        rehearse(mission, reset, match_scheduler())
     print("Waiting for light-signal..")
     while k.digital(9) == 0:
         time.sleep(0.001)
-    timer = threading.Thread(target=off, kwargs={"wait_time": 119})
+    timer = threading.Thread(target=off, kwargs={"wait_time": MATCH_TIME})
     timer.start()
     k.enable_servos()
-    k.set_servo_position(0, 1840)
-    cup_index = detect_cup()
-    starting_sequence(MOTOR_WIND_LENGTH)
-    k.set_servo_position(0, 1000)
-    time.sleep(3)
-    grab_cups(cup_index)
-    collect_drinkpods()
-    fill_cups()
+    asyncio.run(mission.run(match_scheduler()))
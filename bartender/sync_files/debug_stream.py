@@ -0,0 +1,225 @@
+#!/usr/bin/python3
+import os, threading, time, http.server
+import cv2, numpy as np
+
+# CONSTANTS
+
+# Written frames go here (dot directories are not synced), the oldest is overwritten after KEEP_FRAMES
+DEBUG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".debug_frames")
+KEEP_FRAMES = 100
+# Port of the MJPEG endpoint, open http://<robot>:8090/ in a browser
+PORT = 8090
+# Frames published faster than this are dropped before any work is done
+MAX_FPS = 5
+JPEG_QUALITY = 70
+# Frames are shrunk before drawing and encoding
+SCALE = 0.5
+# Frames whose thumbnail differs less than this (mean absolute difference of gray values) are not sent again
+DIFF_THRESHOLD = 2.0
+
+class DebugStream:
+	"""
+	Non-blocking debug output for the detection. publish() only hands the newest frame to a worker
+	thread, which draws the contours, boxes and chosen cup, encodes it as JPEG and writes it to a
+	rotating buffer on disk or serves it as an MJPEG stream. Frames arriving while the worker is busy
+	replace the pending one, so the detection never waits for the output.
+
+	Parameters:
+	  mode (str): "disk" or "http".
+	  directory (str): Where "disk" writes the frames.
+	  keep (int): Number of frames "disk" keeps.
+	  port (int): Port "http" listens on.
+	  fps (float): Most frames per second to process.
+	  quality (int): JPEG quality, 0-100.
+	  scale (float): Scale of the output frames.
+	"""
+	def __init__(self, mode: str = "disk", directory: str = DEBUG_DIR, keep: int = KEEP_FRAMES, port: int = PORT,
+				 fps: float = MAX_FPS, quality: int = JPEG_QUALITY, scale: float = SCALE):
+		if mode not in ("disk", "http"):
+			raise ValueError(f"Unknown debug stream mode {mode}")
+		self.mode = mode
+		self.directory = directory
+		self.keep = keep
+		self.port = port
+		self.interval = 1 / fps
+		self.quality = quality
+		self.scale = scale
+		self.condition = threading.Condition()
+		self.pending = None
+		self.next_time = 0.0
+		self.jpeg = None
+		self.sequence = 0
+		self.thumbnail = None
+		self.stats = {"published": 0, "dropped": 0, "unchanged": 0, "sent": 0, "work": 0.0}
+		self.running = False
+		self.thread = None
+		self.server = None
+
+	def start(self) -> "DebugStream":
+		if self.running:
+			return self
+		self.running = True
+		if self.mode == "disk":
+			os.makedirs(self.directory, exist_ok=True)
+		else:
+			self.server = http.server.ThreadingHTTPServer(("", self.port), _StreamHandler)
+			self.server.daemon_threads = True
+			self.server.stream = self
+			threading.Thread(target=self.server.serve_forever, daemon=True).start()
+			print(f"Debug stream on http://0.0.0.0:{self.port}/")
+		self.thread = threading.Thread(target=self._work, daemon=True)
+		self.thread.start()
+		return self
+
+	def publish(self, frame: np.ndarray, contours: dict[str, list[np.ndarray]], colors: dict[str, tuple[int, int, int]],
+				cup_index: int = None) -> bool:
+		"""
+		Hand a frame to the worker, without copying or drawing anything.
+
+		Parameters:
+		  frame (np.ndarray): The flipped frame, must not be changed by the caller afterwards.
+		  contours (dict[str, list[np.ndarray]]): Contours per color, in frame coordinates.
+		  colors (dict[str, tuple[int, int, int]]): BGR drawing color per color name.
+		  cup_index (int): The chosen cup, if known.
+
+		Returns:
+		  bool: False if the frame was dropped to keep the frame rate.
+		"""
+		now = time.monotonic()
+		if not self.running or now < self.next_time:
+			self.stats["dropped"] += 1
+			return False
+		self.next_time = now + self.interval
+		with self.condition:
+			if self.pending is not None:
+				self.stats["dropped"] += 1
+			self.pending = (frame, contours, colors, cup_index)
+			self.stats["published"] += 1
+			self.condition.notify_all()
+		return True
+
+	def annotate(self, frame: np.ndarray, contours: dict[str, list[np.ndarray]], colors: dict[str, tuple[int, int, int]],
+				 cup_index: int = None) -> np.ndarray:
+		"""Returns a scaled copy of the frame with contours, bounding boxes and the cup index drawn on it."""
+		output = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+		for name, found in contours.items():
+			for cnt in found:
+				scaled = (cnt * self.scale).astype(np.int32)
+				cv2.drawContours(output, [scaled], -1, colors[name], 2)
+				x, y, w, h = cv2.boundingRect(scaled)
+				cv2.rectangle(output, (x, y), (x + w, y + h), (255, 255, 255), 1)
+		label = f"cup {cup_index}" if cup_index is not None else "no cup"
+		cv2.putText(output, label, (8, 24), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+		return output
+
+	def _changed(self, output: np.ndarray) -> bool:
+		thumbnail = cv2.resize(cv2.cvtColor(output, cv2.COLOR_BGR2GRAY), (64, 48), interpolation=cv2.INTER_AREA)
+		changed = self.thumbnail is None or cv2.absdiff(thumbnail, self.thumbnail).mean() >= DIFF_THRESHOLD
+		if changed:
+			self.thumbnail = thumbnail
+		return changed
+
+	def _work(self):
+		while True:
+			with self.condition:
+				self.condition.wait_for(lambda: self.pending is not None or not self.running)
+				if not self.running:
+					return
+				frame, contours, colors, cup_index = self.pending
+				self.pending = None
+
+			start = time.perf_counter()
+			output = self.annotate(frame, contours, colors, cup_index)
+			if not self._changed(output):
+				self.stats["unchanged"] += 1
+				continue
+			ok, encoded = cv2.imencode(".jpg", output, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+			if not ok:
+				continue
+			jpeg = encoded.tobytes()
+			if self.mode == "disk":
+				self._write(jpeg)
+			with self.condition:
+				self.jpeg = jpeg
+				self.sequence += 1
+				self.condition.notify_all()
+			self.stats["sent"] += 1
+			self.stats["work"] += time.perf_counter() - start
+
+	def _write(self, jpeg: bytes):
+		path = os.path.join(self.directory, f"frame_{self.sequence % self.keep:04d}.jpg")
+		# Write aside and rename, so a viewer never sees half a frame
+		with open(path + ".tmp", "wb") as file:
+			file.write(jpeg)
+		os.replace(path + ".tmp", path)
+
+	def wait_jpeg(self, after: int, timeout: float) -> tuple[int, bytes]:
+		"""Returns the sequence number and JPEG of the first frame newer than after, or None on timeout or stop."""
+		with self.condition:
+			self.condition.wait_for(lambda: self.sequence > after or not self.running, timeout)
+			if self.sequence > after and self.running:
+				return self.sequence, self.jpeg
+			return None
+
+	def stop(self):
+		with self.condition:
+			self.running = False
+			self.condition.notify_all()
+		if self.thread is not None:
+			self.thread.join(1)
+			self.thread = None
+		if self.server is not None:
+			self.server.shutdown()
+			self.server.server_close()
+			self.server = None
+		sent = self.stats["sent"]
+		print(f"Debug stream: {self.stats['published']} frames published, {sent} sent, {self.stats['unchanged']} unchanged, "
+			  f"{self.stats['dropped']} dropped, {self.stats['work'] / sent * 1000 if sent else 0:.1f} ms per sent frame")
+
+class _StreamHandler(http.server.BaseHTTPRequestHandler):
+	"""Serves /latest.jpg as a single frame and everything else as an MJPEG stream."""
+	def do_GET(self):
+		stream = self.server.stream
+		if self.path.startswith("/latest"):
+			jpeg = stream.jpeg
+			if jpeg is None:
+				self.send_error(404, "No frame yet")
+				return
+			self.send_response(200)
+			self.send_header("Content-Type", "image/jpeg")
+			self.send_header("Content-Length", str(len(jpeg)))
+			self.end_headers()
+			self.wfile.write(jpeg)
+			return
+
+		self.send_response(200)
+		self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+		self.send_header("Cache-Control", "no-cache")
+		self.end_headers()
+		sequence = 0
+		while stream.running:
+			entry = stream.wait_jpeg(sequence, 1.0)
+			if entry is None:
+				continue
+			sequence, jpeg = entry
+			try:
+				self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: " + str(len(jpeg)).encode()
+								 + b"\r\n\r\n" + jpeg + b"\r\n")
+			except (BrokenPipeError, ConnectionResetError):
+				return
+
+	def log_message(self, format, *args):
+		pass
+
+_shared = None
+
+def shared_stream(mode: str = "disk") -> DebugStream:
+	"""Returns the debug stream used by the whole process, starting it on the first call."""
+	global _shared
+	if _shared is None or not _shared.running:
+		_shared = DebugStream(mode).start()
+	return _shared
+
+def active_stream() -> DebugStream:
+	"""Returns the shared debug stream if it is running, else None."""
+	return _shared if _shared is not None and _shared.running else None
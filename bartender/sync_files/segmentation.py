@@ -0,0 +1,183 @@
+#!/usr/bin/python3
+import sys, time, glob, os, json, hashlib
+import cv2, numpy as np
+
+# CONSTANTS
+
+# Saturation and value are shifted right by this many bits before the lookup (0 is exact, 2 needs 16x less memory)
+QUANT_SHIFT = 0
+# Size of the square morphology kernel
+KERNEL_SIZE = 5
+
+# Color ranges written by calibrate.py, loaded instead of the hand-tuned ones if present
+CALIBRATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hsv_calibration.json")
+# Files with another version are ignored
+CALIBRATION_VERSION = 1
+# Built tables are kept here, named after a hash of their colors (dot directories are not synced)
+LUT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".lut_cache")
+
+def build_lut(colors: dict[str, dict[str, int]], shift: int = QUANT_SHIFT) -> np.ndarray:
+	"""
+	Build a lookup table mapping every HSV value to the colors it belongs to.
+
+	Every color gets one bit of the uint8 label, so overlapping ranges (e.g. green and blue at hue 80)
+	behave exactly like separate cv2.inRange calls. At most 8 colors are supported.
+
+	Parameters:
+	  colors (dict[str, dict[str, int]]): Color ranges, like utils.COLORS.
+	  shift (int): Quantization of saturation and value in bits.
+
+	Returns:
+	  np.ndarray: uint8 table of shape (180, 256 >> shift, 256 >> shift).
+	"""
+	if len(colors) > 8:
+		raise ValueError("At most 8 colors fit into the uint8 label.")
+	hue = np.arange(180)
+	# Bins are in range when their lowest value is (exact for shift 0)
+	level = np.arange(256 >> shift) << shift
+	lut = np.zeros((180, 256 >> shift, 256 >> shift), np.uint8)
+	for bit, values in enumerate(colors.values()):
+		in_hue = (hue >= values["lower_hue"]) & (hue <= values["upper_hue"])
+		in_saturation = (level >= values["lower_saturation"]) & (level <= values["upper_saturation"])
+		in_value = (level >= values["lower_value"]) & (level <= values["upper_value"])
+		inside = in_hue[:, None, None] & in_saturation[None, :, None] & in_value[None, None, :]
+		lut[inside] |= np.uint8(1 << bit)
+	return lut
+
+def load_colors(defaults: dict[str, dict[str, int]], path: str = CALIBRATION_FILE) -> dict[str, dict[str, int]]:
+	"""
+	Replace color ranges with the calibrated ones from the calibration file.
+
+	Parameters:
+	  defaults (dict[str, dict[str, int]]): The hand-tuned ranges, used for colors missing in the file.
+	  path (str): The calibration file.
+
+	Returns:
+	  dict[str, dict[str, int]]: The ranges to use, in the order of the defaults.
+	"""
+	if not os.path.isfile(path):
+		return defaults
+	try:
+		with open(path, "r") as file:
+			calibration = json.load(file)
+	except (OSError, ValueError) as e:
+		print(f"Ignoring {path}: {e}")
+		return defaults
+	if calibration.get("version") != CALIBRATION_VERSION:
+		print(f"Ignoring {path}: version {calibration.get('version')}, expected {CALIBRATION_VERSION}")
+		return defaults
+	missing = [name for name in defaults if name not in calibration["colors"]]
+	if missing:
+		print(f"No calibrated range of {', '.join(missing)} in {path}, using the hand-tuned one")
+	return {name: dict(values, **calibration["colors"].get(name, {})) for name, values in defaults.items()}
+
+def cached_lut(colors: dict[str, dict[str, int]], shift: int = QUANT_SHIFT, directory: str = LUT_CACHE_DIR) -> np.ndarray:
+	"""Returns the table of build_lut, loaded from the cache if it was built for the same colors before."""
+	key = hashlib.sha1(json.dumps([colors, shift], sort_keys=True).encode()).hexdigest()[:16]
+	path = os.path.join(directory, f"lut_{key}.npy")
+	try:
+		return np.load(path)
+	except (OSError, ValueError):
+		pass
+	lut = build_lut(colors, shift)
+	try:
+		os.makedirs(directory, exist_ok=True)
+		# Write aside and rename, so an interrupted write never leaves a broken table behind
+		np.save(path + ".tmp.npy", lut)
+		os.replace(path + ".tmp.npy", path)
+	except OSError as e:
+		print(f"Could not cache the lookup table: {e}")
+	return lut
+
+class LutSegmenter:
+	"""
+	Labels every pixel of an HSV frame with all its colors in one vectorized lookup, then runs
+	morphology and findContours per color on the labelled image.
+
+	Parameters:
+	  colors (dict[str, dict[str, int]]): Color ranges, like utils.COLORS.
+	  min_area (float): Contours with a smaller area are dropped as noise.
+	  shift (int): Quantization of saturation and value in bits.
+	  kernel_size (int): Size of the square morphology kernel.
+	  lut (np.ndarray): Table built by build_lut for the same colors and shift, to share it between segmenters.
+	"""
+	def __init__(self, colors: dict[str, dict[str, int]], min_area: float, shift: int = QUANT_SHIFT,
+				 kernel_size: int = KERNEL_SIZE, lut: np.ndarray = None):
+		self.names = list(colors)
+		self.min_area = min_area
+		self.shift = shift
+		# Flat table, indexed with (h << 2 * bits) | (s << bits) | v
+		self.bits = 8 - shift
+		self.lut = (build_lut(colors, shift) if lut is None else lut).ravel()
+		self.kernel = np.ones((kernel_size, kernel_size), np.uint8)
+
+	def label(self, hsv: np.ndarray) -> np.ndarray:
+		h, s, v = cv2.split(hsv)
+		if self.shift:
+			s = s >> self.shift
+			v = v >> self.shift
+		index = (h.astype(np.uint32) << (2 * self.bits)) | (s.astype(np.uint32) << self.bits) | v
+		return self.lut.take(index)
+
+	def segment(self, hsv: np.ndarray, only: list[str] = None) -> tuple[dict[str, np.ndarray], dict[str, list[np.ndarray]]]:
+		"""
+		Find the masks and contours of all colors in an HSV frame.
+
+		Parameters:
+		  hsv (np.ndarray): The frame (or a region of it) in HSV.
+		  only (list[str]): Only look for these colors, all if None.
+
+		Returns:
+		  tuple: A dictionary mapping color names to masks, and one mapping color names to lists of contours.
+		"""
+		labels = self.label(hsv)
+		masks = {}
+		contours = {}
+		present = np.bitwise_or.reduce(labels, axis=None)
+		for bit, name in enumerate(self.names):
+			if only is not None and name not in only:
+				continue
+			if not present & (1 << bit):
+				# Color is nowhere in the frame, skip its passes
+				masks[name] = np.zeros(labels.shape, np.uint8)
+				contours[name] = []
+				continue
+			mask = cv2.inRange(cv2.bitwise_and(labels, 1 << bit), 1, 255)
+			mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.kernel)
+			mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, self.kernel)
+			found, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+			masks[name] = mask
+			contours[name] = [cnt for cnt in found if cv2.contourArea(cnt) > self.min_area]
+		return masks, contours
+
+def benchmark(frame_paths: list[str], repeat: int = 5):
+	"""Compares the LUT engine with the per-color loop of utils on recorded frames (speed and agreement)."""
+	import utils
+
+	frames = [cv2.flip(cv2.imread(path), -1) for path in frame_paths]
+	start = time.perf_counter()
+	segmenter = LutSegmenter(utils.COLORS, utils.MIN_AREA)
+	print(f"LUT built in {(time.perf_counter() - start) * 1000:.1f} ms ({segmenter.lut.nbytes / 1e6:.1f} MB)")
+
+	results = {}
+	for name, engine in (("loop", utils.segment_loop), ("lut", segmenter.segment)):
+		timings = []
+		for frame in frames:
+			hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+			for i in range(repeat):
+				start = time.perf_counter()
+				masks, contours = engine(hsv)
+				timings.append(time.perf_counter() - start)
+			results.setdefault(name, []).append(masks)
+		timings = np.array(timings) * 1000
+		print(f"{name}: median {np.median(timings):.2f} ms, p95 {np.percentile(timings, 95):.2f} ms per frame")
+
+	differing = sum(int(np.count_nonzero(a[color] != b[color]))
+					for a, b in zip(results["loop"], results["lut"]) for color in a)
+	print(f"Differing mask pixels: {differing}")
+
+if __name__ == "__main__":
+	if len(sys.argv) < 2:
+		print("Usage: segmentation.py <directory with recorded frames>")
+		sys.exit(1)
+	benchmark(sorted(glob.glob(os.path.join(sys.argv[1], "*.png")) + glob.glob(os.path.join(sys.argv[1], "*.jpg"))))
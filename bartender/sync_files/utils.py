@@ -1,8 +1,15 @@
 #!/usr/bin/python3
 from pprint import pprint
-import os, sys, cv2, numpy as np
+import os, sys, time, collections, cv2, numpy as np
 sys.path.append("/usr/lib")
-import kipr as k
+try:
+	import kipr as k
+except ImportError:
+	# Off the robot (vision_bench.py, calibrate.py) only the line following below needs kipr
+	k = None
+import camera
+import debug_stream
+from segmentation import LutSegmenter, load_colors, cached_lut
 
 # CONSTANTS
 
@@ -44,6 +51,31 @@ COLORS = {
 		"upper_value": 255
 	}
 }
+# Calibrated ranges (see calibrate.py) replace the hand-tuned ones above
+COLORS = load_colors(COLORS)
+
+# Region of the flipped frame that is searched, as fractions (left, top, right, bottom).
+# Must contain the cups and the drink, find_cups tells them apart by x position.
+DETECTION_ROI = (0.0, 0.0, 1.0, 1.0)
+# The ROI is searched at this scale first, then only the found boxes at full resolution (1.0 disables)
+COARSE_SCALE = 0.25
+# Pixels added around every coarse box before refining it
+REFINE_MARGIN = 8
+
+# Debug output of the detection: "disk", "http" (see debug_stream.py) or None
+DEBUG_STREAM = None
+
+# Cup voting: stop once the leading index has this share of the votes (and at least VOTE_MIN_VOTES of them)
+VOTE_CONFIDENCE = 0.8
+VOTE_MIN_VOTES = 3
+# Seconds after which the leading index is taken, however confident
+VOTE_DEADLINE = 0.3
+
+# Labels all colors in one pass, built once at import (before the start light)
+SEGMENTER = LutSegmenter(COLORS, MIN_AREA, lut=cached_lut(COLORS))
+# Same table on the downscaled ROI, with area and kernel scaled down to match
+COARSE_SEGMENTER = LutSegmenter(COLORS, MIN_AREA * COARSE_SCALE ** 2, kernel_size=max(3, round(5 * COARSE_SCALE)) | 1,
+								lut=SEGMENTER.lut)
 
 def normalize_brightness(brightness: int) -> float:
 	"""
@@ -125,72 +157,151 @@ def line_follow():
 	k.motor(2, l_control)
 	k.motor(3, r_control)
 
-def show_hsv(event, x, y, flags, param):
-	"""Displays HSV values when clicking on the frame."""
-	if event == cv2.EVENT_LBUTTONDOWN:
-		hsv_value = hsv[y, x]  # Get HSV value at clicked point
-		print(f"HSV at ({x}, {y}): {hsv_value}")
+def mid_bgr(values: dict[str, int]) -> tuple[int, int, int]:
+	"""Returns the middle of an HSV color range as BGR, for drawing."""
+	mid_hue = (values["lower_hue"] + values["upper_hue"]) // 2
+	mid_saturation = (values["lower_saturation"] + values["upper_saturation"]) // 2
+	mid_value = (values["lower_value"] + values["upper_value"]) // 2
+	mid = cv2.cvtColor(np.uint8([[[mid_hue, mid_saturation, mid_value]]]), cv2.COLOR_HSV2BGR)[0][0]
+	return tuple(int(c) for c in mid)
 
-def display_contours(frame: np.ndarray, color_contours: dict[str, list[np.ndarray]], color_masks: dict[str, np.ndarray]):
+# Drawing color of every color's contours
+CONTOUR_COLORS = {color_name: mid_bgr(values) for color_name, values in COLORS.items()}
+
+def display_contours(frame: np.ndarray, color_contours: dict[str, list[np.ndarray]], cup_index: int = None, mode: str = "disk"):
 	"""
-	Displays contours of each color found in the given frame.
-	
+	Shows contours of each color found in the given frame on the debug stream, without blocking.
+
 	Parameters:
-	  frame (np.ndarray): The frame to display contours in.
+	  frame (np.ndarray): The flipped frame the contours were found in.
 	  color_contours (dict[str, list[numpy.ndarray]]): A dictionary mapping color names to lists of contours of that color.
-	  color_masks (dict[str, numpy.ndarray]): A dictionary mapping color names to the masks of that color.
-	
+	  cup_index (int): The chosen cup, if known.
+	  mode (str): Where the stream goes if it is not running yet, "disk" or "http".
+
 	Returns:
 	  None
 	"""
-	output = frame.copy()
+	debug_stream.shared_stream(mode).publish(frame, color_contours, CONTOUR_COLORS, cup_index)
 
-	cv2.namedWindow("Detected Colors")
-	cv2.setMouseCallback("Detected Colors", show_hsv)
+def detect_contours(frame: np.ndarray = None, roi: tuple[float, float, float, float] = DETECTION_ROI,
+					coarse_scale: float = COARSE_SCALE):
+	"""
+	Detects contours of predefined colors in a frame.
 
-	for color_name, contours in color_contours.items():
-		if contours:
-			# Calculate middle HSV color
-			mid_hue = (COLORS[color_name]["lower_hue"] + COLORS[color_name]["upper_hue"]) // 2
-			mid_saturation = (COLORS[color_name]["lower_saturation"] + COLORS[color_name]["upper_saturation"]) // 2
-			mid_value = (COLORS[color_name]["lower_value"] + COLORS[color_name]["upper_value"]) // 2
+	Parameters:
+	  frame (np.ndarray): The unflipped camera frame to search. If None, the newest frame of the
+			running camera service is used, or the webcam is opened for a single frame.
+	  roi (tuple): Region of the flipped frame to search, see DETECTION_ROI.
+	  coarse_scale (float): Scale of the coarse pass, see COARSE_SCALE.
 
-			# Convert mid HSV to BGR for display
-			mid_bgr = cv2.cvtColor(np.uint8([[[mid_hue, mid_saturation, mid_value]]]), cv2.COLOR_HSV2BGR)[0][0]
-			mid_bgr = tuple(int(c) for c in mid_bgr)
+	Returns:
+	  tuple: A tuple containing the frame, a dictionary mapping color names to masks, and a dictionary mapping color names to lists of contours.
+	"""
+	if frame is None and camera.active_camera():
+		frame = camera.active_camera().latest()
+	if frame is None:
+		# Start webcam
+		cap = cv2.VideoCapture(CAM_INDEX)
+		if not cap.isOpened():
+			print("Error: Could not access the camera.")
+			return
+
+		ret, frame = cap.read()
+		if not ret:
+			print("Error: Could not read frame.")
+
+		# Release webcam
+		cap.release()
 
-			# Draw contours
-			cv2.drawContours(output, contours, -1, mid_bgr, 2)
+	# Flip frame, as cam is upside down
+	frame = cv2.flip(frame, -1)
 
-	cv2.imshow("Detected Colors", output)
-	cv2.waitKey(0)
-	cv2.destroyAllWindows()
+	color_masks, color_contours = segment_roi(frame, roi, coarse_scale)
 
-def detect_contours():
-	"""
-	Starts the webcam, reads a frame, and detects contours of predefined colors in the frame.
+	return frame, color_masks, color_contours
 
-	Returns:
-	  tuple: A tuple containing the frame, a dictionary mapping color names to masks, and a dictionary mapping color names to lists of contours.
+def roi_bounds(shape: tuple, roi: tuple[float, float, float, float]) -> tuple[int, int, int, int]:
+	"""Converts a fractional ROI to pixel bounds (x0, y0, x1, y1) of a frame with the given shape."""
+	height, width = shape[:2]
+	left, top, right, bottom = roi
+	return int(left * width), int(top * height), int(right * width), int(bottom * height)
+
+def offset_contours(contours: list[np.ndarray], dx: int, dy: int) -> list[np.ndarray]:
+	"""Moves contours found in a crop back into the coordinates of the frame."""
+	if not dx and not dy:
+		return contours
+	return [cnt + np.array([[dx, dy]], dtype=cnt.dtype) for cnt in contours]
+
+def merge_boxes(boxes: list[tuple[int, int, int, int]]) -> list[tuple[int, int, int, int]]:
+	"""Merges overlapping (x0, y0, x1, y1) boxes, so no region is refined twice."""
+	merged = []
+	for box in sorted(boxes):
+		for i, other in enumerate(merged):
+			if box[0] <= other[2] and other[0] <= box[2] and box[1] <= other[3] and other[1] <= box[3]:
+				merged[i] = (min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3]))
+				break
+		else:
+			merged.append(box)
+	return merged
+
+def segment_roi(frame: np.ndarray, roi: tuple[float, float, float, float] = DETECTION_ROI,
+				coarse_scale: float = COARSE_SCALE) -> tuple[dict[str, np.ndarray], dict[str, list[np.ndarray]]]:
 	"""
-	# Start webcam
-	cap = cv2.VideoCapture(CAM_INDEX)
-	if not cap.isOpened():
-		print("Error: Could not access the camera.")
-		return
+	Segments only the region of interest of a flipped BGR frame.
 
-	ret, frame = cap.read()
-	if not ret:
-		print("Error: Could not read frame.")
+	With a coarse scale below 1 the ROI is downscaled and segmented first. Every color is then
+	segmented again at full resolution, but only inside the boxes it was found in, so HSV
+	conversion, morphology and findContours scale with the cups instead of the frame.
 
-	# Release webcam
-	cap.release()
+	Parameters:
+	  frame (np.ndarray): The flipped camera frame.
+	  roi (tuple): Region to search, as fractions (left, top, right, bottom) of the frame.
+	  coarse_scale (float): Scale of the first pass, 1.0 segments the ROI at full resolution directly.
 
-	# Flip frame, as cam is upside down
-	frame = cv2.flip(frame, -1)
-	global hsv
-	hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+	Returns:
+	  tuple: Full frame masks (zero outside the searched regions) and contours in frame coordinates, per color.
+	"""
+	x0, y0, x1, y1 = roi_bounds(frame.shape, roi)
+	crop = frame[y0:y1, x0:x1]
+	masks = {name: np.zeros(frame.shape[:2], np.uint8) for name in COLORS}
+
+	if coarse_scale >= 1:
+		crop_masks, crop_contours = SEGMENTER.segment(cv2.cvtColor(crop, cv2.COLOR_BGR2HSV))
+		for name, mask in crop_masks.items():
+			masks[name][y0:y1, x0:x1] = mask
+		return masks, {name: offset_contours(found, x0, y0) for name, found in crop_contours.items()}
+
+	small = cv2.resize(crop, None, fx=coarse_scale, fy=coarse_scale, interpolation=cv2.INTER_AREA)
+	_, coarse_contours = COARSE_SEGMENTER.segment(cv2.cvtColor(small, cv2.COLOR_BGR2HSV))
+
+	contours = {name: [] for name in COLORS}
+	for name, found in coarse_contours.items():
+		boxes = []
+		for cnt in found:
+			x, y, w, h = cv2.boundingRect(cnt)
+			# Back to frame coordinates, grown by the margin and clipped to the ROI
+			boxes.append((max(x0, x0 + int(x / coarse_scale) - REFINE_MARGIN),
+						  max(y0, y0 + int(y / coarse_scale) - REFINE_MARGIN),
+						  min(x1, x0 + int((x + w) / coarse_scale) + REFINE_MARGIN),
+						  min(y1, y0 + int((y + h) / coarse_scale) + REFINE_MARGIN)))
+		for bx0, by0, bx1, by1 in merge_boxes(boxes):
+			hsv = cv2.cvtColor(frame[by0:by1, bx0:bx1], cv2.COLOR_BGR2HSV)
+			box_masks, box_contours = SEGMENTER.segment(hsv, only=[name])
+			masks[name][by0:by1, bx0:bx1] |= box_masks[name]
+			contours[name].extend(offset_contours(box_contours[name], bx0, by0))
+	return masks, contours
+
+def segment_loop(hsv: np.ndarray) -> tuple[dict[str, np.ndarray], dict[str, list[np.ndarray]]]:
+	"""
+	Reference segmentation, which runs inRange and morphology over the full frame for each color.
+	Kept to benchmark and validate the LUT engine against (see segmentation.py).
+
+	Parameters:
+	  hsv (np.ndarray): The frame in HSV.
 
+	Returns:
+	  tuple: A dictionary mapping color names to masks, and a dictionary mapping color names to lists of contours.
+	"""
 	# Store found contours for each color
 	color_masks = {}
 	color_contours = {}
@@ -211,7 +322,7 @@ def detect_contours():
 		color_masks[color_name] = mask
 		color_contours[color_name] = contours
 
-	return frame, color_masks, color_contours
+	return color_masks, color_contours
 
 def find_cups(frame: np.ndarray, masks: dict[str, cv2.typing.MatLike], contours: dict[str, list[cv2.typing.MatLike]]) -> list:	
 	"""
@@ -263,6 +374,56 @@ def find_cups(frame: np.ndarray, masks: dict[str, cv2.typing.MatLike], contours:
 
 	return correct_cup, [(color, box) for cnt, color, box in sorted_contours]
 
+def vote_cup(cam: camera.CameraService, deadline: float = VOTE_DEADLINE, confidence: float = VOTE_CONFIDENCE,
+			 min_votes: int = VOTE_MIN_VOTES) -> tuple[int, float, int]:
+	"""
+	Runs detect_contours and find_cups on every new frame of a running camera and keeps a vote
+	over the cup indices, instead of trusting a single frame.
+
+	Parameters:
+	  cam (camera.CameraService): The running camera to take frames from.
+	  deadline (float): Seconds after which the leading index is returned.
+	  confidence (float): Share of the votes at which the leading index is returned early.
+	  min_votes (int): Votes needed before returning early.
+
+	Returns:
+	  tuple: The chosen cup index (None if no frame gave a result), its share of the votes and the number of frames looked at.
+	"""
+	end = time.monotonic() + deadline
+	votes = collections.Counter()
+	sequence = 0
+	frames = 0
+	while True:
+		remaining = end - time.monotonic()
+		if remaining <= 0:
+			break
+		entry = cam.wait_for_frame(sequence, remaining)
+		if entry is None:
+			break
+		sequence, _, frame = entry
+		frames += 1
+		try:
+			frame, masks, contours = detect_contours(frame)
+			result = find_cups(frame, masks, contours)
+		except Exception as e:
+			print(f"Frame {sequence} skipped: {e}")
+			continue
+		stream = debug_stream.active_stream()
+		if stream:
+			stream.publish(frame, contours, CONTOUR_COLORS, None if result is None else result[0])
+		if result is None:
+			continue
+		votes[result[0]] += 1
+
+		index, count = votes.most_common(1)[0]
+		if count >= min_votes and count / sum(votes.values()) >= confidence:
+			return index, count / sum(votes.values()), frames
+
+	if not votes:
+		return None, 0.0, frames
+	index, count = votes.most_common(1)[0]
+	return index, count / sum(votes.values()), frames
+
 def main():
 	frame, masks, contours = detect_contours()
 
@@ -271,5 +432,11 @@ def main():
 	print("Index:", correct_cup)
 	pprint(sorted_contours)
 
+	if DEBUG_STREAM:
+		display_contours(frame, contours, correct_cup, DEBUG_STREAM)
+		# Give the worker time to write or serve the frame
+		time.sleep(1)
+		debug_stream.active_stream().stop()
+
 if __name__ == "__main__":
 	main()
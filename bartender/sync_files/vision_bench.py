@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+import sys, os, glob, time, tracemalloc, collections
+import cv2, numpy as np
+try:
+	import resource
+except ImportError:
+	# Missing on Windows, max RSS is not reported there
+	resource = None
+import segmentation
+import utils
+
+# CONSTANTS
+
+# Calls timed as pipeline stages, find_cups is timed as "sort"
+STAGES = {
+	"cvtColor": (cv2, "cvtColor"),
+	"resize": (cv2, "resize"),
+	"inRange": (cv2, "inRange"),
+	"morphology": (cv2, "morphologyEx"),
+	"findContours": (cv2, "findContours"),
+	"label": (segmentation.LutSegmenter, "label"),
+}
+IMAGE_TYPES = (".png", ".jpg", ".jpeg", ".bmp")
+
+def segment_full_loop(frame: np.ndarray):
+	frame = cv2.flip(frame, -1)
+	masks, contours = utils.segment_loop(cv2.cvtColor(frame, cv2.COLOR_BGR2HSV))
+	return frame, masks, contours
+
+# Detection engines to compare, each takes an unflipped frame and returns (frame, masks, contours)
+ENGINES = {
+	"loop": segment_full_loop,
+	"lut": lambda frame: utils.detect_contours(frame, roi=(0.0, 0.0, 1.0, 1.0), coarse_scale=1.0),
+	"roi": utils.detect_contours,
+}
+
+class StageTimer:
+	"""
+	Adds up the time spent in every stage while active, by wrapping the functions in STAGES.
+	No stage calls another one, so the stage times do not overlap.
+	"""
+	def __init__(self):
+		self.times = collections.defaultdict(float)
+		self.originals = {}
+
+	def _wrap(self, name: str, function):
+		times = self.times
+		def timed(*args, **kwargs):
+			start = time.perf_counter()
+			try:
+				return function(*args, **kwargs)
+			finally:
+				times[name] += time.perf_counter() - start
+		return timed
+
+	def __enter__(self) -> "StageTimer":
+		for name, (owner, attribute) in STAGES.items():
+			original = getattr(owner, attribute)
+			self.originals[name] = original
+			setattr(owner, attribute, self._wrap(name, original))
+		return self
+
+	def __exit__(self, *exc):
+		for name, (owner, attribute) in STAGES.items():
+			setattr(owner, attribute, self.originals[name])
+
+	def take(self) -> dict[str, float]:
+		"""Returns the stage times since the last call and starts over."""
+		times = dict(self.times)
+		self.times.clear()
+		return times
+
+def load_corpus(directory: str) -> list[tuple[str, int, np.ndarray]]:
+	"""
+	Load recorded frames with their known cup index.
+
+	Parameters:
+	  directory (str): Holds one subdirectory per cup index (0/, 1/, 2/, ...) with the unflipped camera frames.
+
+	Returns:
+	  list[tuple[str, int, np.ndarray]]: Path, expected cup index and frame of every image.
+	"""
+	corpus = []
+	for sub in sorted(os.listdir(directory)):
+		if not sub.isdigit() or not os.path.isdir(os.path.join(directory, sub)):
+			continue
+		for path in sorted(glob.glob(os.path.join(directory, sub, "*"))):
+			if path.lower().endswith(IMAGE_TYPES):
+				corpus.append((path, int(sub), cv2.imread(path)))
+	return corpus
+
+def run_engine(engine, corpus: list, repeat: int) -> dict:
+	"""
+	Time one engine over the corpus and check its cup indices.
+
+	Returns:
+	  dict: Per-stage and total latencies in ms, wrong frames, peak traced memory and max RSS.
+	"""
+	stages = collections.defaultdict(list)
+	totals = []
+	wrong = []
+	with StageTimer() as timer:
+		for path, expected, frame in corpus:
+			for i in range(repeat):
+				timer.take()
+				start = time.perf_counter()
+				detected = engine(frame)
+				sort_start = time.perf_counter()
+				result = utils.find_cups(*detected)
+				end = time.perf_counter()
+				totals.append((end - start) * 1000)
+				stages["sort"].append((end - sort_start) * 1000)
+				for name, seconds in timer.take().items():
+					stages[name].append(seconds * 1000)
+			if result is None or result[0] != expected:
+				wrong.append((path, expected, None if result is None else result[0]))
+
+	# Separate pass, tracing slows everything down
+	tracemalloc.start()
+	for _, _, frame in corpus:
+		utils.find_cups(*engine(frame))
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return {"stages": stages, "totals": totals, "wrong": wrong, "peak": peak,
+			"rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None}
+
+def report(name: str, result: dict, frames: int):
+	totals = np.array(result["totals"])
+	rss = f", max RSS {result['rss'] / 1024:.0f} MB" if result["rss"] else ""
+	print(f"== {name}: {frames - len(result['wrong'])}/{frames} correct, {1000 / totals.mean():.1f} frames/s, "
+		  f"peak {result['peak'] / 1e6:.1f} MB traced{rss}")
+	print(f"   {'stage':<13}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms per frame)")
+	for stage, times in list(result["stages"].items()) + [("total", totals)]:
+		p50, p95, p99 = np.percentile(times, [50, 95, 99])
+		print(f"   {stage:<13}{p50:>9.2f}{p95:>9.2f}{p99:>9.2f}{np.max(times):>9.2f}")
+	for path, expected, got in result["wrong"]:
+		print(f"   wrong: {path} expected {expected}, got {got}")
+
+def benchmark(directory: str, engines: list[str] = None, repeat: int = 5) -> bool:
+	"""
+	Runs every engine over a recorded corpus and prints latency percentiles, throughput, memory and accuracy.
+
+	Returns:
+	  bool: True if every engine found the expected cup in every frame.
+	"""
+	corpus = load_corpus(directory)
+	if not corpus:
+		print(f"No frames found in {directory}, expected subdirectories named after the cup index.")
+		return False
+	print(f"{len(corpus)} frames, {repeat} runs each")
+	passed = True
+	for name in engines or ENGINES:
+		result = run_engine(ENGINES[name], corpus, repeat)
+		report(name, result, len(corpus))
+		passed = passed and not result["wrong"]
+	return passed
+
+if __name__ == "__main__":
+	if len(sys.argv) < 2:
+		print(f"Usage: vision_bench.py <corpus directory> [engine ...] (engines: {', '.join(ENGINES)})")
+		sys.exit(1)
+	sys.exit(0 if benchmark(sys.argv[1], sys.argv[2:] or None) else 1)
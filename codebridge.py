@@ -0,0 +1,884 @@
+import ctypes
+import ctypes.util
+import fnmatch
+import gzip
+import hashlib
+import io
+import json
+import os
+import posixpath
+import select
+import shlex
+import socket
+import struct
+import sys
+import tarfile
+import threading
+import time
+
+import paramiko
+
+# CONSTANTS
+
+# Block size used for the rolling checksum delta transfer
+BLOCK_SIZE = 1024
+# Modulus of the two rolling checksum halves (rsync style)
+CHECKSUM_MOD = 1 << 16
+# Exit code of the remote patch script when the robot's file is not the expected base
+BASE_MISMATCH = 3
+
+# Files larger than this are sent in compressed batches instead of as deltas
+BATCH_THRESHOLD = 64 * 1024
+# gzip level of batch transfers (1 fastest, 9 smallest)
+COMPRESSION_LEVEL = 6
+
+# Seconds a stopped script gets for each of SIGINT and SIGTERM before it is killed
+STOP_GRACE = 0.5
+
+# Seconds of silence after a file event before a save burst is considered finished
+DEBOUNCE = 0.02
+# Interval of the stat based fallback watcher
+POLL_INTERVAL = 0.05
+
+# inotify event flags (see inotify(7))
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+
+# Runs on the robot: prints the block signatures of a file as JSON
+SIGNATURE_CODE = """
+import hashlib, json, os, sys
+path, block_size = sys.argv[1], int(sys.argv[2])
+if not os.path.isfile(path):
+    print(json.dumps({"sha": None, "blocks": []}))
+    sys.exit(0)
+data = open(path, "rb").read()
+blocks = []
+for start in range(0, len(data), block_size):
+    block = data[start:start + block_size]
+    a = sum(block) % 65536
+    b = sum((len(block) - i) * c for i, c in enumerate(block)) % 65536
+    blocks.append([a | (b << 16), hashlib.md5(block).hexdigest()])
+print(json.dumps({"sha": hashlib.sha256(data).hexdigest(), "blocks": blocks}))
+"""
+
+# Runs on the robot: rebuilds a file from its base and a delta read from stdin, then renames it into place
+PATCH_CODE = """
+import hashlib, json, os, struct, sys
+stream = sys.stdin.buffer
+header = json.loads(stream.readline())
+path, block_size = header["path"], header["block_size"]
+base = b""
+if header["base"] is not None:
+    base = open(path, "rb").read() if os.path.isfile(path) else b""
+    if hashlib.sha256(base).hexdigest() != header["base"]:
+        print("base-mismatch")
+        sys.exit(3)
+out = bytearray()
+while True:
+    op = stream.read(1)
+    if not op:
+        break
+    value = struct.unpack(">I", stream.read(4))[0]
+    if op == b"C":
+        out += base[value * block_size:(value + 1) * block_size]
+    else:
+        out += stream.read(value)
+if hashlib.sha256(out).hexdigest() != header["target"]:
+    print("target-mismatch")
+    sys.exit(4)
+directory = os.path.dirname(path)
+if directory:
+    os.makedirs(directory, exist_ok=True)
+tmp_path = path + ".codebridge.tmp"
+with open(tmp_path, "wb") as file:
+    file.write(out)
+    file.flush()
+    os.fsync(file.fileno())
+os.replace(tmp_path, path)
+print("ok")
+"""
+
+# Runs on the robot: unpacks a tar stream read from stdin and renames all files into place once every one was written
+UNPACK_CODE = """
+import json, os, sys, tarfile
+stream = sys.stdin.buffer
+header = json.loads(stream.readline())
+written = []
+try:
+    with tarfile.open(fileobj=stream, mode="r|" + header["compression"]) as archive:
+        for member in archive:
+            path = header["paths"][int(member.name)]
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = path + ".codebridge.tmp"
+            written.append((tmp_path, path))
+            with open(tmp_path, "wb") as file:
+                file.write(archive.extractfile(member).read())
+                file.flush()
+                os.fsync(file.fileno())
+    if len(written) != len(header["paths"]):
+        raise ValueError("archive is incomplete")
+except Exception as e:
+    for tmp_path, path in written:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    print(e)
+    sys.exit(1)
+for tmp_path, path in written:
+    os.replace(tmp_path, path)
+print("ok")
+"""
+
+
+# Runs on the robot: runs a script, prefixes its output with robot-side timestamps and stops it once stdin is closed
+RUN_CODE = """
+import os, signal, subprocess, sys, threading, time
+script, pid_file, grace = sys.argv[1], sys.argv[2], float(sys.argv[3])
+start = time.monotonic()
+process = subprocess.Popen([sys.executable, "-u", script], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                           start_new_session=True)
+with open(pid_file, "w") as file:
+    file.write(str(process.pid))
+lock = threading.Lock()
+def forward(pipe, tag):
+    for line in pipe:
+        try:
+            with lock:
+                sys.stdout.buffer.write(b"[%.3fs]%s " % (time.monotonic() - start, tag) + line)
+                sys.stdout.buffer.flush()
+        except OSError:
+            pass
+def stop():
+    sys.stdin.buffer.read()
+    for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, sig)
+            process.wait(grace)
+            break
+        except (ProcessLookupError, subprocess.TimeoutExpired):
+            if process.poll() is not None:
+                break
+threading.Thread(target=stop, daemon=True).start()
+forwarders = [threading.Thread(target=forward, args=(process.stdout, b"")),
+              threading.Thread(target=forward, args=(process.stderr, b" ERR"))]
+for forwarder in forwarders:
+    forwarder.start()
+code = process.wait()
+for forwarder in forwarders:
+    forwarder.join(1)
+try:
+    # Never leave motors running after the script ended or was stopped
+    sys.path.append("/usr/lib")
+    import kipr as k
+    k.ao()
+    k.disable_servos()
+except Exception:
+    pass
+os.remove(pid_file)
+try:
+    print("[%.3fs] exited with %d" % (time.monotonic() - start, code), flush=True)
+except OSError:
+    pass
+"""
+
+def weak_checksum(block: bytes) -> tuple[int, int]:
+    """
+    Compute the two halves of the rsync style rolling checksum of a block.
+
+    Parameters:
+      block (bytes): The block to checksum.
+
+    Returns:
+      tuple[int, int]: The halves (a, b), which can be rolled forward byte by byte.
+    """
+    a = sum(block) % CHECKSUM_MOD
+    b = sum((len(block) - i) * c for i, c in enumerate(block)) % CHECKSUM_MOD
+    return a, b
+
+
+def strong_checksum(block: bytes) -> str:
+    return hashlib.md5(block).hexdigest()
+
+
+def block_signatures(data: bytes, block_size: int = BLOCK_SIZE) -> list[tuple[int, str]]:
+    """
+    Compute the signature (weak and strong checksum) of every block of data.
+    Produces the same result as SIGNATURE_CODE does on the robot.
+
+    Parameters:
+      data (bytes): The content to sign.
+      block_size (int): The size of the blocks.
+
+    Returns:
+      list[tuple[int, str]]: One (weak, strong) pair per block.
+    """
+    signatures = []
+    for start in range(0, len(data), block_size):
+        block = data[start:start + block_size]
+        a, b = weak_checksum(block)
+        signatures.append((a | (b << 16), strong_checksum(block)))
+    return signatures
+
+
+def compute_delta(data: bytes, signatures: list[tuple[int, str]], block_size: int = BLOCK_SIZE) -> list:
+    """
+    Describe data as a sequence of blocks the robot already has and literal bytes.
+
+    A window of block_size bytes is rolled over data one byte at a time. Wherever its weak
+    checksum and then its strong checksum match a block of the base, the block is referenced
+    instead of being sent.
+
+    Parameters:
+      data (bytes): The new content.
+      signatures (list[tuple[int, str]]): Block signatures of the base content on the robot.
+      block_size (int): The size of the blocks the signatures were computed with.
+
+    Returns:
+      list: Operations, where an int is the index of a base block to copy and bytes are literal data.
+    """
+    lookup = {}
+    for index, (weak, strong) in enumerate(signatures):
+        lookup.setdefault(weak, []).append((index, strong))
+
+    ops = []
+    literal = bytearray()
+    end = len(data)
+    pos = 0
+    length = 0
+    a = b = None
+    while pos < end:
+        if a is None:
+            length = min(block_size, end - pos)
+            a, b = weak_checksum(data[pos:pos + length])
+
+        match = None
+        candidates = lookup.get(a | (b << 16))
+        if candidates:
+            strong = strong_checksum(data[pos:pos + length])
+            for index, candidate in candidates:
+                if candidate == strong:
+                    match = index
+                    break
+
+        if match is not None:
+            if literal:
+                ops.append(bytes(literal))
+                literal.clear()
+            ops.append(match)
+            pos += length
+            a = None
+            continue
+
+        # Roll the window one byte forward (it shrinks once it reaches the end of data)
+        out = data[pos]
+        literal.append(out)
+        if pos + length < end:
+            a = (a - out + data[pos + length]) % CHECKSUM_MOD
+            b = (b - length * out + a) % CHECKSUM_MOD
+        else:
+            a = (a - out) % CHECKSUM_MOD
+            b = (b - length * out) % CHECKSUM_MOD
+            length -= 1
+        pos += 1
+
+    if literal:
+        ops.append(bytes(literal))
+    return ops
+
+
+def encode_delta(ops: list) -> bytes:
+    encoded = bytearray()
+    for op in ops:
+        if isinstance(op, int):
+            encoded += b"C" + struct.pack(">I", op)
+        else:
+            encoded += b"D" + struct.pack(">I", len(op)) + op
+    return bytes(encoded)
+
+
+class RemoteSession:
+    """
+    Keeps one SSH connection to a robot open and re-establishes it with exponential backoff
+    when the link drops, so every upload only costs a channel open instead of a full handshake.
+    """
+
+    def __init__(self, hostname: str, username: str, password: str, port: int = 22,
+                 keepalive: int = 5, max_backoff: float = 8.0, log=print):
+        self.hostname = hostname
+        self.username = username
+        self.password = password
+        self.port = port
+        self.keepalive = keepalive
+        self.max_backoff = max_backoff
+        self.log = log
+        self.client = None
+        # Reentrant, connect() closes a dead connection while holding it
+        self.lock = threading.RLock()
+
+    @property
+    def connected(self) -> bool:
+        client = self.client
+        if client is None:
+            return False
+        transport = client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def connect(self) -> None:
+        """Connect to the robot, retrying with exponential backoff until it succeeds."""
+        with self.lock:
+            delay = 0.25
+            while not self.connected:
+                self.close()
+                client = paramiko.SSHClient()
+                client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+                try:
+                    client.connect(self.hostname, port=self.port, username=self.username, password=self.password,
+                                   timeout=5, allow_agent=False, look_for_keys=False)
+                    transport = client.get_transport()
+                    transport.set_keepalive(self.keepalive)
+                    transport.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    self.client = client
+                    self.log(f"Connected to {self.username}@{self.hostname}")
+                except (paramiko.SSHException, OSError) as e:
+                    client.close()
+                    self.log(f"Connection to {self.hostname} failed ({e}), retrying in {delay:.2f} s")
+                    time.sleep(delay)
+                    delay = min(delay * 2, self.max_backoff)
+
+    def exec(self, command: str, stdin_data: bytes = None, timeout: float = 10) -> tuple[int, bytes, bytes]:
+        """
+        Run a command on the robot over a new channel of the open connection.
+
+        Parameters:
+          command (str): The shell command to run.
+          stdin_data (bytes): Data written to the command's stdin before closing it.
+          timeout (float): Seconds to wait for the command before giving up.
+
+        Returns:
+          tuple[int, bytes, bytes]: The exit status, stdout and stderr of the command.
+        """
+        channel = self.transport().open_session()
+        try:
+            channel.settimeout(timeout)
+            channel.exec_command(command)
+            if stdin_data is not None:
+                channel.sendall(stdin_data)
+            channel.shutdown_write()
+            stdout = channel.makefile("rb").read()
+            stderr = channel.makefile_stderr("rb").read()
+            return channel.recv_exit_status(), stdout, stderr
+        finally:
+            channel.close()
+
+    def start(self, command: str):
+        """Run a command on the robot without waiting for it, returns its channel."""
+        channel = self.transport().open_session()
+        channel.exec_command(command)
+        return channel
+
+    def transport(self) -> paramiko.Transport:
+        """Returns the transport of the open connection, connecting first if needed."""
+        self.connect()
+        with self.lock:
+            client = self.client
+            transport = client.get_transport() if client is not None else None
+        if transport is None or not transport.is_active():
+            # Closed by another thread meanwhile, callers reconnect on this like on any lost connection
+            raise paramiko.SSHException(f"Connection to {self.hostname} lost")
+        return transport
+
+    def close(self) -> None:
+        with self.lock:
+            client, self.client = self.client, None
+        if client is not None:
+            client.close()
+
+
+class DeltaUploader:
+    """
+    Uploads files to the robot by sending only the blocks that changed since the last upload.
+
+    The block signatures of what is on the robot are remembered after every upload, so the
+    usual save only needs a single round trip. If the robot's file was changed behind our back,
+    the signatures are fetched again from the robot.
+    """
+
+    def __init__(self, session: RemoteSession, block_size: int = BLOCK_SIZE):
+        self.session = session
+        self.block_size = block_size
+        self.remote_state = {}
+
+    def fetch_signatures(self, remote_path: str) -> tuple[str, list[tuple[int, str]]]:
+        command = f"python3 -c {shlex.quote(SIGNATURE_CODE)} {shlex.quote(remote_path)} {self.block_size}"
+        status, stdout, stderr = self.session.exec(command)
+        if status != 0:
+            raise RuntimeError(f"Could not read signatures of {remote_path}: {stderr.decode(errors='replace')}")
+        result = json.loads(stdout)
+        return result["sha"], [tuple(block) for block in result["blocks"]]
+
+    def remember(self, remote_path: str, data: bytes) -> None:
+        """Record that remote_path now has the given content, e.g. after it was sent by a BatchUploader."""
+        if len(data) > BATCH_THRESHOLD:
+            # Signing large files locally is slow, they are fetched from the robot if ever needed
+            self.remote_state.pop(remote_path, None)
+        else:
+            self.remote_state[remote_path] = (hashlib.sha256(data).hexdigest(), block_signatures(data, self.block_size))
+
+    def upload(self, data: bytes, remote_path: str) -> dict:
+        """
+        Bring remote_path on the robot to the given content and atomically rename it into place.
+
+        Parameters:
+          data (bytes): The new content of the file.
+          remote_path (str): The path of the file on the robot.
+
+        Returns:
+          dict: Statistics of the upload (size, sent bytes, reused blocks and elapsed seconds).
+        """
+        start = time.perf_counter()
+        for attempt in range(2):
+            if remote_path not in self.remote_state:
+                self.remote_state[remote_path] = self.fetch_signatures(remote_path)
+            base_sha, signatures = self.remote_state[remote_path]
+
+            ops = compute_delta(data, signatures, self.block_size) if base_sha else [data]
+            header = {
+                "path": remote_path,
+                "base": base_sha,
+                "target": hashlib.sha256(data).hexdigest(),
+                "block_size": self.block_size,
+            }
+            payload = json.dumps(header).encode() + b"\n" + encode_delta(ops)
+
+            status, stdout, stderr = self.session.exec(f"python3 -c {shlex.quote(PATCH_CODE)}", payload)
+            if status == BASE_MISMATCH and attempt == 0:
+                # File on the robot changed since our last upload, start from its real content
+                del self.remote_state[remote_path]
+                continue
+            if status != 0:
+                self.remote_state.pop(remote_path, None)
+                raise RuntimeError(f"Upload of {remote_path} failed: {(stdout + stderr).decode(errors='replace').strip()}")
+            break
+
+        self.remember(remote_path, data)
+        return {
+            "size": len(data),
+            "sent": len(payload),
+            "reused_blocks": sum(1 for op in ops if isinstance(op, int)),
+            "elapsed": time.perf_counter() - start,
+        }
+
+
+class BatchUploader:
+    """
+    Uploads many files at once as a single compressed tar stream over one channel. This suits
+    large or binary files (calibration images, recorded frames), where deltas gain little.
+    """
+
+    def __init__(self, session: RemoteSession, compression: str = "gz", level: int = COMPRESSION_LEVEL):
+        """
+        Parameters:
+          session (RemoteSession): The connection to the robot.
+          compression (str): "gz" to gzip the stream, "" to send it uncompressed.
+          level (int): The gzip compression level.
+        """
+        self.session = session
+        self.compression = compression
+        self.level = level
+
+    def pack(self, files: dict[str, bytes]) -> bytes:
+        """
+        Pack files into a tar stream, member names are indices into the header's list of paths.
+
+        Parameters:
+          files (dict[str, bytes]): Content of the files, by their path on the robot.
+
+        Returns:
+          bytes: The header line followed by the (compressed) tar stream.
+        """
+        header = {"paths": list(files), "compression": self.compression}
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w") as archive:
+            for index, data in enumerate(files.values()):
+                info = tarfile.TarInfo(str(index))
+                info.size = len(data)
+                info.mtime = int(time.time())
+                archive.addfile(info, io.BytesIO(data))
+        stream = buffer.getvalue()
+        if self.compression == "gz":
+            stream = gzip.compress(stream, self.level, mtime=0)
+        return json.dumps(header).encode() + b"\n" + stream
+
+    def upload(self, files: dict[str, bytes]) -> dict:
+        """
+        Upload files and atomically rename them into place on the robot once all of them arrived.
+
+        Parameters:
+          files (dict[str, bytes]): Content of the files, by their path on the robot.
+
+        Returns:
+          dict: Statistics of the upload (size, sent and saved bytes, throughput and elapsed seconds).
+        """
+        start = time.perf_counter()
+        payload = self.pack(files)
+        status, stdout, stderr = self.session.exec(f"python3 -c {shlex.quote(UNPACK_CODE)}", payload, timeout=60)
+        if status != 0:
+            raise RuntimeError(f"Batch upload failed: {(stdout + stderr).decode(errors='replace').strip()}")
+
+        elapsed = time.perf_counter() - start
+        size = sum(len(data) for data in files.values())
+        return {
+            "files": len(files),
+            "size": size,
+            "sent": len(payload),
+            "saved": size - len(payload),
+            "throughput": size / elapsed,
+            "elapsed": elapsed,
+        }
+
+
+class RemoteRunner:
+    """
+    Restarts a script on the robot through the open session and streams its output back, each
+    line prefixed with the seconds since the script started as measured on the robot.
+
+    The script is stopped by closing the stdin of its channel: the robot then sends SIGINT,
+    SIGTERM and SIGKILL to its process group (each after STOP_GRACE seconds) and turns off all
+    motors and servos.
+    """
+
+    def __init__(self, session: RemoteSession, script: str, directory: str, name: str = None, log=print):
+        self.session = session
+        self.script = script
+        self.directory = directory
+        self.name = name or session.hostname
+        self.log = log
+        self.pid_file = f"/tmp/codebridge-{posixpath.basename(script)}.pid"
+        self.channel = None
+        self.reader = None
+
+    def _stream(self, channel) -> None:
+        for line in channel.makefile("rb"):
+            self.log(f"[{self.name}] {line.decode(errors='replace').rstrip()}")
+
+    def stop(self) -> None:
+        if self.channel is not None:
+            try:
+                self.channel.shutdown_write()
+                self.reader.join(STOP_GRACE * 3 + 1)
+            except (paramiko.SSHException, OSError):
+                pass
+            self.channel.close()
+            self.channel = None
+        # The run may have outlived a dropped connection, in which case it is killed by its pid
+        pid_file = shlex.quote(self.pid_file)
+        self.session.exec(f"[ -f {pid_file} ] && kill -KILL -$(cat {pid_file}) 2>/dev/null; rm -f {pid_file}")
+
+    def restart(self) -> None:
+        """Stop the running script (if any) and start it again."""
+        self.stop()
+        command = (f"cd {shlex.quote(self.directory)} && python3 -u -c {shlex.quote(RUN_CODE)} "
+                   f"{shlex.quote(self.script)} {shlex.quote(self.pid_file)} {STOP_GRACE}")
+        self.channel = self.session.start(command)
+        self.reader = threading.Thread(target=self._stream, args=(self.channel,), daemon=True)
+        self.reader.start()
+        self.log(f"[{self.name}] Restarted {self.script}")
+
+
+class FileSet:
+    """
+    The files below a root directory that match one of the include globs and none of the exclude
+    globs. Globs are matched against the path relative to the root, using / as separator.
+    """
+
+    def __init__(self, root: str, include: list[str] = ("*",), exclude: list[str] = ()):
+        self.root = os.path.abspath(root)
+        self.include = list(include)
+        self.exclude = list(exclude)
+
+    def relative(self, path: str) -> str:
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def contains(self, path: str) -> bool:
+        relative = self.relative(path)
+        if relative.startswith("../"):
+            return False
+        return (any(fnmatch.fnmatch(relative, pattern) for pattern in self.include)
+                and not any(fnmatch.fnmatch(relative, pattern) for pattern in self.exclude))
+
+    def excludes_directory(self, path: str) -> bool:
+        relative = self.relative(path)
+        return relative != "." and any(fnmatch.fnmatch(relative + "/", pattern) or fnmatch.fnmatch(relative, pattern)
+                                       for pattern in self.exclude)
+
+    def directories(self, top: str = None) -> list[str]:
+        """The directories of the set below top (the root if None), skipping excluded ones."""
+        directories = []
+        for directory, subdirectories, _ in os.walk(top or self.root):
+            subdirectories[:] = [name for name in subdirectories
+                                 if not self.excludes_directory(os.path.join(directory, name))]
+            directories.append(directory)
+        return directories
+
+    def files(self, top: str = None) -> list[str]:
+        return [os.path.join(directory, name)
+                for directory in self.directories(top)
+                for name in os.listdir(directory)
+                if os.path.isfile(os.path.join(directory, name)) and self.contains(os.path.join(directory, name))]
+
+
+def matches_any(file_sets: list[FileSet], path: str) -> bool:
+    return any(file_set.contains(path) for file_set in file_sets)
+
+
+class PollingWatcher:
+    """Fallback watcher, which compares the mtime and size of the watched files at a fixed interval."""
+
+    def __init__(self, file_sets: list[FileSet], interval: float = POLL_INTERVAL):
+        self.file_sets = file_sets
+        self.interval = interval
+        self.stamps = self._scan()
+
+    def _scan(self) -> dict:
+        stamps = {}
+        for file_set in self.file_sets:
+            for path in file_set.files():
+                try:
+                    stat = os.stat(path)
+                    stamps[path] = (stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    pass
+        return stamps
+
+    def wait(self, timeout: float = None) -> set[str]:
+        """
+        Block until at least one watched file changed or the timeout passed.
+
+        Parameters:
+          timeout (float): Seconds to wait at most, None waits forever.
+
+        Returns:
+          set[str]: The paths of the files that changed or appeared, empty on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            stamps = self._scan()
+            changed = {path for path, stamp in stamps.items() if self.stamps.get(path) != stamp}
+            self.stamps = stamps
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return changed
+            time.sleep(self.interval if deadline is None else max(0, min(self.interval, deadline - time.monotonic())))
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """
+    Linux watcher, which sleeps in select() on an inotify descriptor and wakes up as soon as
+    the kernel reports a watched file was written or renamed into place.
+
+    Directories are watched rather than the files themselves, as many editors save by writing
+    a temporary file and renaming it over the original. New subdirectories are watched as they appear.
+    """
+
+    EVENT = struct.Struct("iIII")
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, file_sets: list[FileSet], log=print):
+        self.file_sets = file_sets
+        self.log = log
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        try:
+            for file_set in file_sets:
+                for directory in file_set.directories():
+                    self._add_watch(directory)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def _add_watch(self, directory: str) -> None:
+        wd = self.libc.inotify_add_watch(self.fd, directory.encode(), self.MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        self.directories[wd] = directory
+
+    def _new_directory(self, directory: str) -> set[str]:
+        """Watch a directory created below a root and report the files that were put into it meanwhile."""
+        changed = set()
+        for file_set in self.file_sets:
+            if file_set.relative(directory).startswith("../") or file_set.excludes_directory(directory):
+                continue
+            # With the tree's excludes, so e.g. a new __pycache__ below it is not watched
+            for subdirectory in file_set.directories(directory):
+                if subdirectory not in self.directories.values():
+                    try:
+                        self._add_watch(subdirectory)
+                    except OSError:
+                        pass
+            changed |= set(file_set.files(directory))
+        return changed
+
+    def _rescan(self) -> set[str]:
+        """
+        The kernel's event queue overflowed and events were lost: watch the directories created
+        meanwhile and report every file, ChangeDetector drops the unchanged ones by mtime and size.
+        """
+        self.log("inotify queue overflowed, rescanning all trees")
+        for file_set in self.file_sets:
+            for directory in file_set.directories():
+                if directory not in self.directories.values():
+                    try:
+                        self._add_watch(directory)
+                    except OSError:
+                        pass
+        return {path for file_set in self.file_sets for path in file_set.files()}
+
+    def wait(self, timeout: float = None) -> set[str]:
+        """
+        Block until at least one watched file changed or the timeout passed.
+
+        Parameters:
+          timeout (float): Seconds to wait at most, None waits forever.
+
+        Returns:
+          set[str]: The paths of the files that changed, empty on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        changed = set()
+        while not changed:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            readable, _, _ = select.select([self.fd], [], [], remaining)
+            if not readable:
+                break
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, cookie, length = self.EVENT.unpack_from(buffer, offset)
+                offset += self.EVENT.size
+                name = buffer[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+                offset += length
+                path = os.path.join(self.directories.get(wd, ""), name)
+                if mask & IN_Q_OVERFLOW:
+                    changed |= self._rescan()
+                elif mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        changed |= self._new_directory(path)
+                # Events of other files in the directory (e.g. the editor's temporary files) are ignored
+                elif matches_any(self.file_sets, path):
+                    changed.add(path)
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def create_watcher(file_sets: list[FileSet], log=print):
+    """Create an inotify watcher on Linux and fall back to polling where that is not available."""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(file_sets, log)
+        except (OSError, AttributeError) as e:
+            log(f"inotify unavailable ({e}), falling back to polling")
+    return PollingWatcher(file_sets)
+
+
+class ChangeDetector:
+    """
+    Decides whether a file really changed: the mtime and size are compared first and the file is
+    only read and hashed when they differ, so touching or re-saving a file does not cause an upload.
+    """
+
+    def __init__(self):
+        self.state = {}
+
+    def check(self, path: str, tries: int = 3) -> bytes:
+        """
+        Parameters:
+          path (str): The file to check.
+          tries (int): How often reading is attempted, as editors may hold the file while saving.
+
+        Returns:
+          bytes: The new content of the file, or None if it did not change or could not be read.
+        """
+        for i in range(tries):
+            try:
+                stat = os.stat(path)
+                stamp = (stat.st_mtime_ns, stat.st_size)
+                previous = self.state.get(path)
+                if previous is not None and previous[0] == stamp:
+                    return None
+                with open(path, "rb") as file:
+                    data = file.read()
+                break
+            except FileNotFoundError:
+                return None
+            except OSError:
+                time.sleep(0.01)
+        else:
+            return None
+
+        digest = hashlib.sha256(data).digest()
+        self.state[path] = (stamp, digest)
+        if previous is not None and previous[1] == digest:
+            return None
+        return data
+
+
+class ChangeWatcher:
+    """
+    Reports files whose content changed, starting with all of them. Events are collected until
+    the files were quiet for debounce seconds, so the burst of writes an editor does when saving
+    results in a single change. Deleted files are not reported, nothing is ever removed from the robot.
+    Diagnostics of the watcher go to log.
+    """
+
+    def __init__(self, file_sets: list[FileSet], debounce: float = DEBOUNCE, backend=None, log=print):
+        self.file_sets = file_sets
+        self.debounce = debounce
+        self.backend = backend or create_watcher(file_sets, log)
+        self.detector = ChangeDetector()
+        self.pending = {path for file_set in file_sets for path in file_set.files()}
+
+    def changes(self, timeout: float = None) -> list[tuple[str, bytes]]:
+        """
+        Wait for the next burst of changes.
+
+        Parameters:
+          timeout (float): Seconds to wait at most, None waits forever.
+
+        Returns:
+          list[tuple[str, bytes]]: The changed paths with their new content, empty on timeout.
+        """
+        if not self.pending:
+            self.pending = self.backend.wait(timeout)
+            while self.pending:
+                burst = self.backend.wait(self.debounce)
+                if not burst:
+                    break
+                self.pending |= burst
+
+        changed = []
+        for path in sorted(self.pending):
+            data = self.detector.check(path)
+            if data is not None:
+                changed.append((path, data))
+        self.pending = set()
+        return changed
+
+    def close(self) -> None:
+        self.backend.close()
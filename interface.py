@@ -2,59 +2,264 @@ import tkinter as tk
 from tkinter import scrolledtext, filedialog
 import subprocess
 import threading
-import queue
+import collections
 import sys
 import os
 import signal
 import time
 from datetime import datetime
+from session_log import SessionRecorder, SessionArchive
+
+# CONSTANTS
+
+# Directory the output of every run is recorded to
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "runs")
+# Lines shown at once in the log viewer
+VIEW_LINES = 60
+# Seconds the script gets to exit after SIGINT, after SIGTERM and after SIGKILL when it is stopped
+STOP_DEADLINES = (0.5, 0.5, 1.0)
+# Run scripts in a worker that already imported these modules, instead of a fresh interpreter
+WARM_START = True
+WARM_MODULES = ["numpy", "cv2", "kipr"]
+
+# Printed by the warm worker right before the script runs, what comes before are its preload messages
+WORKER_MARKER = b"\0warm-start"
+# Runs in the warm worker: preloads the modules, then waits for the path of the script to run on stdin
+WORKER_CODE = """
+import sys
+sys.path.append("/usr/lib")
+import importlib, os, runpy
+for module in sys.argv[1:]:
+    try:
+        importlib.import_module(module)
+    except Exception as e:
+        print(f"Warm start: could not preload {module} ({e})", file=sys.stderr)
+path = sys.stdin.readline().rstrip("\\n")
+if not path:
+    sys.exit(0)
+sys.stdin.close()
+sys.argv = [path]
+sys.path[0] = os.path.dirname(path)
+print("\\0warm-start", flush=True)
+runpy.run_path(path, run_name="__main__")
+"""
+
+# Lines kept in the output field, older ones are removed
+MAX_SCROLLBACK = 5000
+# Lines waiting for the UI, when the script prints faster than they are shown the oldest are dropped
+MAX_PENDING = 20000
+# Lines inserted into the output field per frame at most
+MAX_BATCH = 1000
+# Milliseconds between two frames of the output field
+FRAME_INTERVAL = 50
+# Bytes read from the script's stdout at once
+READ_SIZE = 64 * 1024
+# Bounds of the adaptive polling interval (ms), used where Tk has no file handlers (Windows)
+MIN_POLL_INTERVAL = 10
+MAX_POLL_INTERVAL = 200
+
+class OutputBuffer:
+    """Ring buffer between the reader thread and the UI, which drops the oldest lines when the UI can't keep up."""
+    def __init__(self, capacity=MAX_PENDING):
+        self.lines = collections.deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        self.dropped = 0
+
+    def put(self, line):
+        return self.extend([line])
+
+    def extend(self, lines):
+        # Returns whether the buffer was empty, i.e. the UI has to be woken up
+        with self.lock:
+            was_empty = not self.lines
+            self.dropped += max(0, len(self.lines) + len(lines) - self.lines.maxlen)
+            self.lines.extend(lines)
+            return was_empty
+
+    def drain(self, limit=MAX_BATCH):
+        with self.lock:
+            count = min(limit, len(self.lines))
+            return [self.lines.popleft() for _ in range(count)]
+
+    def empty(self):
+        return not self.lines
 
 class ScriptRunner:
-    def __init__(self, output_callback, terminal_callback, path_update_callback):
+    def __init__(self, output_callback, terminal_callback, path_update_callback, dropped_callback=None, recorder=None):
         self.process = None
+        self.recorder = recorder
+        self.stop_deadlines = STOP_DEADLINES
+        self.stop_thread = None
+        # Guards process and was_interrupted between stop() and the thread starting the script
+        self.stop_lock = threading.Lock()
+        self.warm = WARM_START
+        self.worker = None
+        self.startup = None
         self.output_callback = output_callback
         self.terminal_callback = terminal_callback
         self.path_update_callback = path_update_callback
-        self.output_queue = queue.Queue()
+        self.dropped_callback = dropped_callback
+        self.output_queue = OutputBuffer()
         self.thread = None
         self.running = False
         self.was_interrupted = False
+        self.warm_run = False
         self.start_time = None
+        self.render_pending = False
+        self.last_render = 0
+        self.poll_interval = MIN_POLL_INTERVAL
         self.script_path = os.path.abspath("example_script.py")
         self.path_update_callback(self.script_path)
 
+        # The reader thread wakes the UI through a pipe, so nothing polls while the script is quiet
+        self.wake_r, self.wake_w = os.pipe()
+        os.set_blocking(self.wake_w, False)
+        self.event_driven = hasattr(root.tk, "createfilehandler")
+        if self.event_driven:
+            root.tk.createfilehandler(self.wake_r, tk.READABLE, self._on_wake)
+
+        if self.warm:
+            self._spawn_worker()
+
+    def _popen(self, args, **kwargs):
+        return subprocess.Popen(
+            [sys.executable, '-u'] + args,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            bufsize=0,
+            # Own session, so stopping the script can never signal the GUI
+            start_new_session=(os.name != 'nt'),
+            **kwargs,
+        )
+
+    def _spawn_worker(self):
+        # Pre-fork the next warm worker, it imports the heavy modules while nothing else runs
+        self.worker = self._popen(['-c', WORKER_CODE] + WARM_MODULES, stdin=subprocess.PIPE)
+
+    def _take_worker(self):
+        worker, self.worker = self.worker, None
+        if worker is None or worker.poll() is not None:
+            return None
+        try:
+            worker.stdin.write(self.script_path.encode() + b"\n")
+            worker.stdin.close()
+        except OSError:
+            self._retire(worker)
+            return None
+        return worker
+
+    def _retire(self, worker):
+        # The idle worker exits once its stdin is closed, reap it without blocking on its imports
+        try:
+            worker.stdin.close()
+        except OSError:
+            pass
+
+        def reap():
+            worker.wait()
+            worker.stdout.close()
+
+        threading.Thread(target=reap, daemon=True).start()
+
+    def set_warm(self, enabled):
+        self.warm = enabled
+        if enabled and self.worker is None and not self.running:
+            self._spawn_worker()
+        elif not enabled:
+            self.close()
+
+    def close(self):
+        worker, self.worker = self.worker, None
+        if worker is not None:
+            self._retire(worker)
+
     def set_script_path(self, path):
         if path:
             self.script_path = os.path.abspath(path)
             self.path_update_callback(self.script_path)
 
+    def _emit(self, lines):
+        if self.output_queue.extend(lines) and self.event_driven:
+            try:
+                os.write(self.wake_w, b"\0")
+            except BlockingIOError:
+                pass
+
+    def _read_output(self, fd):
+        # Read whatever is available in large chunks and split lines ourselves, one timestamp per chunk
+        partial = b""
+        elapsed = 0.0
+        # The startup is timed from the first output of the script, not from the warm worker's preload messages
+        started = not self.warm_run
+        while True:
+            chunk = os.read(fd, READ_SIZE)
+            if not chunk:
+                break
+            elapsed = time.monotonic() - self.start_time
+            lines = (partial + chunk).split(b"\n")
+            partial = lines.pop()
+            if not started:
+                index = lines.index(WORKER_MARKER) if WORKER_MARKER in lines else len(lines)
+                if index:
+                    self._output(elapsed, [line.decode(errors="replace") for line in lines[:index]])
+                if index == len(lines):
+                    continue
+                lines = lines[index + 1:]
+                started = True
+                if not lines and not partial:
+                    continue
+            if self.startup is None:
+                self.startup = elapsed
+                mode = "warm" if self.warm_run else "cold"
+                self._output(elapsed, [f">>> Startup: {elapsed * 1000:.0f} ms ({mode})"])
+            if lines:
+                self._output(elapsed, [line.decode(errors="replace") for line in lines])
+        if partial:
+            self._output(elapsed, [partial.decode(errors="replace")])
+
+    def _output(self, elapsed, lines):
+        if self.recorder:
+            self.recorder.record(elapsed, lines)
+        prefix = f"[{elapsed:.3f}s] "
+        self._emit([prefix + line + "\n" for line in lines])
+
     def start(self):
         if self.running:
             return
-        self.running = True
-        self.was_interrupted = False
-        self.start_time = time.time()
+        self.stop_thread = None
+        with self.stop_lock:
+            self.was_interrupted = False
+            self.running = True
+        self.startup = None
+        self.start_time = time.monotonic()
+        self.output_queue.dropped = 0
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
         start_msg = f">>> [{timestamp}] Running {self.script_path}\n"
         self.output_callback(start_msg, clear=True)
         self.terminal_callback(start_msg)
+        if self.recorder:
+            self.recorder.start_run(self.script_path)
 
         def run_script():
-            self.process = subprocess.Popen(
-                [sys.executable, '-u', self.script_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                bufsize=1,
-                text=True,
-            )
-
-            for line in self.process.stdout:
-                elapsed = time.time() - self.start_time
-                formatted_line = f"[{elapsed:.3f}s] {line}"
-                self.output_queue.put(formatted_line)
-
-            self.process.wait()
+            process = self._take_worker() if self.warm else None
+            self.warm_run = process is not None
+            if not self.warm_run:
+                process = self._popen([self.script_path])
+            with self.stop_lock:
+                self.process = process
+                # Stop was pressed before the script was spawned
+                pending = self.was_interrupted
+            if pending:
+                self._begin_stop()
+
+            self._read_output(process.stdout.fileno())
+
+            process.wait()
+            if self.stop_thread:
+                self.stop_thread.join()
+            with self.stop_lock:
+                self.process = None
             self.running = False
 
             end_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -62,132 +267,327 @@ class ScriptRunner:
                 msg = f">>> [{end_time}] Script interrupted.\n"
             else:
                 msg = f">>> [{end_time}] Script finished.\n"
-            self.output_queue.put(msg)
+            if self.recorder:
+                self.recorder.end_run("interrupted" if self.was_interrupted else "finished", self.startup)
+            self._emit([msg])
+            if self.warm:
+                self._spawn_worker()
 
         self.thread = threading.Thread(target=run_script, daemon=True)
         self.thread.start()
-        self._poll_output()
+        if not self.event_driven:
+            self._poll_output()
+
+    def _on_wake(self, fd, mask):
+        os.read(self.wake_r, 4096)
+        self._schedule_render()
+
+    def _schedule_render(self):
+        # Render at once when idle, but at most once per frame
+        if self.render_pending:
+            return
+        self.render_pending = True
+        delay = FRAME_INTERVAL - (time.monotonic() - self.last_render) * 1000
+        if delay > 0:
+            root.after(int(delay), self._render)
+        else:
+            root.after_idle(self._render)
+
+    def _render(self):
+        self.render_pending = False
+        self.last_render = time.monotonic()
+        # One insert per frame, however many lines arrived
+        lines = self.output_queue.drain()
+        if lines:
+            text = "".join(lines)
+            self.output_callback(text)
+            self.terminal_callback(text)
+        if self.dropped_callback:
+            self.dropped_callback(self.output_queue.dropped)
+        if self.event_driven and not self.output_queue.empty():
+            self._schedule_render()
+        return bool(lines)
 
     def _poll_output(self):
-        try:
-            while True:
-                line = self.output_queue.get_nowait()
-                self.output_callback(line)
-                self.terminal_callback(line)
-        except queue.Empty:
-            pass
+        # Fallback without file handlers: poll fast while output arrives and back off while quiet
+        if self._render():
+            self.poll_interval = MIN_POLL_INTERVAL
+        else:
+            self.poll_interval = min(self.poll_interval * 2, MAX_POLL_INTERVAL)
 
         if self.running or not self.output_queue.empty():
-            root.after(100, self._poll_output)
+            root.after(self.poll_interval, self._poll_output)
+
+    def _session_members(self):
+        # Every process in the script's session, including children it left behind (e.g. by off())
+        members = set()
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as file:
+                    fields = file.read().rsplit(')', 1)[1].split()
+            except OSError:
+                continue
+            # fields: state, ppid, pgrp, session
+            if int(fields[3]) == self.process.pid and fields[0] != 'Z':
+                members.add(int(entry))
+        return members
+
+    def _shutdown(self):
+        start = time.monotonic()
+        used = "SIGTERM"
+        if os.name == 'nt' or not os.path.isdir('/proc'):
+            self.process.terminate()
+            try:
+                self.process.wait(sum(self.stop_deadlines))
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        else:
+            for sig, deadline in zip((signal.SIGINT, signal.SIGTERM, signal.SIGKILL), self.stop_deadlines):
+                members = self._session_members()
+                if not members:
+                    break
+                used = sig.name
+                for pid in members:
+                    try:
+                        os.kill(pid, sig)
+                    except ProcessLookupError:
+                        pass
+                end = time.monotonic() + deadline
+                while self._session_members() and time.monotonic() < end:
+                    time.sleep(0.01)
+            else:
+                left = self._session_members()
+                if left:
+                    used = f"SIGKILL, still running: {', '.join(str(pid) for pid in sorted(left))}"
+        elapsed = time.monotonic() - start
+        self._output(time.monotonic() - self.start_time, [f">>> Stopped in {elapsed * 1000:.0f} ms ({used})"])
 
     def stop(self):
-        if self.process and self.running:
+        with self.stop_lock:
+            if not self.running or self.was_interrupted:
+                return
             self.was_interrupted = True
-            if os.name == 'nt':
-                self.process.terminate()
-            else:
-                os.killpg(os.getpgid(self.process.pid), signal.SIGTERM)
-            self.running = False
+            if self.process is None:
+                # Not spawned yet, run_script stops it right after spawning
+                return
+        self._begin_stop()
+
+    def _begin_stop(self):
+        # Escalate in the background, the UI stays responsive meanwhile
+        self.stop_thread = threading.Thread(target=self._shutdown, daemon=True)
+        self.stop_thread.start()
+
+class LogViewer:
+    """
+    Window listing the recorded runs, which only reads the lines currently visible from disk.
+    It owns the archive and closes it with the window.
+    """
+    def __init__(self, master, archive):
+        self.archive = archive
+        self.run = None
+        self.first = 0
+        self.total = 0
+
+        self.window = tk.Toplevel(master)
+        self.window.title("Recorded Runs")
+        self.window.geometry("1000x700")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        self.window.grid_rowconfigure(0, weight=1)
+        self.window.grid_columnconfigure(1, weight=1)
+
+        self.run_list = tk.Listbox(self.window, font=('Courier', 10), width=45, exportselection=False)
+        self.run_list.grid(row=0, column=0, rowspan=2, sticky="nsew")
+        self.run_list.bind("<<ListboxSelect>>", self.on_select)
+
+        self.text = tk.Text(self.window, wrap=tk.NONE, font=('Courier', 10), state='disabled')
+        self.text.grid(row=0, column=1, sticky="nsew")
+        self.scale = tk.Scale(self.window, orient=tk.VERTICAL, from_=0, to=0, showvalue=False, command=self.on_scale)
+        self.scale.grid(row=0, column=2, sticky="ns")
+
+        nav_frame = tk.Frame(self.window)
+        nav_frame.grid(row=1, column=1, columnspan=2, sticky="ew")
+        self.position_var = tk.StringVar()
+        tk.Label(nav_frame, textvariable=self.position_var, font=('Courier', 10)).pack(side=tk.LEFT)
+        self.goto_var = tk.StringVar()
+        goto_entry = tk.Entry(nav_frame, textvariable=self.goto_var, width=10)
+        goto_entry.pack(side=tk.RIGHT)
+        goto_entry.bind("<Return>", lambda event: self.show(int(self.goto_var.get() or 0)))
+        tk.Label(nav_frame, text="Go to line:").pack(side=tk.RIGHT)
+
+        for key, delta in (("<Prior>", -VIEW_LINES), ("<Next>", VIEW_LINES), ("<Up>", -1), ("<Down>", 1)):
+            self.window.bind(key, lambda event, delta=delta: self.show(self.first + delta))
+        self.window.bind("<Home>", lambda event: self.show(0))
+        self.window.bind("<End>", lambda event: self.show(self.total))
+        self.text.bind("<MouseWheel>", lambda event: self.show(self.first - event.delta // 40))
+        self.text.bind("<Button-4>", lambda event: self.show(self.first - 3))
+        self.text.bind("<Button-5>", lambda event: self.show(self.first + 3))
+
+        for run in self.archive.runs:
+            duration = f"{run['duration']:.1f}s" if run["duration"] is not None else "?"
+            startup = f" start {run['startup'] * 1000:.0f}ms" if run["startup"] is not None else ""
+            self.run_list.insert(tk.END, f"{run['time']} {os.path.basename(run['script'])} {run['status']} {duration}{startup}")
+        if self.archive.runs:
+            self.run_list.selection_set(tk.END)
+            self.on_select()
+
+    def close(self):
+        self.archive.close()
+        self.window.destroy()
+
+    def on_select(self, event=None):
+        selection = self.run_list.curselection()
+        if not selection:
+            return
+        self.run = self.archive.runs[selection[0]]
+        self.total = self.archive.line_count(self.run)
+        self.scale.configure(to=max(0, self.total - VIEW_LINES))
+        self.show(0)
+
+    def on_scale(self, value):
+        if int(value) != self.first:
+            self.show(int(value))
+
+    def show(self, first):
+        if self.run is None:
+            return
+        self.first = max(0, min(first, self.total - VIEW_LINES))
+        lines = self.archive.read_lines(self.run, self.first, VIEW_LINES)
+        self.text.configure(state='normal')
+        self.text.delete(1.0, tk.END)
+        self.text.insert(tk.END, "".join(f"[{elapsed:.3f}s] {line}\n" for elapsed, line in lines))
+        self.text.configure(state='disabled')
+        self.scale.set(self.first)
+        self.position_var.set(f"Lines {self.first + 1}-{self.first + len(lines)} of {self.total}")
+
+if __name__ == "__main__":
+    # Tkinter setup
+    root = tk.Tk()
+    root.title("Script Runner")
+    root.attributes('-fullscreen', True)
+
+    # Main layout
+    root.grid_rowconfigure(1, weight=1)  # path bar
+    root.grid_rowconfigure(2, weight=8)  # terminal + buttons
+    root.grid_columnconfigure(0, weight=2)  # terminal
+    root.grid_columnconfigure(1, weight=1)  # buttons
+
+    # === Top Control Bar (Close and Minimize) ===
+    top_bar_frame = tk.Frame(root)
+    top_bar_frame.grid(row=0, column=0, columnspan=2, sticky="new")
+    top_bar_frame.grid_columnconfigure(0, weight=1)
+    top_bar_frame.grid_columnconfigure(1, weight=0)
+    top_bar_frame.grid_columnconfigure(2, weight=0)
+
+    def minimize_window():
+        root.iconify()
+
+    def close_window():
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        close_msg = f">>> [{timestamp}] Window closed.\n"
+        runner.output_callback(close_msg)  # Print the close message
+        runner.terminal_callback(close_msg)
+        recorder.close()
+        runner.close()
+        root.quit()
+
+    min_btn = tk.Button(top_bar_frame, text="🗕", command=minimize_window)
+    min_btn.grid(row=0, column=1, sticky="ne", ipadx=10)
+
+    close_btn = tk.Button(top_bar_frame, text="✖", command=close_window)
+    close_btn.grid(row=0, column=2, sticky="ne", ipadx=10)
+
+    # === Path Entry Bar ===
+    script_path_var = tk.StringVar()
+    script_path_entry = tk.Entry(root, textvariable=script_path_var, state='readonly', font=('Courier', 10))
+    script_path_entry.grid(row=1, column=0, sticky="nsew", columnspan=2)
+
+    # === Terminal Output ===
+    left_frame = tk.Frame(root)
+    left_frame.grid(row=2, column=0, sticky="nsew")
+    left_frame.grid_rowconfigure(0, weight=1)
+    left_frame.grid_columnconfigure(0, weight=1)
+
+    output_field = scrolledtext.ScrolledText(left_frame, wrap=tk.WORD, font=('Courier', 12), state='disabled')
+    output_field.grid(row=0, column=0, sticky="nsew")
+
+    dropped_var = tk.StringVar()
+    dropped_label = tk.Label(left_frame, textvariable=dropped_var, font=('Courier', 10), fg="#B00000", anchor="w")
+    dropped_label.grid(row=1, column=0, sticky="ew")
+
+    def append_output(text, clear=False):
+        output_field.configure(state='normal')
+        if clear:
+            output_field.delete(1.0, tk.END)
+        output_field.insert(tk.END, text)
+        # Cap scrollback, the field gets slow with too many lines
+        lines = int(output_field.index('end-1c').split('.')[0])
+        if lines > MAX_SCROLLBACK:
+            output_field.delete(1.0, f"{lines - MAX_SCROLLBACK + 1}.0")
+        output_field.see(tk.END)
+        output_field.configure(state='disabled')
+
+    def update_dropped(count):
+        dropped_var.set(f"{count} lines dropped" if count else "")
+
+    def print_terminal(text):
+        print(text, end='')
+
+    def update_path_display(path):
+        script_path_var.set(path)
+
+    recorder = SessionRecorder(LOG_DIR)
+    runner = ScriptRunner(append_output, print_terminal, update_path_display, update_dropped, recorder)
+
+    warm_var = tk.BooleanVar(value=runner.warm)
+    warm_check = tk.Checkbutton(top_bar_frame, text="Warm start", variable=warm_var,
+                                command=lambda: runner.set_warm(warm_var.get()))
+    warm_check.grid(row=0, column=0, sticky="nw")
+
+    # === Right Panel with Buttons ===
+    btn_frame = tk.Frame(root)
+    btn_frame.grid(row=2, column=1, sticky="nsew")
+    btn_frame.grid_rowconfigure(0, weight=2)      # choose button (1/10)
+    btn_frame.grid_rowconfigure(1, weight=9)    # start button
+    btn_frame.grid_rowconfigure(2, weight=9)    # stop button
+    btn_frame.grid_rowconfigure(3, weight=2)    # logs button
+    btn_frame.grid_columnconfigure(0, weight=1)
+
+    def choose_script():
+        path = filedialog.askopenfilename(filetypes=[("Python Scripts", "*.py")])
+        if path:
+            runner.set_script_path(path)
+
+    select_btn = tk.Button(btn_frame, text="Choose Script", command=choose_script)
+    select_btn.grid(row=0, column=0, sticky="nsew")
+
+    start_btn = tk.Button(btn_frame, text="Start Script", command=runner.start)
+    start_btn.grid(row=1, column=0, sticky="nsew")
+
+    stop_btn = tk.Button(btn_frame, text="Stop Script", command=runner.stop)
+    stop_btn.grid(row=2, column=0, sticky="nsew")
+
+    def show_logs():
+        recorder.flush()
+        LogViewer(root, SessionArchive(LOG_DIR))
+
+    logs_btn = tk.Button(btn_frame, text="Show Logs", command=show_logs)
+    logs_btn.grid(row=3, column=0, sticky="nsew")
+
+    # === Add hover effects to buttons ===
+    def on_enter(event):
+        event.widget.config(bg="#DDDDDD")  # lighter color when hovered
+
+    def on_leave(event):
+        event.widget.config(bg="#F0F0F0")  # default color when mouse leaves
+
+    # Bind hover events to the buttons
+    for button in [select_btn, start_btn, stop_btn, logs_btn, min_btn, close_btn]:
+        button.bind("<Enter>", on_enter)
+        button.bind("<Leave>", on_leave)
+
+    # Bind close event (when window is closed via X button)
+    root.protocol("WM_DELETE_WINDOW", close_window)
 
-# Tkinter setup
-root = tk.Tk()
-root.title("Script Runner")
-root.attributes('-fullscreen', True)
-
-# Main layout
-root.grid_rowconfigure(1, weight=1)  # path bar
-root.grid_rowconfigure(2, weight=8)  # terminal + buttons
-root.grid_columnconfigure(0, weight=2)  # terminal
-root.grid_columnconfigure(1, weight=1)  # buttons
-
-# === Top Control Bar (Close and Minimize) ===
-top_bar_frame = tk.Frame(root)
-top_bar_frame.grid(row=0, column=0, columnspan=2, sticky="new")
-top_bar_frame.grid_columnconfigure(0, weight=1)
-top_bar_frame.grid_columnconfigure(1, weight=0)
-top_bar_frame.grid_columnconfigure(2, weight=0)
-
-def minimize_window():
-    root.iconify()
-
-def close_window():
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    close_msg = f">>> [{timestamp}] Window closed.\n"
-    runner.output_callback(close_msg)  # Print the close message
-    runner.terminal_callback(close_msg)
-    root.quit()
-
-min_btn = tk.Button(top_bar_frame, text="🗕", command=minimize_window)
-min_btn.grid(row=0, column=1, sticky="ne", ipadx=10)
-
-close_btn = tk.Button(top_bar_frame, text="✖", command=close_window)
-close_btn.grid(row=0, column=2, sticky="ne", ipadx=10)
-
-# === Path Entry Bar ===
-script_path_var = tk.StringVar()
-script_path_entry = tk.Entry(root, textvariable=script_path_var, state='readonly', font=('Courier', 10))
-script_path_entry.grid(row=1, column=0, sticky="nsew", columnspan=2)
-
-# === Terminal Output ===
-left_frame = tk.Frame(root)
-left_frame.grid(row=2, column=0, sticky="nsew")
-left_frame.grid_rowconfigure(0, weight=1)
-left_frame.grid_columnconfigure(0, weight=1)
-
-output_field = scrolledtext.ScrolledText(left_frame, wrap=tk.WORD, font=('Courier', 12), state='disabled')
-output_field.grid(row=0, column=0, sticky="nsew")
-
-def append_output(text, clear=False):
-    output_field.configure(state='normal')
-    if clear:
-        output_field.delete(1.0, tk.END)
-    output_field.insert(tk.END, text)
-    output_field.see(tk.END)
-    output_field.configure(state='disabled')
-
-def print_terminal(text):
-    print(text, end='')
-
-def update_path_display(path):
-    script_path_var.set(path)
-
-runner = ScriptRunner(append_output, print_terminal, update_path_display)
-
-# === Right Panel with Buttons ===
-btn_frame = tk.Frame(root)
-btn_frame.grid(row=2, column=1, sticky="nsew")
-btn_frame.grid_rowconfigure(0, weight=2)      # choose button (1/10)
-btn_frame.grid_rowconfigure(1, weight=9)    # start button
-btn_frame.grid_rowconfigure(2, weight=9)    # stop button
-btn_frame.grid_columnconfigure(0, weight=1)
-
-def choose_script():
-    path = filedialog.askopenfilename(filetypes=[("Python Scripts", "*.py")])
-    if path:
-        runner.set_script_path(path)
-
-select_btn = tk.Button(btn_frame, text="Choose Script", command=choose_script)
-select_btn.grid(row=0, column=0, sticky="nsew")
-
-start_btn = tk.Button(btn_frame, text="Start Script", command=runner.start)
-start_btn.grid(row=1, column=0, sticky="nsew")
-
-stop_btn = tk.Button(btn_frame, text="Stop Script", command=runner.stop)
-stop_btn.grid(row=2, column=0, sticky="nsew")
-
-# === Add hover effects to buttons ===
-def on_enter(event):
-    event.widget.config(bg="#DDDDDD")  # lighter color when hovered
-
-def on_leave(event):
-    event.widget.config(bg="#F0F0F0")  # default color when mouse leaves
-
-# Bind hover events to the buttons
-for button in [select_btn, start_btn, stop_btn, min_btn, close_btn]:
-    button.bind("<Enter>", on_enter)
-    button.bind("<Leave>", on_leave)
-
-# Bind close event (when window is closed via X button)
-root.protocol("WM_DELETE_WINDOW", close_window)
-
-root.mainloop()
+    root.mainloop()
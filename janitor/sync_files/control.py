@@ -1,7 +1,17 @@
 #!/usr/bin/python3
-import os, sys, time, threading, multiprocessing
+import os, sys, time, threading, multiprocessing, asyncio
 sys.path.append("/usr/lib")
+# Synced next to this file on the robot, found in the repository when run locally
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "shared"))
 import kipr as k
+from control_loop import ControlLoop, PID, LoopStats
+from sensor_hub import SensorHub, Snapshot
+from edges import EdgeMonitor, Threshold, RISING, FALLING
+from motion import Motion
+from trajectory import ServoEngine
+from mission import Mission, StepFailed, rehearse
+from schedule import Scheduler, MATCH_TIME, measured_estimates
+from channel import Channel
 
 # CONSTANTS
 LEFT_SENSOR = 0
@@ -20,6 +30,45 @@ FORK_SERVO = 2
 WHITE_THRESHOLD = 220
 BLACK_THRESHOLD = 3000
 
+# Line following: loop rate in Hz and PID gains on the brightness difference of the sensors (right - left)
+FOLLOW_RATE = 200
+FOLLOW_KP = 1.0
+FOLLOW_KI = 0.0
+FOLLOW_KD = 0.02
+
+# Line sensors and start light, sampled in the background once started
+sensors = SensorHub(analog=[LEFT_SENSOR, RIGHT_SENSOR], digital=[START_LIGHT])
+
+# Raw brightness at which a line sensor is on the line, and back on the floor (the gap is the hysteresis)
+LINE_HIGH = WHITE_THRESHOLD + 100
+LINE_LOW = WHITE_THRESHOLD
+# Raw brightness at which a line sensor is fully on black (see on_cross), and off it again
+CROSS_HIGH = BLACK_THRESHOLD
+CROSS_LOW = BLACK_THRESHOLD - 100
+# Seconds after which waiting for the line, floor or a cross gives up, stops the drive motors and drops the rest of the phase
+LINE_TIMEOUT = 6
+
+# "line" rises when both sensors reached the line and falls when both are back on the floor
+edges = EdgeMonitor(sensors)
+edges.add("line", [Threshold(LEFT_SENSOR, LINE_HIGH, LINE_LOW), Threshold(RIGHT_SENSOR, LINE_HIGH, LINE_LOW)])
+# "cross" falls once both sensors left the cross
+edges.add("cross", [Threshold(LEFT_SENSOR, CROSS_HIGH, CROSS_LOW), Threshold(RIGHT_SENSOR, CROSS_HIGH, CROSS_LOW)])
+
+# Smooth servo moves, all updated from one thread
+servos = ServoEngine()
+# Awaitable drive and servo moves, gather them to run them at the same time
+motion = Motion(LEFT_MOTOR, RIGHT_MOTOR, servos=servos)
+
+# Events shared with the bartender: this robot signals bottles_dropped and beverages_clear, the bartender cups_placed
+channel = Channel("janitor")
+# Seconds to wait at most for the bartender's cups (the fixed wait this replaced)
+CUPS_TIMEOUT = 35
+
+# Steps of the game, durations and speeds are tuned there without touching this file
+MISSION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mission.yaml")
+# Timing profiles of the runs, their median phase durations are the estimates of phases without one
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".profiles")
+
 def normalize_brightness(brightness: int) -> float:
    """
    Normalize the brightness value to a range between 0.0 and 1.0.
@@ -72,110 +121,141 @@ def line_sense(brightness_left: float, brightness_right: float, normalize: bool
 
    return centerity
 
-def line_follow(left_sensor_index: int = LEFT_SENSOR, right_sensor_index: int = RIGHT_SENSOR, speed: int = 100):
-   val_l = k.analog(left_sensor_index)
-   val_r = k.analog(right_sensor_index)
+def brightness(snapshot: Snapshot, port: int) -> float:
+   return normalize_brightness(snapshot.analog[port])
 
-   centerity = line_sense(val_l, val_r, normalize=True)
+def on_cross(snapshot: Snapshot = None) -> bool:
+   # Both sensors fully on black
+   snapshot = snapshot or sensors.snapshot
+   return brightness(snapshot, LEFT_SENSOR) == 1 and brightness(snapshot, RIGHT_SENSOR) == 1
 
-   influence = max(min(centerity, 1), -1)
-   l_control = round((1 + influence) * speed)
-   r_control = round((1 - influence) * speed)
+def follow_line(duration: float = None, until=None, speed: int = 100, timeout: float = None, stop: bool = True,
+                left_sensor_index: int = LEFT_SENSOR, right_sensor_index: int = RIGHT_SENSOR) -> LoopStats:
+   """
+   Follow the line with a PID controller in a fixed-rate control loop.
 
-   k.motor(LEFT_MOTOR, l_control)
-   k.motor(RIGHT_MOTOR, r_control)
+   Parameters:
+      duration (float): Seconds to follow the line for (real time, not loop iterations).
+      until (callable): Stop once this returns True, e.g. on_cross.
+      speed (int): Motor speed when the line is centered.
+      timeout (float): Seconds after which an until follow gives up.
+      stop (bool): Turn the motors off afterwards, else they keep the last command.
 
-def shovel_ice():
+   Returns:
+      LoopStats: Achieved loop frequency and jitter.
+   """
+   pid = PID(FOLLOW_KP, FOLLOW_KI, FOLLOW_KD)
+
+   def step(elapsed: float, dt: float):
+      snapshot = sensors.snapshot
+      error = brightness(snapshot, right_sensor_index) - brightness(snapshot, left_sensor_index)
+      correction = pid.update(error, dt)
+      k.motor(LEFT_MOTOR, round((1 + correction) * speed))
+      k.motor(RIGHT_MOTOR, round((1 - correction) * speed))
+
+   stats = ControlLoop(FOLLOW_RATE).run(step, duration, until, timeout)
+   if stop:
+      k.motor(LEFT_MOTOR, 0)
+      k.motor(RIGHT_MOTOR, 0)
+   print(f"Line follow: {stats}")
+   return stats
+
+async def shovel_ice():
    # It is assumed that this script starts when the bot is in front of the ice hugging the wall, with the fork horizontal behind the robot to avoid collisions
 
    # Initial positions
    k.set_servo_position(ARM_SERVO, 1100)
    k.set_servo_position(TOOL_SERVO, 1500)
 
-   time.sleep(0.5)
+   await asyncio.sleep(0.5)
 
    # First phase: Sinking arm and tool into the ice poms  
 
    k.set_servo_position(TOOL_SERVO, 1750)
-   time.sleep(0.1)
+   await asyncio.sleep(0.1)
    k.set_servo_position(ARM_SERVO, 700)
 
-   time.sleep(0.5)
+   await asyncio.sleep(0.5)
 
-   for i in range(10):
+   await motion.servo_move({TOOL_SERVO: 1300, ARM_SERVO: 475}, 1.0)
 
-      k.set_servo_position(TOOL_SERVO, 1750 - 50 * i)
-
-      k.set_servo_position(ARM_SERVO, 700 - 25 * i)
-
-      time.sleep(0.1)
-
-   time.sleep(0.5)
+   await asyncio.sleep(0.5)
    
    # Second phase: Driveing backwards and angling the tool out
-   for i in range(10):
-      k.set_servo_position(TOOL_SERVO, 1250 - 80 * i)
-      k.set_servo_position(ARM_SERVO, 450 - 40 * i)
-      time.sleep(0.1)
+   await motion.servo_move({TOOL_SERVO: 530, ARM_SERVO: 90}, 1.0)
    
-   time.sleep(0.2)
+   await asyncio.sleep(0.2)
    
-   k.motor(LEFT_MOTOR, -85)
-   k.motor(RIGHT_MOTOR, -100)
-   time.sleep(0.15)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-85, -100, 0.15)
    
-   time.sleep(0.5)
+   await asyncio.sleep(0.5)
    
    # Third phase: Lifting up the tool with the ice poms
-   for i in range(30):
-
-      k.set_servo_position(TOOL_SERVO, 450 - 15 * i)
-      
-      time.sleep(0.05)
+   await motion.servo_move({TOOL_SERVO: 15}, 1.5)
    
-   time.sleep(0.5)
-
-   # Fourth phase: lifting the arm up and leveling the tool
-   k.motor(LEFT_MOTOR, 85)
-   k.motor(RIGHT_MOTOR, 100)
-   for i in range(20):
-
-      k.set_servo_position(ARM_SERVO, 0 + 50 * i)
+   await asyncio.sleep(0.5)
 
-      k.set_servo_position(TOOL_SERVO, 0 + 40 * i)
-      
-      time.sleep(0.1)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   # Fourth phase: lifting the arm up and leveling the tool, while driving forward
+   await asyncio.gather(
+      motion.drive(85, 100, 2.0),
+      motion.servo_move({ARM_SERVO: 950, TOOL_SERVO: 760}, 2.0),
+   )
    
    # Finish: Get shovel into position for transport
-   for i in range(10):
-      k.set_servo_position(ARM_SERVO, 1000 + 60 * i)
-      k.set_servo_position(TOOL_SERVO, 800 + 60 * i)
-
-      time.sleep(0.1)
-
-def wait_for_line():
-   # Wait till no line if starts on line
-   if normalize_brightness(k.analog(LEFT_SENSOR)) > 0 or normalize_brightness(k.analog(RIGHT_SENSOR)) > 0:
-      while normalize_brightness(k.analog(LEFT_SENSOR)) > 0 or normalize_brightness(k.analog(RIGHT_SENSOR)) > 0:
-         time.sleep(0.000000001)
-   # Wait till no floor
-   while normalize_brightness(k.analog(LEFT_SENSOR)) == 0 or normalize_brightness(k.analog(RIGHT_SENSOR)) == 0:
-      time.sleep(0.000000001)
-
-def wait_for_floor():
-   # Wait till no floor if starts on floor
-   if normalize_brightness(k.analog(LEFT_SENSOR)) == 0 or normalize_brightness(k.analog(RIGHT_SENSOR)) == 0:
-      while normalize_brightness(k.analog(LEFT_SENSOR)) == 0 or normalize_brightness(k.analog(RIGHT_SENSOR)) == 0:
-         time.sleep(0.000000001)
-   # Wait till no line
-   while normalize_brightness(k.analog(LEFT_SENSOR)) > 0 or normalize_brightness(k.analog(RIGHT_SENSOR)) > 0:
-      time.sleep(0.000000001)
-
-def start_to_ice(): 
+   await motion.servo_move({ARM_SERVO: 1540, TOOL_SERVO: 1340}, 1.0)
+
+class LineMissed(StepFailed):
+   # The rest of the phase would dead-reckon from the wrong place, the mission drops it and stops the motors
+   pass
+
+async def drive_to_line(left: int, right: int, stop: bool = True, timeout: float = LINE_TIMEOUT) -> None:
+   # Drive till both sensors reach the line (after both were on the floor, if the robot starts on the line)
+   if not await motion.drive(left, right, until=edges.next("line", RISING), timeout=timeout, stop=stop):
+      raise LineMissed(f"No line within {timeout} s")
+
+async def drive_to_floor(left: int, right: int, stop: bool = True, timeout: float = LINE_TIMEOUT) -> None:
+   # Drive till both sensors leave the line (after both were on it, if the robot starts on the floor)
+   if not await motion.drive(left, right, until=edges.next("line", FALLING), timeout=timeout, stop=stop):
+      raise LineMissed(f"Still on the line after {timeout} s")
+
+async def follow(duration: float = None, cross: bool = False, speed: int = 100, stop: bool = True,
+                 timeout: float = LINE_TIMEOUT) -> LoopStats:
+   # Follow the line for duration seconds, or till the next cross. Cancelling this ends the loop thread too
+   cancelled = threading.Event()
+
+   def until() -> bool:
+      return cancelled.is_set() or (cross and on_cross())
+
+   try:
+      stats = await motion.in_thread(follow_line, duration, until, speed, timeout=timeout if cross else None, stop=stop)
+   except asyncio.CancelledError:
+      cancelled.set()
+      raise
+   if cross and not on_cross():
+      raise LineMissed(f"No cross within {timeout} s")
+   return stats
+
+async def leave_cross(timeout: float = LINE_TIMEOUT) -> None:
+   # Wait till both sensors left the cross, the motors keep the last command of the follow
+   left = edges.next("cross", FALLING)
+   if not on_cross():
+      left.cancel()
+      return
+   try:
+      await asyncio.wait_for(left, timeout)
+   except asyncio.TimeoutError:
+      raise LineMissed(f"Still on the cross after {timeout} s") from None
+
+async def wait_for_peer(event: str, timeout: float) -> bool:
+   # Continue as soon as the bartender signalled the event, or after timeout seconds without it
+   try:
+      await asyncio.wait_for(channel.next(event), timeout)
+      return True
+   except asyncio.TimeoutError:
+      print(f"No {event} from the bartender within {timeout} s")
+      return False
+
+async def start_to_ice(): 
    # It is assumed that this routine starts when the game starts
 
    # Initial positions
@@ -184,391 +264,191 @@ def start_to_ice():
    k.set_servo_position(FORK_SERVO, 1500)
 
    # Back off from wall
-   k.motor(LEFT_MOTOR, -100)
-   k.motor(RIGHT_MOTOR, -100)
-   time.sleep(0.3)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-100, -100, 0.3)
 
    # Turn to middle
-   k.motor(LEFT_MOTOR, 100)
-   k.motor(RIGHT_MOTOR, -100)
-   time.sleep(0.8)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(100, -100, 0.8)
 
    # Move to first line
-   k.motor(LEFT_MOTOR, -90)
-   k.motor(RIGHT_MOTOR, -100)
-   wait_for_line()
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await drive_to_line(-90, -100)
 
    # Turn around
-   k.motor(LEFT_MOTOR, -100)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(1.37)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-100, 100, 1.37)
 
    # Move to second line
-   k.motor(LEFT_MOTOR, 90)
-   k.motor(RIGHT_MOTOR, 100)
-   wait_for_line()
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await drive_to_line(90, 100)
 
    # Drive to ice poms
-   k.motor(LEFT_MOTOR, 90)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(3.0)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(90, 100, 3.0)
 
    # Lower fork to avoid collisions
    k.set_servo_position(FORK_SERVO, 500)
 
    # Turn towards ice
-   k.motor(LEFT_MOTOR, 100)
-   k.motor(RIGHT_MOTOR, -100)
-   time.sleep(0.75)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(100, -100, 0.75)
 
    # Hug wall to get straight
-   k.motor(LEFT_MOTOR, 90)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(1)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(90, 100, 1)
 
-def ice_to_bottles():
+async def ice_to_bottles():
    # Back off from ice poms
-   k.motor(LEFT_MOTOR, -100)
-   k.motor(RIGHT_MOTOR, -100)
-   time.sleep(0.2)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-100, -100, 0.2)
 
    # Lift fork up again to avoid collisions
    k.set_servo_position(FORK_SERVO, 1200)
 
    # Turn to main space
-   k.motor(LEFT_MOTOR, -100)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(0.7)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-100, 100, 0.7)
 
    # Drive to middle line
-   k.motor(LEFT_MOTOR, -100)
-   k.motor(RIGHT_MOTOR, -100)
-   wait_for_line()
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await drive_to_line(-100, -100)
    
    # Correct overshoot
-   k.motor(LEFT_MOTOR, 100)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(0.2)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(100, 100, 0.2)
 
    # Turn to face along middle line
-   k.motor(LEFT_MOTOR, 100)
-   k.motor(RIGHT_MOTOR, -100)
-   time.sleep(0.8)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(100, -100, 0.8)
 
    # Follow middle line to center cross
-   while True:
-      line_follow()
-      if normalize_brightness(k.analog(LEFT_SENSOR)) == 1 and normalize_brightness(k.analog(RIGHT_SENSOR)) == 1:
-         break
-   while normalize_brightness(k.analog(LEFT_SENSOR)) == 1 and normalize_brightness(k.analog(RIGHT_SENSOR)) == 1:
-      time.sleep(0.01)
-   while True:
-      line_follow()
-      if normalize_brightness(k.analog(LEFT_SENSOR)) == 1 and normalize_brightness(k.analog(RIGHT_SENSOR)) == 1:
-         break
+   await follow(cross=True, stop=False)
+   await leave_cross()
+   await follow(cross=True, stop=False)
    
    # Gradually drive backwards
    for i in range(10):
       k.motor(LEFT_MOTOR, i * -10)
       k.motor(RIGHT_MOTOR, i * -10)
-      time.sleep(0.05)
+      await asyncio.sleep(0.05)
 
    # Backtrack to the bottles
-   k.motor(LEFT_MOTOR, -100)
-   k.motor(RIGHT_MOTOR, -100)
-   time.sleep(0.85)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-100, -100, 0.85)
 
    # Face back to bottles
-   k.motor(LEFT_MOTOR, 100)
-   k.motor(RIGHT_MOTOR, -100)
-   time.sleep(0.8)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(100, -100, 0.8)
 
    # Drive forwards to hug wall and get straight
-   k.motor(LEFT_MOTOR, 100)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(1.5)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(100, 100, 1.5)
 
-def grab_bottles():
+async def grab_bottles():
    # It is assumed that this routine starts when the robot is in line with the bottles, hugging the wall infront of the bottles, with the fork up in a resting position
 
    # Get distance from the bottles
-   k.motor(LEFT_MOTOR, 47)
-   k.motor(RIGHT_MOTOR, 50)
-   time.sleep(1.7)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(47, 50, 1.7)
    
    # Angle fork
    k.set_servo_position(FORK_SERVO, 545)
 
-   time.sleep(0.5)
+   await asyncio.sleep(0.5)
 
    # Move shovel out of the way
    k.set_servo_position(ARM_SERVO, 1100)
    k.set_servo_position(TOOL_SERVO, 1550)
 
    # Drive fork into bottles slowly
-   k.motor(LEFT_MOTOR, -30)
-   k.motor(RIGHT_MOTOR, -31)
-   time.sleep(3)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-30, -31, 3)
 
    # Lift fork with bottles
-   for i in range(10):
-      k.set_servo_position(FORK_SERVO, 500 + i * 100)
-      time.sleep(0.05)
-
-def bottles_to_beverages():
-   # It is assumed this script begins right after lifting the bottles up
-
-   # Spin around to face beverage station with fork
-   k.motor(RIGHT_MOTOR, 100)
-   k.motor(LEFT_MOTOR, -100)
-   time.sleep(1.2)
-   k.motor(RIGHT_MOTOR, 0)
-   k.motor(LEFT_MOTOR, 0)
-
-   # Drive towards beverage station
-   k.motor(LEFT_MOTOR, -85)
-   k.motor(RIGHT_MOTOR, -100)
-   time.sleep(1.35)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.servo_move({FORK_SERVO: 1400}, 0.5)
 
-   # Turn to beverage station
-   k.motor(RIGHT_MOTOR, 100)
-   k.motor(LEFT_MOTOR, -100)
-   time.sleep(0.3)
-   k.motor(RIGHT_MOTOR, 0)
-   k.motor(LEFT_MOTOR, 0)
-
-   # Hug wall
-   k.motor(LEFT_MOTOR, -85)
-   k.motor(RIGHT_MOTOR, -100)
-   time.sleep(0.7)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
-
-def drop_bottles():
+async def drop_bottles():
    # It is assumed that this routine starts with the robot hugging the beverage station, with the fork with the bottles vertical
 
    # Put down bottles
-   for i in range(10):
-      k.set_servo_position(FORK_SERVO, 1500 - i * 105)
-      time.sleep(0.1)
-   time.sleep(0.5)
+   await motion.servo_move({FORK_SERVO: 555}, 1.0)
+   await asyncio.sleep(0.5)
 
    # Drive away from beverage station
-   k.motor(LEFT_MOTOR, 45)
-   k.motor(RIGHT_MOTOR, 50)
-   time.sleep(2)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(45, 50, 2)
 
    # Lower fork to push bottles
    k.set_servo_position(FORK_SERVO, 400)
 
    # Push bottles back
-   k.motor(LEFT_MOTOR, -45)
-   k.motor(RIGHT_MOTOR, -50)
-   time.sleep(1.2)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-45, -50, 1.2)
 
    k.set_servo_position(FORK_SERVO, 1100)
 
    # Push bottles back
-   k.motor(LEFT_MOTOR, -45)
-   k.motor(RIGHT_MOTOR, -50)
-   time.sleep(1.2)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-45, -50, 1.2)
 
    # Drive to middle line
-   k.motor(LEFT_MOTOR, 95)
-   k.motor(RIGHT_MOTOR, 100)
-   wait_for_line()
-   time.sleep(0.5)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
-
-def beverages_to_cups():
-   # TODO: Implement driving to cups (needs cooperation with bartender)
-   ...
+   await drive_to_line(95, 100, stop=False)
+   await motion.drive(95, 100, 0.5)
 
+async def beverages_to_cups():
    # It is assumed that this script starts right after dropping the bottles, with the assistant hugging the beverage station wall
 
+   # Wait for the bartender to bring the cups
+   await wait_for_peer("cups_placed", CUPS_TIMEOUT)
+
    # Distance from wall
-   k.motor(LEFT_MOTOR, 100)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(0.5)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(100, 100, 0.5)
 
    # Turn towards place where cups will be (brought by the bartender)
-   k.motor(LEFT_MOTOR, -100)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(0.4)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-100, 100, 0.4)
 
    # Drive to cups
-   k.motor(LEFT_MOTOR, 100)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(4)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(100, 100, 4)
 
    # Turn to face the cups
-   k.motor(LEFT_MOTOR, -100)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(0.25)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-100, 100, 0.25)
 
-def ice_cups():
+async def ice_cups():
    # Drop ice poms into cups
    ...
 
    # It is assumed that this script starts when the robot is hugging the beverage wall, with the cups in there next to each other
 
    # Drive backwards so shovel is ontop the cups
-   k.motor(LEFT_MOTOR, -85)
-   k.motor(RIGHT_MOTOR, -100)
-   time.sleep(0.5)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-85, -100, 0.5)
 
    # Lower shovel to cups
-   for i in range(10):
-      k.set_servo_position(ARM_SERVO, 1650 - i * 58)
-      time.sleep(0.1)
+   await motion.servo_move({ARM_SERVO: 1128}, 1.0)
 
    # Shake to get ice poms out of the shovel
    for i in range(30):
       # k.set_servo_position(ARM_SERVO, k.get_servo_position(ARM_SERVO) + 75)
-      k.motor(LEFT_MOTOR, 20)
-      k.motor(RIGHT_MOTOR, -20)
-      time.sleep(0.1)
+      await motion.turn(20, 0.1, stop=False)
       # k.set_servo_position(ARM_SERVO, k.get_servo_position(ARM_SERVO) - 75)
-      k.motor(LEFT_MOTOR, -20)
-      k.motor(RIGHT_MOTOR, 20)
-      time.sleep(0.1)
+      await motion.turn(-20, 0.1, stop=False)
 
-def start_to_bottles():
+async def start_to_bottles():
    # It is assumed that this routine starts with the assistant at its start position 3 cm from the wall
 
    # Turn to middle
-   k.motor(LEFT_MOTOR, 100)
-   k.motor(RIGHT_MOTOR, -100)
-   time.sleep(0.85)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(100, -100, 0.85)
 
    # Drive to center line
-   k.motor(LEFT_MOTOR, -85)
-   k.motor(RIGHT_MOTOR, -100)
-   wait_for_line()
-   wait_for_floor()
-   wait_for_line()
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await drive_to_line(-85, -100, stop=False)
+   await drive_to_floor(-85, -100, stop=False)
+   await drive_to_line(-85, -100)
 
    # Equalize overshoot
-   k.motor(LEFT_MOTOR, 100)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(0.3)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(100, 100, 0.3)
    
    # Turn to center
-   k.motor(LEFT_MOTOR, -100)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(0.75)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-100, 100, 0.75)
    
    # Follow middle line to center cross
-   while True:
-      if normalize_brightness(k.analog(LEFT_SENSOR)) == 1 and normalize_brightness(k.analog(RIGHT_SENSOR)) == 1:
-         k.motor(LEFT_MOTOR, 0)
-         k.motor(RIGHT_MOTOR, 0)
-         break
-      else:
-         line_follow(speed=80)
-   while True:
-      if normalize_brightness(k.analog(LEFT_SENSOR)) == 1 and normalize_brightness(k.analog(RIGHT_SENSOR)) == 1:
-         k.motor(LEFT_MOTOR, 0)
-         k.motor(RIGHT_MOTOR, 0)
-         break
-      else:
-         line_follow(speed=80)
+   await follow(cross=True, speed=80)
+   await follow(cross=True, speed=80)
    
    # Turn around to line-follow back to bottles
-   k.motor(LEFT_MOTOR, -100)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(1.4)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-100, 100, 1.4)
 
    # Follow line back to bottles
-   follow_time = 0
-   while follow_time < 0.77:
-      line_follow(speed=50)
-      time.sleep(0.001)
-      follow_time += 0.001
+   await follow(0.77, speed=50, stop=False)
 
    # Face fork to bottles
-   k.motor(LEFT_MOTOR, -100)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(0.82)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-100, 100, 0.82)
 
    # Fork up
    k.set_servo_position(FORK_SERVO, 1200)
 
    # Hug wall to get straight
-   k.motor(LEFT_MOTOR, -45)
-   k.motor(RIGHT_MOTOR, -50)
-   time.sleep(2)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-45, -50, 2)
 
-def beverages_to_ice():
+async def beverages_to_ice():
    # Drive from middle line infront of beverages to wall infront of ice
    ...
 
@@ -580,51 +460,27 @@ def beverages_to_ice():
    k.set_servo_position(FORK_SERVO, 1600)
 
    # Turn to face along the middle line
-   k.motor(LEFT_MOTOR, -100)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(0.9)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-100, 100, 0.9)
 
    # Follow middle line for some time
-   follow_time = 0
-   while follow_time < 0.87:
-      line_follow()
-      time.sleep(0.001)
-      follow_time += 0.001
+   await follow(0.87, stop=False)
    
    # Turn to drive to drinks & ice
-   k.motor(LEFT_MOTOR, 100)
-   k.motor(RIGHT_MOTOR, -100)
-   time.sleep(0.82)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(100, -100, 0.82)
 
    # Drive to drinks & ice
-   k.motor(LEFT_MOTOR, 85)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(2.4)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(85, 100, 2.4)
 
    # Lower fork to avoid collisions
    k.set_servo_position(FORK_SERVO, 200)
 
    # Turn towards ice
-   k.motor(LEFT_MOTOR, 100)
-   k.motor(RIGHT_MOTOR, -100)
-   time.sleep(0.77)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(100, -100, 0.77)
 
    # Hug wall to get straight
-   k.motor(LEFT_MOTOR, 85)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(1.5)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(85, 100, 1.5)
 
-def ice_to_beverages():
+async def ice_to_beverages():
    # Drive from ice to beverages with ice
    ...
 
@@ -635,146 +491,76 @@ def ice_to_beverages():
    k.set_servo_position(TOOL_SERVO, 1450)
    
    # Back off from ice poms
-   k.motor(LEFT_MOTOR, -85)
-   k.motor(RIGHT_MOTOR, -100)
-   time.sleep(0.2)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-85, -100, 0.2)
 
    # Turn to main space
-   k.motor(LEFT_MOTOR, -100)
-   k.motor(RIGHT_MOTOR, 95)
-   time.sleep(0.8)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-100, 95, 0.8)
 
    # Lift fork up again to avoid collisions
    k.set_servo_position(FORK_SERVO, 1600)
 
    # Drive out a bit
-   k.motor(LEFT_MOTOR, -85)
-   k.motor(RIGHT_MOTOR, -100)
-   time.sleep(0.3)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-85, -100, 0.3)
 
    # Turn around for better mobility
-   k.motor(LEFT_MOTOR, 100)
-   k.motor(RIGHT_MOTOR, -95)
-   time.sleep(1.65)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(100, -95, 1.65)
 
    # Go back out of way
-   k.motor(LEFT_MOTOR, -85)
-   k.motor(RIGHT_MOTOR, -100)
-   time.sleep(0.5)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-85, -100, 0.5)
 
    # Wait for bartender to put second cup into beverage station (fork is kept down for this)
-   time.sleep(35)
+   await wait_for_peer("cups_placed", CUPS_TIMEOUT)
 
    # Drive to middle line and a bit further
-   k.motor(LEFT_MOTOR, 85)
-   k.motor(RIGHT_MOTOR, 100)
-   wait_for_line()
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await drive_to_line(85, 100)
    
    # Drive on line
-   k.motor(LEFT_MOTOR, 85)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(0.3)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(85, 100, 0.3)
 
    # Turn to face along middle line
-   k.motor(LEFT_MOTOR, -100)
-   k.motor(RIGHT_MOTOR, 95)
-   time.sleep(0.4)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-100, 95, 0.4)
 
    # Drive along middle line
-   follow_time = 0
-   while follow_time < 0.5:
-      line_follow()
-      time.sleep(0.001)
-      follow_time += 0.001
+   await follow(0.5, stop=False)
 
    # Turn to beverage station
-   k.motor(LEFT_MOTOR, 100)
-   k.motor(RIGHT_MOTOR, -95)
-   time.sleep(0.8)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(100, -95, 0.8)
 
    # Hug wall
-   k.motor(LEFT_MOTOR, 85)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(2)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(85, 100, 2)
 
-def push_poms():
+async def push_poms():
    # Back off from beverage station to make space for bartender, and push poms to condiment station
    ...
 
    # It is assumed that this routine starts right after the icing the cups, with the robot infront of the beverage station
 
    # Back off to middle line
-   k.motor(LEFT_MOTOR, -85)
-   k.motor(RIGHT_MOTOR, -100)
-   wait_for_line()
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await drive_to_line(-85, -100)
+
+   # Out of the bartender's way
+   channel.signal("beverages_clear")
 
    # Correct overshoot
-   k.motor(LEFT_MOTOR, 85)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(0.3)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(85, 100, 0.3)
 
    # Turn to face along middle line
-   k.motor(LEFT_MOTOR, -100)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(0.7)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-100, 100, 0.7)
 
    # Put shovel down
    k.set_servo_position(ARM_SERVO, 800)
    k.set_servo_position(TOOL_SERVO, 1800)
 
    # Follow middle line over center cross
-   follow_time = 0
-   while follow_time < 1.5:
-      line_follow()
-      time.sleep(0.001)
-      follow_time += 0.001
+   await follow(1.5, stop=False)
    # Drive along middle line to right cross
-   while True:
-      line_follow()
-      if normalize_brightness(k.analog(LEFT_SENSOR)) == 1 and normalize_brightness(k.analog(RIGHT_SENSOR)) == 1:
-         break
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await follow(cross=True)
 
    # Turn to face condiment station
-   k.motor(LEFT_MOTOR, -100)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(0.3)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(-100, 100, 0.3)
 
    # Push poms into condiment station
-   k.motor(LEFT_MOTOR, 85)
-   k.motor(RIGHT_MOTOR, 100)
-   time.sleep(1)
-   k.motor(LEFT_MOTOR, 0)
-   k.motor(RIGHT_MOTOR, 0)
+   await motion.drive(85, 100, 1)
 
 def off(wait_time: float = 0, double: bool = True):
    # This function stops all actions of the robot after wait_time, and is meant to be called to end the game
@@ -794,55 +580,104 @@ def off(wait_time: float = 0, double: bool = True):
 
    os._exit(0)
 
+def mission_steps() -> dict:
+   # Steps the mission file can use, the routines are steps as well
+   steps = {
+      "drive": motion.drive,
+      "turn": motion.turn,
+      "servo": motion.servo_move,
+      "set_servo": k.set_servo_position,
+      "wait_for_line": drive_to_line,
+      "wait_for_floor": drive_to_floor,
+      "follow_line": follow,
+      "sleep": asyncio.sleep,
+      "signal": channel.signal,
+      "wait_for_peer": wait_for_peer,
+   }
+   for routine in (start_to_ice, ice_to_bottles, start_to_bottles, grab_bottles, drop_bottles, beverages_to_ice,
+                   shovel_ice, ice_to_beverages, beverages_to_cups, ice_cups, push_poms):
+      steps[routine.__name__] = routine
+   return steps
+
+def load_mission(path: str = MISSION_FILE) -> Mission:
+   # The numeric constants of this file (ports, thresholds) can be used in the mission's expressions
+   constants = {name: value for name, value in globals().items() if name.isupper() and isinstance(value, (int, float))}
+   return Mission(path, mission_steps(), constants)
+
+def match_scheduler() -> Scheduler:
+   # Skips or cuts low-priority phases so the later high-priority ones still fit into the match, cut phases stop the motors
+   return Scheduler(MATCH_TIME, PROFILE_DIR, halt=k.ao, estimates=measured_estimates(PROFILE_DIR))
+
+def initial_positions():
+   k.set_servo_position(ARM_SERVO, 1800)
+   k.set_servo_position(TOOL_SERVO, 2000)
+   k.set_servo_position(FORK_SERVO, 1500)
+
 def routine():
    # This is the function meant to be run during the game
 
+   # Compile the mission before the game, so mistakes in it show up now
+   mission = load_mission()
+
    # Enable servos, signaling game start
    k.enable_servos()
 
    # Initial positions
-   k.set_servo_position(ARM_SERVO, 1800)
-   k.set_servo_position(TOOL_SERVO, 2000)
-   k.set_servo_position(FORK_SERVO, 1500)
+   initial_positions()
+
+   # Let the bartender know about this run before the game starts
+   channel.start()
 
    # Wait for starting light
+   sensors.start()
    print("Awaiting starting light...")
-   while k.digital(START_LIGHT) == 0:
-      time.sleep(0.00000001)
+   sensors.wait_until(lambda snapshot: snapshot.digital[START_LIGHT] != 0)
    print("Starting light received!")
    
    # Create and start timer for stopping the robot on time
-   timer = threading.Thread(target=off, kwargs={"wait_time": 119})
+   timer = threading.Thread(target=off, kwargs={"wait_time": MATCH_TIME})
    timer.start()
 
    # Execute game plan
-   start_to_bottles()
-   grab_bottles()
-   bottles_to_beverages()
-   drop_bottles()
-   beverages_to_ice()
-   shovel_ice()
-   ice_to_beverages()
-   ice_cups()
-   # TODO: Wait for Bartender to pass might be necessary
-   push_poms()
+   asyncio.run(mission.run(match_scheduler()))
 
 def test():
    k.enable_servos()
+   sensors.start()
 
    # Initial positions
-   k.set_servo_position(ARM_SERVO, 1800)
-   k.set_servo_position(TOOL_SERVO, 2000)
-   k.set_servo_position(FORK_SERVO, 1500)
+   initial_positions()
 
    time.sleep(3)
 
    # Functions/routines to test
-   grab_bottles()
-   time.sleep(1)
-   drop_bottles()
+   async def steps():
+      await grab_bottles()
+      await asyncio.sleep(1)
+      await drop_bottles()
+
+   asyncio.run(steps())
+
+def rehearsal():
+   # Run the mission again every time mission.yaml changes (synced while this keeps running), without the start light and timer
+   k.enable_servos()
+   sensors.start()
+
+   def prepare():
+      k.ao()
+      # A new run of the channel, so events of the last rehearsal run are not taken as this one's
+      channel.stop()
+      channel.start()
+      initial_positions()
+      time.sleep(3)
+
+   rehearse(load_mission(), prepare, match_scheduler())
 
 def main():
+   if "--rehearse" in sys.argv:
+      rehearsal()
+      return
+
    routine()
 
    # test()
@@ -0,0 +1,232 @@
+import array
+import json
+import mmap
+import os
+import struct
+import threading
+from datetime import datetime
+
+# CONSTANTS
+
+# Every record: seconds since the run started (monotonic) and length of the utf-8 line that follows
+RECORD = struct.Struct("<dI")
+# A checkpoint (offset into the data file) is stored every CHECKPOINT lines of a run
+CHECKPOINT = 256
+
+DATA_FILE = "runs.log"
+INDEX_FILE = "runs.idx"
+CHECKPOINT_FILE = "runs.lines"
+
+
+class SessionRecorder:
+    """
+    Appends the output of every run to a compact binary log.
+
+    Three append-only files are written to the directory:
+      runs.log   - the lines of all runs as (elapsed, length, utf-8 text) records
+      runs.idx   - one JSON line at the start and one at the end of every run (status, offsets, line count)
+      runs.lines - the data offset of every CHECKPOINT-th line of a run, to jump into long runs quickly
+    A run without an end entry was cut off (e.g. the UI was killed) and is shown as incomplete.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.data = open(os.path.join(directory, DATA_FILE), "ab", buffering=64 * 1024)
+        self.index = open(os.path.join(directory, INDEX_FILE), "a")
+        self.checkpoints = open(os.path.join(directory, CHECKPOINT_FILE), "ab")
+        self.lock = threading.Lock()
+        self.run = sum(1 for entry in read_index(directory) if entry["event"] == "start")
+        self.active = False
+        self.lines = 0
+        self.last_elapsed = 0.0
+
+    def _write_index(self, entry: dict) -> None:
+        self.index.write(json.dumps(entry) + "\n")
+        self.index.flush()
+
+    def start_run(self, script: str) -> int:
+        """Start recording a new run, returns its number."""
+        with self.lock:
+            if self.active:
+                self._end_run("incomplete")
+            self.active = True
+            self.lines = 0
+            self.last_elapsed = 0.0
+            self._write_index({
+                "event": "start",
+                "run": self.run,
+                "script": script,
+                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "offset": self.data.tell(),
+                "checkpoint": self.checkpoints.tell() // 8,
+            })
+            return self.run
+
+    def record(self, elapsed: float, lines: list[str]) -> None:
+        """
+        Parameters:
+          elapsed (float): Seconds since the start of the run (monotonic clock).
+          lines (list[str]): Lines without timestamp, with or without trailing newline.
+        """
+        with self.lock:
+            if not self.active:
+                return
+            self.last_elapsed = elapsed
+            for line in lines:
+                if self.lines % CHECKPOINT == 0:
+                    self.checkpoints.write(struct.pack("<Q", self.data.tell()))
+                encoded = line.rstrip("\n").encode(errors="replace")
+                self.data.write(RECORD.pack(elapsed, len(encoded)) + encoded)
+                self.lines += 1
+
+    def flush(self) -> None:
+        """Write buffered lines to disk, so a viewer sees the run that is still going."""
+        with self.lock:
+            self.data.flush()
+            self.checkpoints.flush()
+
+    def _end_run(self, status: str, startup: float = None) -> None:
+        self.data.flush()
+        self.checkpoints.flush()
+        self._write_index({
+            "event": "end",
+            "run": self.run,
+            "status": status,
+            "offset": self.data.tell(),
+            "lines": self.lines,
+            "duration": self.last_elapsed,
+            "startup": startup,
+        })
+        self.active = False
+        self.run += 1
+
+    def end_run(self, status: str, startup: float = None) -> None:
+        """
+        Finish the current run.
+
+        Parameters:
+          status (str): How the run ended, such as "finished" or "interrupted".
+          startup (float): Seconds from starting the run to its first output, if known.
+        """
+        with self.lock:
+            if self.active:
+                self._end_run(status, startup)
+
+    def close(self) -> None:
+        self.end_run("window closed")
+        self.data.close()
+        self.index.close()
+        self.checkpoints.close()
+
+
+def read_index(directory: str) -> list[dict]:
+    path = os.path.join(directory, INDEX_FILE)
+    if not os.path.isfile(path):
+        return []
+    with open(path, "r") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+class SessionArchive:
+    """
+    Read access to the runs written by a SessionRecorder. The data file is memory mapped and only
+    the requested lines are decoded, so opening a run with 100k lines costs the same as a short one.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.map = None
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Reload the index and remap the data file, e.g. after more runs were recorded."""
+        self.close()
+        runs = {}
+        for entry in read_index(self.directory):
+            if entry["event"] == "start":
+                runs[entry["run"]] = dict(entry, status="incomplete", end=None, lines=None, duration=None, startup=None)
+            elif entry["run"] in runs:
+                runs[entry["run"]].update(status=entry["status"], end=entry["offset"], lines=entry["lines"],
+                                          duration=entry["duration"], startup=entry.get("startup"))
+        self.runs = [runs[number] for number in sorted(runs)]
+
+        data_path = os.path.join(self.directory, DATA_FILE)
+        if os.path.isfile(data_path) and os.path.getsize(data_path) > 0:
+            with open(data_path, "rb") as file:
+                self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.checkpoints = array.array("Q")
+        checkpoint_path = os.path.join(self.directory, CHECKPOINT_FILE)
+        if os.path.isfile(checkpoint_path):
+            with open(checkpoint_path, "rb") as file:
+                self.checkpoints.frombytes(file.read())
+
+        # Runs that were cut off end where the next run starts
+        for run, following in zip(self.runs, self.runs[1:] + [None]):
+            if run["end"] is None:
+                run["end"] = following["offset"] if following else (len(self.map) if self.map else run["offset"])
+
+    def _scan(self, offset: int, end: int, count: int) -> tuple[list[tuple[float, str]], int]:
+        lines = []
+        while offset + RECORD.size <= end and len(lines) < count:
+            elapsed, length = RECORD.unpack_from(self.map, offset)
+            offset += RECORD.size
+            if offset + length > end:
+                # Record cut off by a crash
+                break
+            lines.append((elapsed, self.map[offset:offset + length].decode(errors="replace")))
+            offset += length
+        return lines, offset
+
+    def line_count(self, run: dict) -> int:
+        if run["lines"] is None:
+            # Count a cut off run once, starting from its last checkpoint
+            checkpoints = self._checkpoints_of(run)
+            if checkpoints:
+                start = self.checkpoints[run["checkpoint"] + checkpoints - 1]
+                before = (checkpoints - 1) * CHECKPOINT
+            else:
+                start = run["offset"]
+                before = 0
+            counted, _ = self._scan(start, run["end"], float("inf"))
+            run["lines"] = before + len(counted)
+        return run["lines"]
+
+    def _checkpoints_of(self, run: dict) -> int:
+        following = [other["checkpoint"] for other in self.runs if other["run"] > run["run"]]
+        end = following[0] if following else len(self.checkpoints)
+        return max(0, end - run["checkpoint"])
+
+    def read_lines(self, run: dict, first: int, count: int) -> list[tuple[float, str]]:
+        """
+        Read a window of lines of a run.
+
+        Parameters:
+          run (dict): The run, as found in runs.
+          first (int): Number of the first line to read.
+          count (int): How many lines to read at most.
+
+        Returns:
+          list[tuple[float, str]]: The elapsed seconds and text of every line.
+        """
+        if self.map is None or count <= 0:
+            return []
+        checkpoint = first // CHECKPOINT
+        if checkpoint < self._checkpoints_of(run):
+            offset = self.checkpoints[run["checkpoint"] + checkpoint]
+            skip = first - checkpoint * CHECKPOINT
+        else:
+            offset = run["offset"]
+            skip = first
+        # Skip to the first line without decoding the ones before it
+        end = run["end"]
+        while skip and offset + RECORD.size <= end:
+            _, length = RECORD.unpack_from(self.map, offset)
+            offset += RECORD.size + length
+            skip -= 1
+        lines, _ = self._scan(offset, end, count)
+        return lines
+
+    def close(self) -> None:
+        if self.map is not None:
+            self.map.close()
+            self.map = None
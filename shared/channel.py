@@ -0,0 +1,282 @@
+#!/usr/bin/python3
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+# CONSTANTS
+
+CHANNEL_PORT = 8091
+# Broadcast on the network both robots are in, or the address of the other robot
+PEER_ADDRESS = "255.255.255.255"
+# Seconds between repeated announcements, a lost datagram is made up by the next one
+RESEND_INTERVAL = 0.2
+MAX_DATAGRAM = 65507
+
+
+class UdpTransport:
+    """
+    Datagrams between the robots, received in a background thread.
+
+    Parameters:
+      port (int): Port both robots send to and listen on.
+      peer (str): Address sent to, the broadcast address reaches every robot of the network.
+    """
+
+    def __init__(self, port: int = CHANNEL_PORT, peer: str = PEER_ADDRESS):
+        self.port = port
+        self.peer = peer
+        self.socket = None
+
+    def open(self, receive) -> None:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.bind(("", self.port))
+        sock.settimeout(0.5)
+        self.socket = sock
+        threading.Thread(target=self._listen, args=(sock, receive), daemon=True).start()
+
+    def _listen(self, sock: socket.socket, receive) -> None:
+        while self.socket is sock:
+            try:
+                data, _ = sock.recvfrom(MAX_DATAGRAM)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            receive(data)
+
+    def send(self, data: bytes) -> None:
+        sock = self.socket
+        if sock is None:
+            return
+        try:
+            sock.sendto(data, (self.peer, self.port))
+        except OSError:
+            # No network (yet), the next announcement tries again
+            pass
+
+    def close(self) -> None:
+        sock, self.socket = self.socket, None
+        if sock is not None:
+            sock.close()
+
+
+class Loopback:
+    """
+    In-process stand-in for the network, to run both robots' coordination on one computer. Every
+    transport of it delivers what it sends to all the others, in the sending thread.
+    """
+
+    def __init__(self):
+        self.transports = []
+
+    def transport(self) -> "LoopbackTransport":
+        return LoopbackTransport(self)
+
+
+class LoopbackTransport:
+    def __init__(self, loopback: Loopback):
+        self.loopback = loopback
+        self.receive = None
+
+    def open(self, receive) -> None:
+        self.receive = receive
+        self.loopback.transports = self.loopback.transports + [self]
+
+    def send(self, data: bytes) -> None:
+        for transport in self.loopback.transports:
+            if transport is not self:
+                transport.receive(data)
+
+    def close(self) -> None:
+        self.loopback.transports = [transport for transport in self.loopback.transports if transport is not self]
+
+
+class Channel:
+    """
+    Named events and shared values between the robots. Every datagram announces everything this
+    robot has signalled and set so far, sent at once on a change and repeated every resend
+    seconds, so there are no acknowledgements and lost datagrams do not matter. Each start is a
+    new run that begins with nothing heard, what a peer announced in an earlier run of its own is
+    forgotten once its new run is heard from. Late datagrams of an earlier run are ignored, runs
+    are ordered by the wall clock time they started at.
+
+    Parameters:
+      name (str): This robot, e.g. "janitor".
+      transport: UdpTransport (the default) or a Loopback transport.
+      resend (float): Seconds between repeated announcements.
+    """
+
+    def __init__(self, name: str, transport=None, resend: float = RESEND_INTERVAL):
+        self.name = name
+        self.transport = transport or UdpTransport()
+        self.resend = resend
+        self.run = None
+        self.start_time = None
+        self.started = None
+        self.sequence = 0
+        self.events = {}
+        self.values = {}
+        self.peers = {}
+        self.waiters = []
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    def start(self) -> "Channel":
+        if self.running:
+            return self
+        with self.condition:
+            self.run = os.urandom(4).hex()
+            self.start_time = time.monotonic()
+            # Comparable with the other robot's runs, unlike the monotonic clock
+            self.started = time.time()
+            self.events = {}
+            self.values = {}
+            self.peers = {}
+            self.waiters = []
+            self.running = True
+        self.transport.open(self._receive)
+        self.thread = threading.Thread(target=self._repeat, daemon=True)
+        self.thread.start()
+        return self
+
+    def signal(self, event: str) -> None:
+        """Tell the other robots that a milestone was reached, e.g. "cups_placed"."""
+        with self.condition:
+            self.events[event] = round(time.monotonic() - self.start_time, 3)
+        print(f"Signalled {event}")
+        self._announce()
+
+    def set(self, key: str, value) -> None:
+        """Share a value (anything JSON can hold), the latest one counts."""
+        with self.condition:
+            self.values[key] = value
+        self._announce()
+
+    def get(self, key: str, default=None):
+        """Returns a value shared by another robot."""
+        with self.condition:
+            for peer in self.peers.values():
+                if key in peer["values"]:
+                    return peer["values"][key]
+        return default
+
+    def heard(self, event: str) -> bool:
+        with self.condition:
+            return self._heard(event)
+
+    def wait(self, event: str, timeout: float = None) -> bool:
+        """
+        Block until another robot signalled the event (returns at once if it already did).
+
+        Parameters:
+          event (str): The event.
+          timeout (float): Seconds to wait at most, None waits forever.
+
+        Returns:
+          bool: False if the event did not come in time.
+        """
+        self._check_running()
+        with self.condition:
+            heard = self.condition.wait_for(lambda: self._heard(event) or not self.running, timeout)
+            if heard and self._heard(event):
+                return True
+        print(f"No {event} from the other robot within {timeout} s")
+        return False
+
+    def next(self, event: str) -> asyncio.Future:
+        """
+        Returns a future of the running event loop, resolved once another robot signalled the
+        event (at once if it already did). Await it, or pass it to Motion.drive(until=...).
+        """
+        self._check_running()
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        with self.condition:
+            if self._heard(event):
+                future.set_result(True)
+            else:
+                self.waiters = self.waiters + [(event, loop, future)]
+        return future
+
+    def _check_running(self) -> None:
+        if not self.running:
+            raise RuntimeError(f"Channel {self.name} is not started, nothing from the other robot can arrive")
+
+    def _heard(self, event: str) -> bool:
+        return any(event in peer["events"] for peer in self.peers.values())
+
+    def _announce(self) -> None:
+        with self.condition:
+            self.sequence += 1
+            message = {"from": self.name, "run": self.run, "started": self.started, "sequence": self.sequence,
+                       "events": self.events, "values": self.values}
+            data = json.dumps(message).encode()
+        self.transport.send(data)
+
+    def _repeat(self) -> None:
+        # Ends with stop(), or once a restart replaced this thread
+        while self.running and self.thread is threading.current_thread():
+            self._announce()
+            time.sleep(self.resend)
+
+    def _receive(self, data: bytes) -> None:
+        try:
+            message = json.loads(data)
+            sender, run, sequence = message["from"], message["run"], message["sequence"]
+            started = float(message["started"])
+            events = dict(message["events"])
+        except (ValueError, KeyError, TypeError):
+            return
+        if sender == self.name:
+            # Our own broadcast
+            return
+        with self.condition:
+            peer = self.peers.get(sender)
+            if peer is not None and peer["run"] == run and peer["sequence"] >= sequence:
+                # Reordered, an older announcement
+                return
+            if peer is not None and peer["run"] != run and peer["started"] > started:
+                # Sent by the peer's previous run before it restarted, arriving late
+                return
+            if peer is None or peer["run"] != run:
+                print(f"{sender} started (run {run})")
+            self.peers[sender] = message
+            ready = [(loop, future) for event, loop, future in self.waiters if event in events]
+            self.waiters = [waiter for waiter in self.waiters if waiter[0] not in events and not waiter[2].done()]
+            self.condition.notify_all()
+        for loop, future in ready:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def stop(self) -> None:
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.transport.close()
+
+
+def _resolve(future: asyncio.Future) -> None:
+    # Might have been cancelled by a timeout meanwhile
+    if not future.done():
+        future.set_result(True)
+
+
+if __name__ == "__main__":
+    # Print what the robots announce, to check the network between them
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("", int(sys.argv[1]) if len(sys.argv) > 1 else CHANNEL_PORT))
+    latest = {}
+    while True:
+        data, address = sock.recvfrom(MAX_DATAGRAM)
+        message = json.loads(data)
+        shown = (message["run"], message["events"], message["values"])
+        if latest.get(message["from"]) != shown:
+            latest[message["from"]] = shown
+            print(f"{message['from']} ({address[0]}, run {message['run']}): events {message['events']}, values {message['values']}")
@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+import time
+
+# CONSTANTS
+
+# Default rate of control loops in Hz
+LOOP_RATE = 200
+
+
+class LoopStats:
+    """Timing of one run of a ControlLoop: achieved frequency and how late the iterations woke up."""
+
+    def __init__(self, period: float):
+        self.period = period
+        self.iterations = 0
+        self.overruns = 0
+        self.start = time.monotonic()
+        self.end = self.start
+        self.max_jitter = 0.0
+        self.total_jitter = 0.0
+
+    def add(self, jitter: float) -> None:
+        self.iterations += 1
+        self.total_jitter += jitter
+        self.max_jitter = max(self.max_jitter, jitter)
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    @property
+    def frequency(self) -> float:
+        return self.iterations / self.duration if self.duration > 0 else 0.0
+
+    def __str__(self) -> str:
+        mean = self.total_jitter / self.iterations if self.iterations else 0.0
+        return (f"{self.iterations} iterations in {self.duration:.3f} s ({self.frequency:.0f} Hz of {1 / self.period:.0f} Hz), "
+                f"jitter mean {mean * 1000:.2f} ms, max {self.max_jitter * 1000:.2f} ms, {self.overruns} overruns")
+
+
+class ControlLoop:
+    """
+    Calls a step function at a fixed rate. Every iteration has a deadline on the monotonic clock
+    (start + n * period), so slow iterations do not shift the ones after them. If an iteration
+    overruns a whole period, the missed deadlines are skipped instead of run back to back.
+
+    Parameters:
+      rate (float): Iterations per second.
+    """
+
+    def __init__(self, rate: float = LOOP_RATE):
+        self.period = 1 / rate
+
+    def run(self, step, duration: float = None, until=None, timeout: float = None) -> LoopStats:
+        """
+        Run the loop until the duration has passed, until() is true or the step returns True.
+
+        Parameters:
+          step (callable): Called as step(elapsed, dt) with the seconds since the start and since the last call.
+          duration (float): Seconds to run for, measured on the monotonic clock.
+          until (callable): Checked before every step, the loop ends once it returns True.
+          timeout (float): Seconds after which an until loop gives up (ends like a finished duration).
+
+        Returns:
+          LoopStats: Iterations, achieved frequency and jitter of this run.
+        """
+        end = duration if duration is not None else timeout
+        stats = LoopStats(self.period)
+        start = stats.start
+        deadline = start
+        last = start
+        while True:
+            now = time.monotonic()
+            elapsed = now - start
+            if end is not None and elapsed >= end:
+                break
+            if until is not None and until():
+                break
+            stats.add(now - deadline)
+            if step(elapsed, now - last):
+                break
+            last = now
+
+            deadline += self.period
+            now = time.monotonic()
+            if now > deadline + self.period:
+                # Overran at least one whole period, continue from the next deadline still ahead
+                missed = int((now - deadline) / self.period)
+                stats.overruns += missed
+                deadline += missed * self.period
+            if deadline > now:
+                time.sleep(deadline - now)
+        stats.end = time.monotonic()
+        return stats
+
+
+class PID:
+    """
+    PID controller with output limits and anti-windup (the integral stops growing while the output is saturated).
+
+    Parameters:
+      kp, ki, kd (float): Gains of the proportional, integral and derivative term.
+      limit (float): The output is clamped to [-limit, limit].
+    """
+
+    def __init__(self, kp: float, ki: float = 0.0, kd: float = 0.0, limit: float = 1.0):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.limit = limit
+        self.reset()
+
+    def reset(self) -> None:
+        self.integral = 0.0
+        self.last_error = None
+
+    def update(self, error: float, dt: float) -> float:
+        derivative = 0.0
+        if self.last_error is not None and dt > 0:
+            derivative = (error - self.last_error) / dt
+        self.last_error = error
+
+        output = self.kp * error + self.ki * (self.integral + error * dt) + self.kd * derivative
+        if -self.limit < output < self.limit:
+            self.integral += error * dt
+        return max(-self.limit, min(self.limit, output))
@@ -0,0 +1,185 @@
+#!/usr/bin/python3
+import asyncio
+import threading
+
+# CONSTANTS
+
+RISING = "rising"
+FALLING = "falling"
+# Samples a new state has to hold before it counts (1 reacts on the first sample past the threshold)
+DEBOUNCE_SAMPLES = 2
+
+
+class Threshold:
+    """
+    Hysteresis on one analog port: the state turns high once the value reaches high, and low once
+    it drops to low. Values in between keep the state. A new state counts after debounce samples.
+
+    Parameters:
+      port (int): The analog port.
+      high (float): Value at or above which the state is high.
+      low (float): Value at or below which the state is low.
+      debounce (int): Consecutive samples a new state has to hold.
+    """
+
+    def __init__(self, port: int, high: float, low: float, debounce: int = DEBOUNCE_SAMPLES):
+        if low > high:
+            raise ValueError(f"Threshold of port {port}: low {low} is above high {high}")
+        self.port = port
+        self.high = high
+        self.low = low
+        self.debounce = debounce
+        self.state = None
+        self.candidate = None
+        self.count = 0
+
+    def update(self, snapshot) -> bool:
+        value = snapshot.analog[self.port]
+        if value >= self.high:
+            target = True
+        elif value <= self.low:
+            target = False
+        else:
+            target = self.state
+        if target == self.state:
+            self.count = 0
+            return self.state
+        if target == self.candidate:
+            self.count += 1
+        else:
+            self.candidate = target
+            self.count = 1
+        # The first state is taken right away, there is nothing to debounce against
+        if self.count >= self.debounce or self.state is None:
+            self.state = target
+            self.count = 0
+        return self.state
+
+
+class Edge:
+    """
+    State of a group of thresholds: high once all of them are high, low once all of them are low.
+    A rising edge is the change from low to high, a falling edge the change back.
+    """
+
+    def __init__(self, name: str, thresholds: list[Threshold]):
+        self.name = name
+        self.thresholds = thresholds
+        self.state = None
+
+    def update(self, snapshot) -> str:
+        states = [threshold.update(snapshot) for threshold in self.thresholds]
+        if all(state is True for state in states):
+            state = True
+        elif all(state is False for state in states):
+            state = False
+        else:
+            state = self.state
+        if state is None or state == self.state:
+            return None
+        previous, self.state = self.state, state
+        if previous is None:
+            return None
+        return RISING if state else FALLING
+
+
+class EdgeMonitor:
+    """
+    Detects edges on the samples of a SensorHub, in its sampling thread, so an edge is seen in the
+    sample that completes it. Callers either block in wait() (sleeping on a condition, no polling) or
+    register callbacks with on().
+
+    That sample is not the first one past the threshold: the hub's median filter lags a step by
+    median // 2 samples and every threshold needs debounce samples. With the defaults (median of
+    3, debounce 2, 500 Hz) an edge is reported 2 to 3 samples, 4 to 6 ms, after the sensor crossed.
+    Thresholds with debounce=1 on a hub with median=1 react on the first sample past the threshold.
+
+    Parameters:
+      hub (SensorHub): The hub whose samples are watched.
+    """
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.edges = {}
+        self.counts = {}
+        self.snapshots = {}
+        self.callbacks = {}
+        self.condition = threading.Condition()
+        hub.add_listener(self._update)
+
+    def add(self, name: str, thresholds: list[Threshold]) -> None:
+        """Watch a group of thresholds as one edge, e.g. both line sensors."""
+        for edge in (RISING, FALLING):
+            self.counts[(name, edge)] = 0
+            self.callbacks[(name, edge)] = []
+        self.edges = dict(self.edges, **{name: Edge(name, thresholds)})
+
+    def state(self, name: str) -> bool:
+        """True if the group is high, False if it is low, None before its first clear sample."""
+        return self.edges[name].state
+
+    def on(self, name: str, edge: str, callback) -> None:
+        """Call callback(snapshot) on every such edge, in the sampling thread (so it must be quick)."""
+        self.callbacks[(name, edge)] = self.callbacks[(name, edge)] + [callback]
+
+    def next(self, name: str, edge: str) -> asyncio.Future:
+        """
+        Returns a future of the running event loop, resolved with the snapshot of the next such edge
+        after the call. Await it, or pass it to Motion.drive(until=...).
+        """
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        key = (name, edge)
+
+        def resolve(snapshot) -> None:
+            # Might have been cancelled by a timeout meanwhile
+            if not future.done():
+                future.set_result(snapshot)
+
+        def fire(snapshot) -> None:
+            forget()
+            loop.call_soon_threadsafe(resolve, snapshot)
+
+        def forget(*_) -> None:
+            self.callbacks[key] = [callback for callback in self.callbacks[key] if callback is not fire]
+
+        self.on(name, edge, fire)
+        # A timed out or cancelled future does not wait for the edge any longer
+        future.add_done_callback(forget)
+        return future
+
+    def _update(self, snapshot) -> None:
+        for name, group in self.edges.items():
+            edge = group.update(snapshot)
+            if edge is None:
+                continue
+            with self.condition:
+                self.counts[(name, edge)] += 1
+                self.snapshots[(name, edge)] = snapshot
+                self.condition.notify_all()
+            for callback in self.callbacks[(name, edge)]:
+                callback(snapshot)
+
+    def wait(self, name: str, edge: str, timeout: float = None, fallback=None):
+        """
+        Block until the next such edge after the call.
+
+        Parameters:
+          name (str): The edge group.
+          edge (str): RISING or FALLING.
+          timeout (float): Seconds to wait at most, None waits forever.
+          fallback (callable): Called without arguments if the edge did not come in time.
+
+        Returns:
+          Snapshot: The sample at which the edge was detected, None on timeout or when the hub stopped.
+        """
+        key = (name, edge)
+        with self.condition:
+            start = self.counts[key]
+            self.condition.wait_for(lambda: self.counts[key] != start or not self.hub.running, timeout)
+            if self.counts[key] != start:
+                return self.snapshots[key]
+        print(f"No {edge} edge of {name} within {timeout} s")
+        if fallback is not None:
+            fallback()
+        return None
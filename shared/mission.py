@@ -0,0 +1,290 @@
+#!/usr/bin/python3
+import ast
+import asyncio
+import inspect
+import operator
+import os
+import time
+
+import yaml
+
+from schedule import Phase, Scheduler
+
+# CONSTANTS
+
+MISSION_VERSION = 1
+# Keys of a step that belong to the executor, not to the step function
+STORE_KEY = "store"
+# A step with this key starts a new phase
+PHASE_KEY = "phase"
+# Seconds between checks for a changed mission file while rehearsing
+REHEARSE_POLL = 0.5
+
+OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+# Nodes besides the operators that make up an arithmetic expression
+ARITHMETIC = (ast.Expression, ast.Constant, ast.Name, ast.Load, ast.BinOp, ast.UnaryOp)
+
+
+class MissionError(ValueError):
+    pass
+
+
+class StepFailed(RuntimeError):
+    """Raised by a step that cannot go on (e.g. a line that never came), the rest of its phase is dropped."""
+
+
+class Ref:
+    """A value stored by an earlier step ("$name" in the mission), looked up when the step runs."""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+def evaluate(expression: str, names: dict[str, float]) -> float:
+    """Evaluate arithmetic over numbers and named constants, such as "MOTOR_WIND_LENGTH - 1.3 + 0.2"."""
+    def visit(node):
+        if isinstance(node, ast.Expression):
+            return visit(node.body)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return node.value
+        if isinstance(node, ast.Name):
+            if node.id not in names:
+                raise MissionError(f"Unknown constant {node.id} in {expression!r}")
+            return names[node.id]
+        if isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+            return OPERATORS[type(node.op)](visit(node.left), visit(node.right))
+        if isinstance(node, ast.UnaryOp) and type(node.op) in OPERATORS:
+            return OPERATORS[type(node.op)](visit(node.operand))
+        raise MissionError(f"Not allowed in {expression!r}: {ast.dump(node)}")
+    return visit(ast.parse(expression, mode="eval"))
+
+
+def resolve(value, names: dict[str, float]):
+    """Turn strings of a step into numbers ("2 * TURN"), references ("$cup") or keep them as text."""
+    if isinstance(value, str):
+        if value.startswith("$"):
+            return Ref(value[1:])
+        try:
+            tree = ast.parse(value, mode="eval")
+        except SyntaxError:
+            return value
+        if isinstance(tree.body, ast.Name) and tree.body.id not in names:
+            # A plain word like "min_jerk", typos inside expressions still fail
+            return value
+        if not all(isinstance(node, ARITHMETIC) or type(node) in OPERATORS for node in ast.walk(tree)):
+            # Text that happens to parse, such as "not ready"
+            return value
+        return evaluate(value, names)
+    if isinstance(value, list):
+        return [resolve(item, names) for item in value]
+    if isinstance(value, dict):
+        return {key: resolve(item, names) for key, item in value.items()}
+    return value
+
+
+class Step:
+    """One compiled step: the function with its arguments bound and checked at load time."""
+
+    __slots__ = ("index", "name", "function", "args", "kwargs", "store", "refs")
+
+    def __init__(self, index: int, name: str, function, args: list, kwargs: dict, store: str):
+        self.index = index
+        self.name = name
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.store = store
+        self.refs = any(isinstance(value, Ref) for value in list(args) + list(kwargs.values()))
+
+
+class Mission:
+    """
+    Steps read from a YAML mission file and compiled once into a flat list, so running them is a
+    plain loop over prepared calls. The file looks like:
+
+        version: 1
+        constants:
+          TURN: 0.8
+        steps:
+          - drive: {left: 100, right: -100, duration: TURN}
+          - servo: {port: 1, position: 700, duration: 0.4}
+          - detect_cup: {}
+            store: cup
+          - grab_cups: $cup
+          - phase: {name: drinks, priority: 2, estimate: 20}
+          - fill_cups
+
+    Every step names one of the registered step functions. Its value holds the arguments: a
+    mapping of keyword arguments, a list of positional ones or a single value. Strings are
+    arithmetic over the constants (the robot's and the file's), "$name" is the result of an
+    earlier step stored under that name. A phase step groups the steps after it into a Phase
+    (see schedule.py), the steps before the first one are a phase without estimate.
+
+    Parameters:
+      path (str): The mission file.
+      functions (dict[str, callable]): Step names and their functions, plain or coroutine functions.
+      constants (dict[str, float]): Names usable in expressions, the file's constants override them.
+    """
+
+    def __init__(self, path: str, functions: dict, constants: dict[str, float] = None):
+        self.path = path
+        self.functions = functions
+        self.constants = constants or {}
+        self.mtime = None
+        self.steps = []
+        self.phases = []
+        self.state = {}
+        self.timings = []
+        self.reload()
+
+    def reload(self) -> None:
+        """Read and compile the mission file again. On errors the previous steps are kept."""
+        mtime = os.path.getmtime(self.path)
+        with open(self.path, "r") as file:
+            data = yaml.safe_load(file) or {}
+        self.phases = self.compile(data)
+        self.steps = [step for phase in self.phases for step in phase.steps]
+        self.mtime = mtime
+
+    def changed(self) -> bool:
+        try:
+            return os.path.getmtime(self.path) != self.mtime
+        except OSError:
+            return False
+
+    def compile(self, data: dict) -> list[Phase]:
+        if data.get("version") != MISSION_VERSION:
+            raise MissionError(f"{self.path}: version {data.get('version')}, expected {MISSION_VERSION}")
+        names = dict(self.constants)
+        for name, value in (data.get("constants") or {}).items():
+            names[name] = resolve(value, names)
+
+        phases = [Phase("start")]
+        for index, entry in enumerate(data.get("steps") or []):
+            if isinstance(entry, str):
+                entry = {entry: None}
+            if PHASE_KEY in entry:
+                options = resolve(entry[PHASE_KEY], names)
+                try:
+                    phase = Phase(**options)
+                except TypeError as e:
+                    raise MissionError(f"{self.path} step {index} (phase): {e}") from None
+                unknown = [name for name in phase.requires if name not in [earlier.name for earlier in phases]]
+                if unknown:
+                    raise MissionError(f"{self.path} step {index} (phase): requires {unknown}, no earlier phase")
+                phases.append(phase)
+                continue
+            store = entry.get(STORE_KEY)
+            keys = [key for key in entry if key != STORE_KEY]
+            if len(keys) != 1:
+                raise MissionError(f"{self.path} step {index}: expected one step name, got {keys}")
+            name = keys[0]
+            if name not in self.functions:
+                raise MissionError(f"{self.path} step {index}: unknown step {name}, known are {sorted(self.functions)}")
+
+            value = resolve(entry[name], names)
+            if value is None:
+                args, kwargs = [], {}
+            elif isinstance(value, dict):
+                args, kwargs = [], value
+            elif isinstance(value, list):
+                args, kwargs = value, {}
+            else:
+                args, kwargs = [value], {}
+            try:
+                inspect.signature(self.functions[name]).bind(*args, **kwargs)
+            except TypeError as e:
+                raise MissionError(f"{self.path} step {index} ({name}): {e}") from None
+            except ValueError:
+                # Some builtins have no signature, they are checked when the step runs
+                pass
+            phases[-1].steps.append(Step(index, name, self.functions[name], args, kwargs, store))
+        return [phase for phase in phases if phase.steps]
+
+    async def run(self, scheduler: Scheduler = None) -> dict:
+        """
+        Run all steps in order, awaiting the ones that return awaitables.
+
+        Parameters:
+          scheduler (Scheduler): Skips and cuts phases to keep its budget, None runs every step.
+
+        Returns:
+          dict: The values stored by the steps.
+        """
+        scheduler = scheduler or Scheduler(budget=None)
+        scheduler.start()
+        self.state = {}
+        self.timings = []
+        for index, phase in enumerate(self.phases):
+            phase_start = scheduler.elapsed()
+            allowed = scheduler.allowance(self.phases, index)
+            if allowed is None:
+                scheduler.record(phase, "skipped", phase_start)
+                continue
+            end = time.monotonic() + allowed
+            status = "done"
+            for step in phase.steps:
+                if time.monotonic() >= end:
+                    status = "cut"
+                    break
+                args, kwargs = step.args, step.kwargs
+                if step.refs:
+                    args = [self.state.get(value.name) if isinstance(value, Ref) else value for value in args]
+                    kwargs = {key: self.state.get(value.name) if isinstance(value, Ref) else value for key, value in kwargs.items()}
+                start = time.monotonic()
+                try:
+                    result = step.function(*args, **kwargs)
+                    if inspect.isawaitable(result):
+                        # Blocking steps can only be cut after they returned, awaitable ones are cancelled
+                        result = await asyncio.wait_for(result, end - start if allowed != float("inf") else None)
+                except asyncio.TimeoutError:
+                    result = None
+                    status = "cut"
+                except StepFailed as e:
+                    print(f"Step {step.index} ({step.name}) of phase {phase.name} failed: {e}")
+                    result = None
+                    status = "failed"
+                self.timings.append((step.name, time.monotonic() - start))
+                if status != "done":
+                    break
+                if step.store:
+                    self.state[step.store] = result
+            scheduler.record(phase, status, phase_start, allowed)
+        return self.state
+
+
+def rehearse(mission: Mission, prepare=None, scheduler: Scheduler = None) -> None:
+    """
+    Run the mission, then run it again every time its file changes, in the same process (so the
+    imports and the camera stay loaded). Ctrl+C ends.
+
+    Parameters:
+      mission (Mission): The mission to run.
+      prepare (callable): Called before every run, e.g. to reset servos.
+      scheduler (Scheduler): Keeps every run within its budget, None runs every step.
+    """
+    while True:
+        if prepare is not None:
+            prepare()
+        start = time.monotonic()
+        asyncio.run(mission.run(scheduler))
+        print(f"Mission done in {time.monotonic() - start:.2f} s, edit {mission.path} to run it again")
+        while True:
+            while not mission.changed():
+                time.sleep(REHEARSE_POLL)
+            try:
+                mission.reload()
+                break
+            except (MissionError, yaml.YAMLError, OSError) as e:
+                # Wait for the next change instead of running the old steps again
+                print(f"Not reloaded: {e}")
+                mission.mtime = os.path.getmtime(mission.path)
@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+import asyncio
+import functools
+import time
+
+# CONSTANTS
+
+# Checks per second of polled conditions, and steps per second of servo ramps
+MOTION_RATE = 100
+
+
+class Motion:
+    """
+    Awaitable drive and servo primitives. Each one only sleeps in the event loop, so several of
+    them run at the same time when gathered, e.g. a servo ramp while driving:
+
+        await asyncio.gather(motion.drive(85, 100, 2.0), motion.servo_ramp(ARM_SERVO, 1000, 2.0))
+
+    Two primitives on the same motors or servo at once fight each other, that is up to the caller.
+
+    Parameters:
+      left_motor (int): Port of the left drive motor.
+      right_motor (int): Port of the right drive motor.
+      rate (float): Checks per second of polled until conditions and steps per second of servo ramps.
+      motor (callable): Sets a motor speed, kipr's motor if None.
+      set_servo (callable): Sets a servo position, kipr's set_servo_position if None.
+      get_servo (callable): Reads a servo position, kipr's get_servo_position if None.
+      servos (ServoEngine): Runs servo_ramp and servo_move, if None servo_ramp steps the servo itself.
+    """
+
+    def __init__(self, left_motor: int, right_motor: int, rate: float = MOTION_RATE,
+                 motor=None, set_servo=None, get_servo=None, servos=None):
+        if motor is None or set_servo is None or get_servo is None:
+            import kipr
+            motor = motor or kipr.motor
+            set_servo = set_servo or kipr.set_servo_position
+            get_servo = get_servo or kipr.get_servo_position
+        self.left_motor = left_motor
+        self.right_motor = right_motor
+        self.period = 1 / rate
+        self.motor = motor
+        self.set_servo = set_servo
+        self.get_servo = get_servo
+        self.servos = servos
+
+    async def _wait(self, duration: float, until, timeout: float) -> bool:
+        if (duration is None) == (until is None):
+            raise ValueError("Give either a duration or an until condition")
+        if until is None:
+            await asyncio.sleep(duration)
+            return True
+        if not callable(until):
+            # An awaitable, such as EdgeMonitor.next
+            try:
+                await asyncio.wait_for(until, timeout)
+                return True
+            except asyncio.TimeoutError:
+                print(f"Condition not met within {timeout} s")
+                return False
+        start = time.monotonic()
+        while not until():
+            if timeout is not None and time.monotonic() - start >= timeout:
+                print(f"Condition not met within {timeout} s")
+                return False
+            await asyncio.sleep(self.period)
+        return True
+
+    async def drive(self, left: int, right: int, duration: float = None, until=None, timeout: float = None,
+                    stop: bool = True) -> bool:
+        """
+        Drive with the given motor speeds for a duration or until a condition.
+
+        Parameters:
+          left (int): Speed of the left motor.
+          right (int): Speed of the right motor.
+          duration (float): Seconds to drive.
+          until: A function polled at the motion rate, or an awaitable (e.g. an edge future), instead of a duration.
+          timeout (float): Seconds after which an until drive gives up.
+          stop (bool): Stop the motors afterwards (also when cancelled), else they keep running.
+
+        Returns:
+          bool: False if the until condition timed out.
+        """
+        self.motor(self.left_motor, left)
+        self.motor(self.right_motor, right)
+        try:
+            return await self._wait(duration, until, timeout)
+        finally:
+            if stop:
+                self.motor(self.left_motor, 0)
+                self.motor(self.right_motor, 0)
+
+    async def turn(self, speed: int, duration: float = None, until=None, timeout: float = None, stop: bool = True) -> bool:
+        """Turn on the spot, clockwise for positive speeds (see drive)."""
+        return await self.drive(speed, -speed, duration, until, timeout, stop)
+
+    async def servo_ramp(self, port: int, position: int, duration: float) -> None:
+        """Move a servo linearly from its current to the given position in duration seconds."""
+        if self.servos is not None:
+            await asyncio.wrap_future(self.servos.move(port, position, duration, "linear"))
+            return
+        start_position = self.get_servo(port)
+        start = time.monotonic()
+        while True:
+            progress = min(1.0, (time.monotonic() - start) / duration) if duration > 0 else 1.0
+            self.set_servo(port, round(start_position + (position - start_position) * progress))
+            if progress >= 1.0:
+                return
+            await asyncio.sleep(self.period)
+
+    async def servo_move(self, targets: dict[int, int], duration: float, profile: str = None) -> bool:
+        """
+        Move several servos along a smooth profile (needs a ServoEngine), all arriving after duration seconds.
+
+        Returns:
+          bool: False if another move of one of the servos replaced this one.
+        """
+        if self.servos is None:
+            raise RuntimeError("servo_move needs a ServoEngine")
+        future = self.servos.move_many(targets, duration, profile) if profile else self.servos.move_many(targets, duration)
+        return await asyncio.wrap_future(future)
+
+    async def in_thread(self, function, *args, **kwargs):
+        """Run a blocking function (like a control loop) in a worker thread and await its result."""
+        return await asyncio.get_event_loop().run_in_executor(None, functools.partial(function, *args, **kwargs))
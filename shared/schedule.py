@@ -0,0 +1,201 @@
+#!/usr/bin/python3
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+# CONSTANTS
+
+# Seconds from the start light until the robot is turned off
+MATCH_TIME = 119
+# Profiles of past runs, one JSON file per run
+PROFILE_DIR = ".profiles"
+
+
+class Phase:
+    """
+    A group of mission steps that is skipped or cut short as a whole.
+
+    Parameters:
+      name (str): Shown in the log and the profiles.
+      priority (int): Higher runs first when time is short, later phases of higher priority keep their estimate reserved.
+      estimate (float): Seconds the phase usually takes, None if unknown (it is then never skipped for time).
+      deadline (float): Seconds after the start by which the phase has to be done, else it is cut there.
+      minimum (float): Seconds worth starting the phase for, less skips it. The estimate if None.
+      requires (list[str]): Earlier phases this one builds on, it is skipped unless all of them were done.
+    """
+
+    __slots__ = ("name", "priority", "estimate", "deadline", "minimum", "requires", "steps")
+
+    def __init__(self, name: str, priority: int = 0, estimate: float = None, deadline: float = None,
+                 minimum: float = None, requires: list[str] = None):
+        self.name = name
+        self.priority = priority
+        self.estimate = estimate
+        self.deadline = deadline
+        self.minimum = minimum
+        self.requires = [requires] if isinstance(requires, str) else list(requires or [])
+        self.steps = []
+
+
+class Scheduler:
+    """
+    Keeps the phases of a run within the match time. Before a phase starts it gets the time left,
+    minus the estimates of later phases with a higher priority and capped by its own deadline. If
+    that is less than the phase needs it is skipped, else it is cut once the time is up. A phase
+    that requires earlier ones is skipped unless they were done, and those are only started with
+    time for it as well instead of having its estimate reserved. Every phase's measured duration
+    is written to a profile of the run after it ended, so a profile survives the robot being
+    turned off mid-phase.
+
+    Parameters:
+      budget (float): Seconds of the run, None for no limit.
+      profile_dir (str): Directory the profile is written to, None to not write one.
+      halt (callable): Called after a phase was cut or failed, e.g. to stop the motors.
+      estimates (dict[str, float]): Estimates of phases that have none of their own, e.g. from measured_estimates.
+    """
+
+    def __init__(self, budget: float = MATCH_TIME, profile_dir: str = None, halt=None, estimates: dict[str, float] = None):
+        self.budget = budget
+        self.profile_dir = profile_dir
+        self.halt = halt
+        self.estimates = estimates or {}
+        self.start_time = None
+        self.path = None
+        self.phases = []
+
+    def start(self) -> None:
+        self.start_time = time.monotonic()
+        self.phases = []
+        if self.profile_dir is not None:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            self.path = os.path.join(self.profile_dir, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start_time
+
+    def estimate(self, phase: Phase) -> float:
+        return phase.estimate if phase.estimate is not None else self.estimates.get(phase.name)
+
+    def allowance(self, phases: list[Phase], index: int) -> float:
+        """
+        Seconds the phase at index may take from now.
+
+        Returns:
+          float: None to skip it, infinity without a budget or deadline.
+        """
+        phase = phases[index]
+        done = {record["name"] for record in self.phases if record["status"] == "done"}
+        if not all(name in done for name in phase.requires):
+            return None
+        now = self.elapsed()
+        available = float("inf") if self.budget is None else self.budget - now
+        needed = phase.minimum if phase.minimum is not None else self.estimate(phase)
+        dependents = self.dependents(phases, index)
+        for later in phases[index + 1:]:
+            estimate = self.estimate(later)
+            if estimate is None:
+                continue
+            if later in dependents:
+                needed = (needed or 0) + estimate
+            elif later.priority > phase.priority:
+                available -= estimate
+        if phase.deadline is not None:
+            available = min(available, phase.deadline - now)
+        if available <= 0 or (needed is not None and available < needed):
+            return None
+        return available
+
+    def dependents(self, phases: list[Phase], index: int) -> list[Phase]:
+        """Returns the later phases that require the phase at index, directly or through each other."""
+        names = {phases[index].name}
+        dependents = []
+        for later in phases[index + 1:]:
+            if names.intersection(later.requires):
+                names.add(later.name)
+                dependents.append(later)
+        return dependents
+
+    def record(self, phase: Phase, status: str, start: float, allowed: float = None) -> None:
+        """
+        Add a phase to the profile and write it.
+
+        Parameters:
+          phase (Phase): The phase.
+          status (str): "done", "cut", "failed" or "skipped".
+          start (float): Seconds after the start the phase started at (or was skipped).
+          allowed (float): Seconds the phase was given.
+        """
+        duration = self.elapsed() - start
+        estimate = self.estimate(phase)
+        self.phases.append({
+            "name": phase.name,
+            "status": status,
+            "priority": phase.priority,
+            "start": round(start, 3),
+            "duration": round(duration, 3),
+            "estimate": estimate,
+            "deadline": phase.deadline,
+            "allowed": None if allowed is None or allowed == float("inf") else round(allowed, 3),
+        })
+        if status == "skipped":
+            print(f"Phase {phase.name} skipped, {start:.1f} s of the match passed")
+        else:
+            late = f", {duration - estimate:+.1f} s on the estimate" if estimate is not None else ""
+            print(f"Phase {phase.name} {status} after {duration:.1f} s{late}, {start + duration:.1f} s of the match passed")
+        if status in ("cut", "failed") and self.halt is not None:
+            self.halt()
+        self.save()
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        profile = {"budget": self.budget, "elapsed": round(self.elapsed(), 3), "phases": self.phases}
+        with open(self.path + ".tmp", "w") as file:
+            json.dump(profile, file, indent=1)
+        os.replace(self.path + ".tmp", self.path)
+
+
+def load_profiles(directory: str = PROFILE_DIR) -> list[dict]:
+    profiles = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(path, "r") as file:
+            profiles.append(json.load(file))
+    return profiles
+
+
+def measured_estimates(directory: str = PROFILE_DIR) -> dict[str, float]:
+    """Returns the median duration of every phase over the past runs that finished it."""
+    durations = {}
+    for profile in load_profiles(directory):
+        for phase in profile["phases"]:
+            if phase["status"] == "done":
+                durations.setdefault(phase["name"], []).append(phase["duration"])
+    return {name: statistics.median(values) for name, values in durations.items()}
+
+
+def report(directory: str = PROFILE_DIR) -> None:
+    """Prints how long every phase took over the past runs and how often it was cut, failed or skipped."""
+    profiles = load_profiles(directory)
+    print(f"{len(profiles)} runs in {directory}")
+    phases = {}
+    for profile in profiles:
+        for phase in profile["phases"]:
+            phases.setdefault(phase["name"], []).append(phase)
+    print(f"{'phase':<20}{'runs':>6}{'cut':>6}{'failed':>8}{'skipped':>9}{'median':>9}{'max':>9}{'estimate':>10}")
+    for name, entries in phases.items():
+        done = [entry["duration"] for entry in entries if entry["status"] == "done"]
+        median = f"{statistics.median(done):.1f}" if done else "-"
+        longest = f"{max(done):.1f}" if done else "-"
+        estimate = entries[-1]["estimate"]
+        print(f"{name:<20}{len(entries):>6}{sum(entry['status'] == 'cut' for entry in entries):>6}"
+              f"{sum(entry['status'] == 'failed' for entry in entries):>8}"
+              f"{sum(entry['status'] == 'skipped' for entry in entries):>9}{median:>9}{longest:>9}"
+              f"{estimate if estimate is not None else '-':>10}")
+
+
+if __name__ == "__main__":
+    report(sys.argv[1] if len(sys.argv) > 1 else PROFILE_DIR)
@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+import collections
+import threading
+import time
+
+from control_loop import ControlLoop
+
+# CONSTANTS
+
+# Samples per second of every port
+SENSOR_RATE = 500
+# Analog values are the median of this many samples (1 disables the filter)
+MEDIAN_SIZE = 3
+
+
+class Snapshot:
+    """One sample of all ports. Never changed after it was published, so readers need no lock."""
+
+    __slots__ = ("time", "sequence", "analog", "digital")
+
+    def __init__(self, time: float, sequence: int, analog: dict[int, int], digital: dict[int, int]):
+        self.time = time
+        self.sequence = sequence
+        self.analog = analog
+        self.digital = digital
+
+
+class SensorHub:
+    """
+    Samples the configured analog and digital ports at a fixed rate in one thread. Every sample
+    is published as a new Snapshot by swapping a single reference (double buffering), so reading
+    the newest values is one attribute access and never touches the hardware.
+
+    Parameters:
+      analog (list[int]): Analog ports to sample.
+      digital (list[int]): Digital ports to sample.
+      rate (float): Samples per second.
+      median (int): Window of the median filter on analog values.
+      analog_read (callable): Reads an analog port, kipr's analog if None.
+      digital_read (callable): Reads a digital port, kipr's digital if None.
+    """
+
+    def __init__(self, analog: list[int] = (), digital: list[int] = (), rate: float = SENSOR_RATE,
+                 median: int = MEDIAN_SIZE, analog_read=None, digital_read=None):
+        if analog_read is None or digital_read is None:
+            import kipr
+            analog_read = analog_read or kipr.analog
+            digital_read = digital_read or kipr.digital
+        self.analog_ports = list(analog)
+        self.digital_ports = list(digital)
+        self.analog_read = analog_read
+        self.digital_read = digital_read
+        self.loop = ControlLoop(rate)
+        self.windows = {port: collections.deque(maxlen=median) for port in self.analog_ports}
+        self.snapshot = None
+        self.sequence = 0
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.stats = None
+        self.listeners = []
+
+    def start(self) -> "SensorHub":
+        """Start sampling, returns once the first snapshot is available."""
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self._sample_loop, daemon=True)
+            self.thread.start()
+            self.wait_until(lambda snapshot: True)
+        return self
+
+    def _sample(self, elapsed: float, dt: float) -> None:
+        analog = {}
+        for port, window in self.windows.items():
+            window.append(self.analog_read(port))
+            analog[port] = sorted(window)[len(window) // 2] if len(window) > 1 else window[0]
+        digital = {port: self.digital_read(port) for port in self.digital_ports}
+        # Publish the snapshot before its sequence number, waiters look for the number
+        self.snapshot = Snapshot(time.monotonic(), self.sequence + 1, analog, digital)
+        self.sequence += 1
+        with self.condition:
+            self.condition.notify_all()
+        for listener in self.listeners:
+            listener(self.snapshot)
+
+    def add_listener(self, listener) -> None:
+        """Call listener(snapshot) for every new sample, in the sampling thread (so it must be quick)."""
+        self.listeners = self.listeners + [listener]
+
+    def _sample_loop(self) -> None:
+        self.stats = self.loop.run(self._sample, until=lambda: not self.running)
+
+    def analog(self, port: int) -> int:
+        return self.snapshot.analog[port]
+
+    def digital(self, port: int) -> int:
+        return self.snapshot.digital[port]
+
+    def wait_until(self, predicate, timeout: float = None) -> Snapshot:
+        """
+        Block until a snapshot fulfils the predicate, checking every new sample once.
+
+        Parameters:
+          predicate (callable): Called with each Snapshot, returns True to stop waiting.
+          timeout (float): Seconds to wait at most, None waits forever.
+
+        Returns:
+          Snapshot: The snapshot that fulfilled the predicate, None on timeout or when the hub stopped.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        seen = 0
+        while True:
+            snapshot = self.snapshot
+            if snapshot is not None and snapshot.sequence != seen:
+                seen = snapshot.sequence
+                if predicate(snapshot):
+                    return snapshot
+            with self.condition:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if not self.running or (remaining is not None and remaining <= 0):
+                    return None
+                self.condition.wait_for(lambda: self.sequence != seen or not self.running, remaining)
+
+    def stop(self) -> None:
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(1)
+            self.thread = None
+        with self.condition:
+            self.condition.notify_all()
@@ -0,0 +1,189 @@
+#!/usr/bin/python3
+import threading
+import time
+from concurrent.futures import Future
+
+from control_loop import ControlLoop
+
+# CONSTANTS
+
+# Servo updates per second while a move is running
+SERVO_RATE = 100
+# Share of a trapezoidal move spent accelerating (and the same share decelerating)
+RAMP_SHARE = 0.25
+DEFAULT_PROFILE = "min_jerk"
+
+
+def linear(progress: float) -> float:
+    return progress
+
+
+def trapezoid(progress: float, ramp: float = RAMP_SHARE) -> float:
+    """Constant acceleration, constant velocity, constant deceleration."""
+    peak = 1 / (1 - ramp)
+    if progress < ramp:
+        return 0.5 * peak / ramp * progress ** 2
+    if progress <= 1 - ramp:
+        return peak * (progress - ramp / 2)
+    return 1 - 0.5 * peak / ramp * (1 - progress) ** 2
+
+
+def min_jerk(progress: float) -> float:
+    """Smoothest start and stop, velocity and acceleration are zero at both ends."""
+    return progress ** 3 * (10 - 15 * progress + 6 * progress ** 2)
+
+
+# Position along the move (0 to 1) for the time along the move (0 to 1)
+PROFILES = {"linear": linear, "trapezoid": trapezoid, "min_jerk": min_jerk}
+
+
+class ServoMove:
+    def __init__(self, start_position: int, target: int, start: float, duration: float, profile):
+        self.start_position = start_position
+        self.target = target
+        self.start = start
+        self.duration = duration
+        self.profile = profile
+        self.future = Future()
+
+    def position(self, now: float) -> tuple[int, bool]:
+        progress = (now - self.start) / self.duration if self.duration > 0 else 1.0
+        if progress >= 1.0:
+            return self.target, True
+        return round(self.start_position + (self.target - self.start_position) * self.profile(progress)), False
+
+
+class ServoEngine:
+    """
+    Moves servos along time-parameterized profiles, all of them from one thread that updates at a
+    fixed rate (see ControlLoop). A move takes the requested time however long the updates take,
+    and any number of servos move at once. The thread sleeps while no move is running.
+
+    Every move returns a concurrent.futures.Future, resolved with True when the target is reached
+    and with False when another move of the same servo replaced it. Wait for it with result(), or
+    with asyncio.wrap_future in a coroutine.
+
+    Parameters:
+      rate (float): Updates per second.
+      set_servo (callable): Sets a servo position, kipr's set_servo_position if None.
+      get_servo (callable): Reads a servo position, kipr's get_servo_position if None.
+    """
+
+    def __init__(self, rate: float = SERVO_RATE, set_servo=None, get_servo=None):
+        if set_servo is None or get_servo is None:
+            import kipr
+            set_servo = set_servo or kipr.set_servo_position
+            get_servo = get_servo or kipr.get_servo_position
+        self.set_servo = set_servo
+        self.get_servo = get_servo
+        self.loop = ControlLoop(rate)
+        self.moves = {}
+        self.positions = {}
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.stats = None
+
+    def start(self) -> "ServoEngine":
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        return self
+
+    def move(self, port: int, position: int, duration: float, profile: str = DEFAULT_PROFILE) -> Future:
+        """
+        Move one servo from where it is to position in duration seconds.
+
+        Parameters:
+          port (int): The servo.
+          position (int): Target position.
+          duration (float): Seconds the move takes.
+          profile (str): "linear", "trapezoid" or "min_jerk".
+
+        Returns:
+          Future: Resolved once the move ended.
+        """
+        return self.move_many({port: position}, duration, profile)
+
+    def move_many(self, targets: dict[int, int], duration: float, profile: str = DEFAULT_PROFILE) -> Future:
+        """Move several servos at once, all arriving after duration seconds. Returns a future of all of them."""
+        self.start()
+        now = time.monotonic()
+        futures = []
+        with self.condition:
+            for port, position in targets.items():
+                if port in self.moves:
+                    # Continue from where the running move is now, it might not have been stepped yet
+                    start_position = self.moves[port].position(now)[0]
+                else:
+                    # The servo might have been set directly since the last move
+                    self.positions.pop(port, None)
+                    start_position = self.get_servo(port)
+                replaced = self.moves.get(port)
+                move = ServoMove(start_position, position, now, duration, PROFILES[profile])
+                self.moves[port] = move
+                if replaced is not None:
+                    self._finish(replaced, False)
+                futures.append(move.future)
+            self.condition.notify_all()
+        return futures[0] if len(futures) == 1 else gather_futures(futures)
+
+    def _step(self, elapsed: float, dt: float) -> None:
+        now = time.monotonic()
+        with self.condition:
+            moves = list(self.moves.items())
+        for port, move in moves:
+            position, done = move.position(now)
+            with self.condition:
+                changed = position != self.positions.get(port)
+                self.positions[port] = position
+            if changed:
+                self.set_servo(port, position)
+            if done:
+                with self.condition:
+                    # A move that was replaced meanwhile is already resolved with False
+                    if self.moves.get(port) is move:
+                        del self.moves[port]
+                        self._finish(move, True)
+
+    def _finish(self, move: ServoMove, result: bool) -> None:
+        # Only called with the condition held, so every move is resolved exactly once
+        if not move.future.done():
+            move.future.set_result(result)
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.moves or not self.running)
+                if not self.running:
+                    return
+            self.stats = self.loop.run(self._step, until=lambda: not self.moves or not self.running)
+
+    def stop(self) -> None:
+        with self.condition:
+            self.running = False
+            for move in self.moves.values():
+                self._finish(move, False)
+            self.moves = {}
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(1)
+            self.thread = None
+
+
+def gather_futures(futures: list[Future]) -> Future:
+    """Returns a future resolved once all futures are, with True if all of them were True."""
+    combined = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_) -> None:
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                combined.set_result(all(future.result() for future in futures))
+
+    for future in futures:
+        future.add_done_callback(done)
+    return combined
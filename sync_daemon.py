@@ -0,0 +1,235 @@
+import argparse
+import asyncio
+import os
+import posixpath
+import time
+import yaml
+
+from codebridge import RemoteSession, DeltaUploader, BatchUploader, RemoteRunner, ChangeWatcher, FileSet, BATCH_THRESHOLD
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Uploads running at the same time over the connection of one robot
+CHANNELS = 4
+
+
+class SessionPool:
+    """Hands out one persistent session per robot address, shared by every robot entry using it."""
+
+    def __init__(self):
+        self.sessions = {}
+
+    def get(self, ssh: dict) -> RemoteSession:
+        key = (ssh["hostname"], ssh.get("port", 22), ssh["username"])
+        if key not in self.sessions:
+            self.sessions[key] = RemoteSession(ssh["hostname"], ssh["username"], ssh["password"], port=key[1])
+        return self.sessions[key]
+
+
+class Robot:
+    """
+    One sync target. Changed files are queued here and uploaded by the robot's own task, so a
+    robot that is out of Wi-Fi range does not hold back the others.
+
+    With transfer "delta" every file is sent as a delta on its own channel, with "batch" all pending
+    files are sent as one compressed archive. "auto" batches when several files are pending or one
+    of them is larger than BATCH_THRESHOLD.
+
+    If a runner is set, its script is restarted on the robot after every successful sync.
+    """
+
+    def __init__(self, name: str, session: RemoteSession, trees: list[tuple[FileSet, str]],
+                 channels: int = CHANNELS, transfer: str = "auto", compression: str = "gz"):
+        if transfer not in ("auto", "delta", "batch"):
+            raise ValueError(f"Unknown transfer mode {transfer} for {name}")
+        self.name = name
+        self.session = session
+        self.uploader = DeltaUploader(session)
+        self.batcher = BatchUploader(session, compression)
+        self.trees = trees
+        self.transfer = transfer
+        self.runner = None
+        self.pending = {}
+        # Files were synced since the script was last restarted
+        self.restart_pending = False
+        self.wakeup = asyncio.Event()
+        self.channels = asyncio.Semaphore(channels)
+
+    def remote_path(self, path: str) -> str:
+        for file_set, remote_dir in self.trees:
+            if file_set.contains(path):
+                return posixpath.join(remote_dir, file_set.relative(path))
+        return None
+
+    def queue(self, path: str, data: bytes, detected: float) -> bool:
+        """Queue a changed file for upload, returns False if it is not synced to this robot."""
+        remote_path = self.remote_path(path)
+        if remote_path is None:
+            return False
+        self.pending[path] = (remote_path, data, detected)
+        self.wakeup.set()
+        return True
+
+    def use_batch(self, batch: dict) -> bool:
+        if self.transfer == "auto":
+            return len(batch) > 1 or any(len(data) > BATCH_THRESHOLD for _, data, _ in batch.values())
+        return self.transfer == "batch"
+
+    async def upload(self, remote_path: str, data: bytes) -> dict:
+        async with self.channels:
+            return await asyncio.to_thread(self.uploader.upload, data, remote_path)
+
+    async def push_deltas(self, batch: dict) -> bool:
+        results = await asyncio.gather(*(self.upload(remote_path, data) for remote_path, data, _ in batch.values()),
+                                       return_exceptions=True)
+        failed = False
+        for (path, (remote_path, data, detected)), result in zip(batch.items(), results):
+            if isinstance(result, Exception):
+                print(f"[{self.name}] Critical Error: {result}")
+                # Keep newer content if the file changed again meanwhile
+                self.pending.setdefault(path, (remote_path, data, detected))
+                failed = True
+            else:
+                latency = time.monotonic() - detected
+                print(f"[{self.name}] {remote_path}: {result['size']} B ({result['sent']} B sent) in {latency * 1000:.0f} ms")
+        return failed
+
+    async def push_batch(self, batch: dict) -> bool:
+        files = {remote_path: data for remote_path, data, _ in batch.values()}
+        try:
+            result = await asyncio.to_thread(self.batcher.upload, files)
+        except Exception as e:
+            print(f"[{self.name}] Critical Error: {e}")
+            for path, entry in batch.items():
+                self.pending.setdefault(path, entry)
+            return True
+
+        for remote_path, data in files.items():
+            self.uploader.remember(remote_path, data)
+        latency = time.monotonic() - min(detected for _, _, detected in batch.values())
+        saved = result["saved"] / result["size"] * 100 if result["size"] else 0
+        print(f"[{self.name}] {result['files']} files: {result['size']} B ({result['sent']} B sent, {saved:.0f}% saved) "
+              f"at {result['throughput'] / 1e6:.2f} MB/s in {latency * 1000:.0f} ms")
+        return False
+
+    async def run(self) -> None:
+        await asyncio.to_thread(self.session.connect)
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            batch, self.pending = self.pending, {}
+
+            # An empty round (after a reconnect) sends nothing, it only retries a failed restart
+            failed = False
+            if batch:
+                self.restart_pending = True
+                if self.use_batch(batch):
+                    failed = await self.push_batch(batch)
+                else:
+                    failed = await self.push_deltas(batch)
+
+            if not failed and self.runner is not None and self.restart_pending and not self.pending:
+                try:
+                    await asyncio.to_thread(self.runner.restart)
+                    self.restart_pending = False
+                except Exception as e:
+                    # Connection lost while restarting, the round after reconnecting restarts again
+                    print(f"[{self.name}] Restart failed: {e}")
+                    failed = True
+
+            if failed:
+                await asyncio.to_thread(self.session.close)
+                await asyncio.to_thread(self.session.connect)
+                self.wakeup.set()
+
+
+def report_crash(robot: Robot, task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        print(f"[{robot.name}] Sync stopped by an unexpected error: {task.exception()!r}")
+
+
+def load_robots(config_path: str, names: list[str] = None, run: bool = False) -> list[Robot]:
+    """
+    Read the robots and their synced trees from the sync config.
+
+    Parameters:
+      config_path (str): Path of the sync config (see sync.yaml).
+      names (list[str]): Only load these robots, all if None.
+      run (bool): Restart each robot's run script after every sync.
+
+    Returns:
+      list[Robot]: The robots to sync, sharing their connections through one pool.
+    """
+    with open(config_path, "r") as file:
+        config = yaml.safe_load(file)
+    config_dir = os.path.dirname(os.path.abspath(config_path))
+    pool = SessionPool()
+
+    robots = []
+    for name, robot in config["robots"].items():
+        if names and name not in names:
+            continue
+        with open(os.path.join(config_dir, robot["config"]), "r") as file:
+            ssh = yaml.safe_load(file)["ssh"]
+
+        trees = []
+        for tree in robot["trees"]:
+            file_set = FileSet(os.path.join(config_dir, tree["local"]),
+                               tree.get("include", config.get("include", ["*"])),
+                               tree.get("exclude", config.get("exclude", [])))
+            trees.append((file_set, posixpath.join(ssh["path"], tree.get("remote", ""))))
+        robots.append(Robot(name, pool.get(ssh), trees, robot.get("channels", CHANNELS),
+                            robot.get("transfer", config.get("transfer", "auto")),
+                            robot.get("compression", config.get("compression", "gz"))))
+        if run:
+            robots[-1].runner = RemoteRunner(robots[-1].session, robot.get("run", "control.py"), ssh["path"], name)
+
+    if names and len(robots) != len(names):
+        raise ValueError(f"Unknown robot in {names}, configured are {list(config['robots'])}")
+    return robots
+
+
+async def sync(robots: list[Robot]) -> None:
+    """Watch the trees of all robots and push every change to all robots it belongs to at the same time."""
+    file_sets = [file_set for robot in robots for file_set, _ in robot.trees]
+    watcher = ChangeWatcher(file_sets)
+    tasks = [asyncio.create_task(robot.run()) for robot in robots]
+    for robot, task in zip(robots, tasks):
+        task.add_done_callback(lambda task, robot=robot: report_crash(robot, task))
+
+    print("Start listening..")
+    try:
+        while True:
+            # Short timeout, so the watcher thread never outlives the daemon for long
+            changes = await asyncio.to_thread(watcher.changes, 0.5)
+            detected = time.monotonic()
+            for path, data in changes:
+                if not any([robot.queue(path, data, detected) for robot in robots]):
+                    print(f"{path} changed, but is synced to no robot")
+    finally:
+        for task in tasks:
+            task.cancel()
+        watcher.close()
+
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Push the sync trees of one or more robots over persistent SSH sessions.")
+    parser.add_argument("--config", default=os.path.join(BASE_DIR, "sync.yaml"), help="sync config listing robots and trees")
+    parser.add_argument("--robot", action="append", help="only sync this robot (can be given multiple times)")
+    parser.add_argument("--run", action="store_true", help="restart the run script on the robot after every sync and stream its output")
+    args = parser.parse_args(argv)
+
+    robots = load_robots(args.config, args.robot, args.run)
+    try:
+        asyncio.run(sync(robots))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for robot in robots:
+            if robot.runner is not None and robot.session.connected:
+                robot.runner.stop()
+            robot.session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The shared modules import each other by name, as they do next to control.py on the robots
+sys.path.insert(0, os.path.join(ROOT, "shared"))
+sys.path.insert(0, ROOT)
+# The bartender's vision modules, which import each other by name as well
+sys.path.insert(0, os.path.join(ROOT, "bartender", "sync_files"))
@@ -0,0 +1,50 @@
+import json
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+import calibrate
+import segmentation
+import utils
+
+
+def test_hue_around_red_keeps_the_larger_side():
+    # Most samples at 175-179, fewer at 0-3: a single range can only hold one side
+    hue = np.concatenate([np.full(600, 177), np.full(200, 2)]).astype(np.int64)
+    lower, upper = calibrate.fit_hue(hue, tail=0.01, margin=2)
+    assert (lower, upper) == (175, 180)
+    hue = np.concatenate([np.full(200, 177), np.full(600, 2)]).astype(np.int64)
+    assert calibrate.fit_hue(hue, tail=0.01, margin=2) == (0, 4)
+
+
+def test_hue_away_from_red_is_a_plain_range():
+    hue = np.repeat(np.arange(55, 66), 50)
+    assert calibrate.fit_hue(hue, tail=0.0, margin=3) == (52, 68)
+
+
+def test_fit_writes_a_portable_calibration(tmp_path, capsys):
+    frames = tmp_path / "frames"
+    frames.mkdir()
+    hsv = np.zeros((40, 40, 3), np.uint8)
+    hsv[:, :20] = (60, 200, 200)
+    hsv[:, 20:] = (95, 200, 200)
+    cv2.imwrite(str(frames / "0.png"), cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR))
+    samples = [{"image": "0.png", "color": "green", "rect": [2, 2, 15, 30]},
+               {"image": "0.png", "color": "blue", "rect": [22, 2, 15, 30]}]
+    (frames / calibrate.SAMPLES_FILE).write_text(json.dumps(samples))
+    output = tmp_path / "hsv_calibration.json"
+
+    calibrate.fit(str(frames), str(output))
+    assert "no labelled regions of pink" in capsys.readouterr().out
+    calibration = json.loads(output.read_text())
+    assert calibration["frames"] == "frames"
+    assert calibration["uncalibrated"] == ["pink"]
+    assert sorted(calibration["colors"]) == ["blue", "green"]
+    assert calibration["colors"]["green"]["lower_hue"] <= 60 <= calibration["colors"]["green"]["upper_hue"]
+
+    colors = segmentation.load_colors(utils.COLORS, str(output))
+    assert "No calibrated range of pink" in capsys.readouterr().out
+    assert list(colors) == list(utils.COLORS)
+    assert colors["pink"] == utils.COLORS["pink"]
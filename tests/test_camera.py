@@ -0,0 +1,56 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+
+from camera import CameraService
+
+
+class SlowBackend:
+    """Frames of a constant value, each read takes delay seconds like a stuck V4L2 read."""
+
+    def __init__(self, delay: float = 0.0, frames: list = None):
+        self.delay = delay
+        self.frames = list(frames) if frames is not None else None
+        self.reading = threading.Event()
+        self.released_while_reading = False
+        self.released = threading.Event()
+
+    def read(self) -> np.ndarray:
+        if self.released.is_set():
+            raise AssertionError("read after release")
+        self.reading.set()
+        time.sleep(self.delay)
+        self.reading.clear()
+        if self.frames is not None:
+            return self.frames.pop(0) if self.frames else None
+        return np.zeros((4, 4, 3), np.uint8)
+
+    def release(self) -> None:
+        self.released_while_reading = self.reading.is_set()
+        self.released.set()
+
+
+def test_release_waits_for_a_slow_read():
+    backend = SlowBackend(delay=1.5)
+    service = CameraService(backend, warmup_frames=0).start()
+    backend.reading.wait(1)
+    service.stop()
+    assert not backend.released.is_set()
+    assert backend.released.wait(3)
+    assert not backend.released_while_reading
+
+
+def test_frames_warmup_and_median():
+    frames = [np.full((2, 2, 3), value, np.uint8) for value in (255, 255, 10, 20, 30)]
+    backend = SlowBackend(frames=frames)
+    service = CameraService(backend, buffer_size=3, warmup_frames=2).start()
+    # The stream ends after the last frame, the two bright warmup frames were dropped
+    assert backend.released.wait(1)
+    assert service.latest(0.1)[0, 0, 0] == 30
+    assert service.median(3, 0.1)[0, 0, 0] == 20
+    assert service.wait_for_frame(after=3, timeout=0.1) is None
+    service.stop()
@@ -0,0 +1,79 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from channel import Channel, Loopback
+
+
+@pytest.fixture
+def robots():
+    loopback = Loopback()
+    janitor = Channel("janitor", loopback.transport(), resend=0.01)
+    bartender = Channel("bartender", loopback.transport(), resend=0.01)
+    yield janitor, bartender
+    janitor.stop()
+    bartender.stop()
+
+
+def test_wait_needs_a_started_channel(robots):
+    janitor, _ = robots
+    with pytest.raises(RuntimeError):
+        janitor.wait("cups_placed", 0.1)
+
+
+def test_signal_and_values_reach_the_peer(robots):
+    janitor, bartender = robots
+    janitor.start()
+    bartender.start()
+    assert not janitor.wait("cups_placed", 0.05)
+    bartender.set("cup", 2)
+    bartender.signal("cups_placed")
+    assert janitor.wait("cups_placed", 1)
+    assert janitor.get("cup") == 2
+    # Our own events are not heard back
+    assert not bartender.heard("cups_placed")
+
+
+def test_next_resolves_in_the_event_loop(robots):
+    janitor, bartender = robots
+    janitor.start()
+    bartender.start()
+
+    async def wait_for_bottles():
+        future = bartender.next("bottles_dropped")
+        asyncio.get_running_loop().call_later(0.02, janitor.signal, "bottles_dropped")
+        return await asyncio.wait_for(future, 1)
+
+    assert asyncio.run(wait_for_bottles()) is True
+
+
+def test_restart_forgets_the_last_run(robots):
+    janitor, bartender = robots
+    janitor.start()
+    bartender.start()
+    bartender.signal("cups_placed")
+    assert janitor.wait("cups_placed", 1)
+
+    bartender.stop()
+    bartender.start()
+    time.sleep(0.05)
+    assert not janitor.heard("cups_placed")
+    janitor.stop()
+    janitor.start()
+    assert not janitor.heard("cups_placed")
+
+
+def test_late_datagram_of_an_earlier_run_is_ignored(robots):
+    janitor, bartender = robots
+    janitor.start()
+    bartender.start()
+    bartender.signal("cups_placed")
+    assert janitor.wait("cups_placed", 1)
+    # Announced by the bartender's last run, delivered after its new run was heard from
+    late = {"from": "bartender", "run": "0ld0", "started": bartender.started - 5, "sequence": 99,
+            "events": {"bottles_dropped": 1.0}, "values": {}}
+    janitor._receive(json.dumps(late).encode())
+    assert janitor.heard("cups_placed")
+    assert not janitor.heard("bottles_dropped")
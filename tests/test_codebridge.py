@@ -0,0 +1,87 @@
+import hashlib
+import json
+import random
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("paramiko")
+
+from codebridge import PATCH_CODE, SIGNATURE_CODE, FileSet, InotifyWatcher, block_signatures, compute_delta, encode_delta
+
+
+def apply_delta(path, base: bytes, data: bytes, block_size: int) -> subprocess.CompletedProcess:
+    # The same payload DeltaUploader sends, applied by the robot side script
+    ops = compute_delta(data, block_signatures(base, block_size), block_size)
+    header = {
+        "path": str(path),
+        "base": hashlib.sha256(base).hexdigest(),
+        "target": hashlib.sha256(data).hexdigest(),
+        "block_size": block_size,
+    }
+    payload = json.dumps(header).encode() + b"\n" + encode_delta(ops)
+    return subprocess.run([sys.executable, "-c", PATCH_CODE], input=payload, capture_output=True)
+
+
+@pytest.mark.parametrize("edit", ["insert", "delete", "append", "replace"])
+def test_delta_round_trip(tmp_path, edit):
+    rng = random.Random(edit)
+    base = bytes(rng.randrange(256) for _ in range(5000))
+    data = {
+        "insert": base[:1500] + b"new line\n" + base[1500:],
+        "delete": base[:700] + base[900:],
+        "append": base + b"tail",
+        "replace": bytes(rng.randrange(256) for _ in range(3000)),
+    }[edit]
+    path = tmp_path / "control.py"
+    path.write_bytes(base)
+
+    result = apply_delta(path, base, data, 256)
+    assert result.stdout.strip() == b"ok", result.stdout + result.stderr
+    assert path.read_bytes() == data
+
+
+def test_delta_reuses_unchanged_blocks():
+    base = bytes(range(256)) * 16
+    data = base[:1000] + b"x" + base[1000:]
+    ops = compute_delta(data, block_signatures(base, 256), 256)
+    assert sum(1 for op in ops if isinstance(op, int)) >= 14
+    assert sum(len(op) for op in ops if isinstance(op, bytes)) < 300
+
+
+def test_base_mismatch_is_refused(tmp_path):
+    path = tmp_path / "control.py"
+    path.write_bytes(b"changed on the robot")
+    result = apply_delta(path, b"what we think is there", b"new", 256)
+    assert result.returncode == 3
+    assert path.read_bytes() == b"changed on the robot"
+
+
+def test_remote_signatures_match_local(tmp_path):
+    data = bytes(random.Random(1).randrange(256) for _ in range(3000))
+    path = tmp_path / "file"
+    path.write_bytes(data)
+    result = subprocess.run([sys.executable, "-c", SIGNATURE_CODE, str(path), "512"], capture_output=True, check=True)
+    remote = json.loads(result.stdout)
+    assert remote["sha"] == hashlib.sha256(data).hexdigest()
+    assert [tuple(block) for block in remote["blocks"]] == block_signatures(data, 512)
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux only")
+def test_new_directories_keep_the_tree_excludes(tmp_path):
+    logs = []
+    file_set = FileSet(str(tmp_path), ["*.py", "*/*.py"], ["__pycache__", "*/__pycache__"])
+    watcher = InotifyWatcher([file_set], logs.append)
+    try:
+        os.makedirs(tmp_path / "pkg" / "__pycache__")
+        (tmp_path / "pkg" / "a.py").write_text("x")
+        (tmp_path / "pkg" / "__pycache__" / "a.pyc").write_text("x")
+        assert watcher.wait(1) == {str(tmp_path / "pkg" / "a.py")}
+        assert sorted(watcher.directories.values()) == [str(tmp_path), str(tmp_path / "pkg")]
+        # After an overflow every file is reported again, through the log instead of stdout
+        assert watcher._rescan() == {str(tmp_path / "pkg" / "a.py")}
+        assert logs == ["inotify queue overflowed, rescanning all trees"]
+    finally:
+        watcher.close()
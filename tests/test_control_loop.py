@@ -0,0 +1,40 @@
+from control_loop import PID, ControlLoop
+
+
+def test_pid_output_is_clamped():
+    pid = PID(kp=10, limit=1.0)
+    assert pid.update(5.0, 0.01) == 1.0
+    assert pid.update(-5.0, 0.01) == -1.0
+
+
+def test_pid_integral_stops_growing_while_saturated():
+    pid = PID(kp=1, ki=10, limit=1.0)
+    for _ in range(1000):
+        pid.update(2.0, 0.01)
+    assert pid.integral == 0.0
+    # Without windup the output follows a sign change of the error at once
+    assert pid.update(-0.5, 0.01) < 0
+
+
+def test_pid_integrates_below_the_limit():
+    pid = PID(kp=0, ki=1, limit=10.0)
+    for _ in range(10):
+        pid.update(1.0, 0.1)
+    assert abs(pid.integral - 1.0) < 1e-9
+    pid.reset()
+    assert pid.integral == 0.0 and pid.last_error is None
+
+
+def test_loop_runs_for_its_duration():
+    calls = []
+    stats = ControlLoop(rate=200).run(lambda elapsed, dt: calls.append(elapsed), duration=0.1)
+    assert 0.1 <= stats.duration < 0.2
+    assert stats.iterations == len(calls)
+    assert 10 < stats.iterations <= 21
+
+
+def test_loop_ends_on_until_or_step():
+    stats = ControlLoop(rate=200).run(lambda elapsed, dt: elapsed > 0.02, timeout=1)
+    assert stats.duration < 0.5
+    stats = ControlLoop(rate=200).run(lambda elapsed, dt: None, until=lambda: True, timeout=1)
+    assert stats.iterations == 0
@@ -0,0 +1,84 @@
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+from debug_stream import DebugStream
+
+COLORS = {"green": (0, 255, 0)}
+
+
+def frame(value: int) -> tuple[np.ndarray, dict[str, list[np.ndarray]]]:
+    image = np.full((120, 160, 3), value, np.uint8)
+    box = np.array([[[20, 20]], [[20, 80]], [[60, 80]], [[60, 20]]], np.int32)
+    return image, {"green": [box]}
+
+
+def test_unknown_mode_is_refused():
+    with pytest.raises(ValueError):
+        DebugStream("window")
+
+
+def test_frames_are_written_to_a_rotating_buffer(tmp_path):
+    stream = DebugStream("disk", directory=str(tmp_path), keep=2, fps=1000).start()
+    try:
+        sequence = 0
+        for value in (0, 100, 200):
+            time.sleep(0.002)
+            assert stream.publish(*frame(value), COLORS, 1)
+            sequence, jpeg = stream.wait_jpeg(sequence, 1)
+        assert sequence == 3
+        assert sorted(path.name for path in tmp_path.iterdir()) == ["frame_0000.jpg", "frame_0001.jpg"]
+        written = cv2.imread(str(tmp_path / "frame_0001.jpg"))
+        # Scaled to half, as SCALE
+        assert written.shape == (60, 80, 3)
+        assert cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR).shape == (60, 80, 3)
+    finally:
+        stream.stop()
+
+
+def test_publish_drops_frames_above_the_rate(tmp_path):
+    stream = DebugStream("disk", directory=str(tmp_path), fps=5).start()
+    try:
+        assert stream.publish(*frame(0), COLORS)
+        assert not stream.publish(*frame(100), COLORS)
+        assert stream.stats["dropped"] == 1
+    finally:
+        stream.stop()
+    # A stopped stream takes nothing
+    assert not stream.publish(*frame(0), COLORS)
+
+
+def test_unchanged_frames_are_not_sent_again(tmp_path):
+    stream = DebugStream("disk", directory=str(tmp_path), fps=1000).start()
+    try:
+        for _ in range(3):
+            time.sleep(0.002)
+            stream.publish(*frame(50), COLORS, 0)
+            time.sleep(0.05)
+        assert stream.stats["sent"] == 1 and stream.stats["unchanged"] == 2
+        # Another chosen cup changes the label, so it is sent
+        time.sleep(0.002)
+        stream.publish(*frame(50), COLORS, 2)
+        assert stream.wait_jpeg(1, 1) is not None
+    finally:
+        stream.stop()
+
+
+def test_http_serves_the_latest_frame():
+    stream = DebugStream("http", port=0, fps=1000).start()
+    try:
+        url = f"http://127.0.0.1:{stream.server.server_address[1]}/latest.jpg"
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url, timeout=1)
+        stream.publish(*frame(0), COLORS)
+        _, jpeg = stream.wait_jpeg(0, 1)
+        with urllib.request.urlopen(url, timeout=1) as response:
+            assert response.headers["Content-Type"] == "image/jpeg"
+            assert response.read() == jpeg
+    finally:
+        stream.stop()
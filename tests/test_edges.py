@@ -0,0 +1,112 @@
+import asyncio
+import threading
+
+import pytest
+
+from edges import FALLING, RISING, Edge, EdgeMonitor, Threshold
+from sensor_hub import Snapshot
+
+
+class FakeHub:
+    """Stands in for a SensorHub, the test feeds the samples itself."""
+
+    def __init__(self):
+        self.running = True
+        self.listeners = []
+        self.sequence = 0
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def feed(self, *values):
+        for value in values:
+            self.sequence += 1
+            snapshot = Snapshot(self.sequence, self.sequence, {0: value, 1: value}, {})
+            for listener in self.listeners:
+                listener(snapshot)
+
+
+def states(threshold, values):
+    return [threshold.update(Snapshot(0, 0, {0: value}, {})) for value in values]
+
+
+def test_threshold_rejects_low_above_high():
+    with pytest.raises(ValueError):
+        Threshold(0, high=100, low=200)
+
+
+def test_threshold_hysteresis():
+    threshold = Threshold(0, high=2000, low=1000, debounce=1)
+    # Values between the two thresholds keep the state
+    assert states(threshold, [1500, 2000, 1500, 1001, 1000, 1500, 1999]) == [None, True, True, True, False, False, False]
+
+
+def test_threshold_debounce():
+    threshold = Threshold(0, high=2000, low=1000, debounce=2)
+    # The first state is taken at once, a change needs two samples in a row past the threshold
+    assert states(threshold, [3000, 0, 3000, 0, 0, 3000, 1500, 3000, 3000]) == [True, True, True, True, False, False, False, False, True]
+
+
+def test_edge_needs_the_whole_group():
+    edge = Edge("line", [Threshold(0, 2000, 1000, 1), Threshold(1, 2000, 1000, 1)])
+    seen = [edge.update(Snapshot(0, 0, {0: left, 1: right}, {})) for left, right in
+            [(0, 0), (3000, 0), (3000, 3000), (0, 3000), (0, 0)]]
+    assert seen == [None, None, RISING, None, FALLING]
+
+
+def test_monitor_counts_edges_and_calls_back():
+    hub = FakeHub()
+    monitor = EdgeMonitor(hub)
+    monitor.add("line", [Threshold(0, 2000, 1000, 1)])
+    rising = []
+    monitor.on("line", RISING, rising.append)
+    hub.feed(0, 3000, 0, 3000)
+    assert [snapshot.sequence for snapshot in rising] == [2, 4]
+    assert monitor.counts[("line", FALLING)] == 1
+    assert monitor.state("line") is True
+
+
+def test_wait_returns_the_edge_or_times_out():
+    hub = FakeHub()
+    monitor = EdgeMonitor(hub)
+    monitor.add("line", [Threshold(0, 2000, 1000, 1)])
+    hub.feed(0)
+    threading.Timer(0.05, hub.feed, (3000,)).start()
+    assert monitor.wait("line", RISING, 1).analog[0] == 3000
+    fallbacks = []
+    assert monitor.wait("line", FALLING, 0.05, lambda: fallbacks.append(True)) is None
+    assert fallbacks == [True]
+
+
+def test_next_resolves_with_the_next_edge():
+    hub = FakeHub()
+    monitor = EdgeMonitor(hub)
+    monitor.add("line", [Threshold(0, 2000, 1000, 1)])
+    hub.feed(0, 3000, 0)
+
+    async def next_rising():
+        future = monitor.next("line", RISING)
+        # Fed from another thread, as the hub's sampling thread does
+        threading.Timer(0.02, hub.feed, (3000,)).start()
+        return await asyncio.wait_for(future, 1)
+
+    assert asyncio.run(next_rising()).sequence == 4
+    assert monitor.callbacks[("line", RISING)] == []
+
+
+def test_cancelled_next_is_forgotten():
+    hub = FakeHub()
+    monitor = EdgeMonitor(hub)
+    monitor.add("line", [Threshold(0, 2000, 1000, 1)])
+    hub.feed(0)
+
+    async def time_out():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(monitor.next("line", RISING), 0.02)
+        # The done callback runs in the loop, give it its turn
+        await asyncio.sleep(0)
+
+    asyncio.run(time_out())
+    assert monitor.callbacks[("line", RISING)] == []
+    # A later edge does not touch the closed loop
+    hub.feed(3000)
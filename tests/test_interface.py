@@ -0,0 +1,151 @@
+import os
+import time
+
+import pytest
+
+import interface
+from interface import OutputBuffer
+
+
+def test_output_buffer_drops_the_oldest_lines():
+    buffer = OutputBuffer(capacity=5)
+    assert buffer.extend([f"{i}\n" for i in range(3)]) is True
+    # Not empty any more, the UI was woken up already
+    assert buffer.extend([f"{i}\n" for i in range(3, 8)]) is False
+    assert buffer.dropped == 3
+    assert buffer.drain(limit=2) == ["3\n", "4\n"]
+    assert buffer.drain() == ["5\n", "6\n", "7\n"]
+    assert buffer.empty()
+    assert buffer.put("8\n") is True
+
+
+class FakeRoot:
+    """Stands in for the Tk root: no file handlers, so the runner polls, and the polling is not scheduled."""
+
+    class tk:
+        pass
+
+    def after(self, delay, callback) -> None:
+        pass
+
+
+@pytest.fixture
+def runner(monkeypatch):
+    monkeypatch.setattr(interface, "root", FakeRoot(), raising=False)
+    monkeypatch.setattr(interface, "WARM_START", False)
+    runners = []
+
+    def create(**kwargs) -> interface.ScriptRunner:
+        for name, value in kwargs.items():
+            monkeypatch.setattr(interface, name, value)
+        runner = interface.ScriptRunner(lambda text, clear=False: None, lambda text: None, lambda path: None)
+        runners.append(runner)
+        return runner
+
+    yield create
+    for runner in runners:
+        runner.stop()
+        if runner.thread is not None:
+            runner.thread.join(5)
+        runner.close()
+
+
+def output(runner: interface.ScriptRunner) -> list[str]:
+    return [line.split("] ", 1)[-1].rstrip("\n") for line in runner.output_queue.drain(100000)]
+
+
+def run(runner: interface.ScriptRunner, path) -> list[str]:
+    runner.set_script_path(str(path))
+    runner.start()
+    runner.thread.join(10)
+    assert not runner.running
+    return output(runner)
+
+
+def test_chunks_are_split_into_lines(runner, tmp_path):
+    script = tmp_path / "script.py"
+    script.write_text("import sys\nsys.stdout.write('a\\nb\\npar')\nsys.stdout.flush()\nsys.stdout.write('t\\nlast')\n")
+    lines = run(runner(), script)
+    assert lines[0].startswith(">>> Startup:") and lines[0].endswith("(cold)")
+    assert lines[1:4] == ["a", "b", "part"]
+    assert lines[4] == "last"
+    assert lines[-1].endswith("Script finished.")
+
+
+STUBBORN_SCRIPT = """
+import signal, subprocess, sys, time
+signal.signal(signal.SIGINT, signal.SIG_IGN)
+# A child left behind in the session, like the one off() starts
+subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+print("ready", flush=True)
+time.sleep(30)
+"""
+
+
+def session_alive(pid: int) -> bool:
+    for entry in os.listdir("/proc"):
+        try:
+            with open(f"/proc/{entry}/stat") as file:
+                fields = file.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[3]) == pid and fields[0] != "Z":
+            return True
+    return False
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="stopping a session scans /proc")
+def test_stop_escalates_to_the_whole_session(runner, tmp_path):
+    script = tmp_path / "script.py"
+    script.write_text(STUBBORN_SCRIPT)
+    r = runner(STOP_DEADLINES=(0.2, 0.5, 1.0))
+    r.set_script_path(str(script))
+    r.start()
+    deadline = time.monotonic() + 5
+    while "ready" not in output(r) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    pid = r.process.pid
+    assert len(r._session_members()) == 2
+    r.stop()
+    r.thread.join(5)
+    lines = output(r)
+    # SIGINT is ignored, SIGTERM ends both
+    assert any(line.startswith(">>> Stopped in") and line.endswith("(SIGTERM)") for line in lines)
+    assert lines[-1].endswith("Script interrupted.")
+    assert not session_alive(pid)
+    assert r.process is None
+
+
+def test_stop_before_the_script_was_spawned(runner, tmp_path):
+    script = tmp_path / "script.py"
+    script.write_text("import time\ntime.sleep(30)\n")
+    r = runner()
+    r.set_script_path(str(script))
+    start = time.monotonic()
+    r.start()
+    # Right away, run_script has most likely not spawned the script yet
+    r.stop()
+    r.thread.join(10)
+    assert time.monotonic() - start < 5
+    assert output(r)[-1].endswith("Script interrupted.")
+
+
+def test_warm_start_times_the_script_not_the_preload(runner, tmp_path):
+    script = tmp_path / "script.py"
+    script.write_text("import sys\nprint(sys.argv[0])\n")
+    r = runner(WARM_START=True, WARM_MODULES=["no_such_module_to_preload"])
+    lines = run(r, script)
+    assert lines[0].startswith("Warm start: could not preload no_such_module_to_preload")
+    assert lines[1].startswith(">>> Startup:") and lines[1].endswith("(warm)")
+    assert lines[2] == str(script)
+    assert not any("warm-start" in line for line in lines)
+
+
+def test_closed_worker_is_reaped(runner):
+    r = runner(WARM_START=True, WARM_MODULES=[])
+    worker = r.worker
+    r.close()
+    deadline = time.monotonic() + 5
+    while worker.returncode is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert worker.returncode == 0
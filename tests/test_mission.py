@@ -0,0 +1,90 @@
+import asyncio
+import re
+
+import pytest
+
+from mission import Mission, MissionError, StepFailed
+
+
+def mission(tmp_path, text: str, functions: dict, constants: dict = None) -> Mission:
+    path = tmp_path / "mission.yaml"
+    path.write_text(text)
+    return Mission(str(path), functions, constants)
+
+
+def drive(left: int, right: int, duration: float = 1.0):
+    return (left, right, duration)
+
+
+@pytest.mark.parametrize("text, message", [
+    ("version: 2\nsteps: []\n", "version 2"),
+    ("version: 1\nsteps:\n  - fly: 3\n", "unknown step fly"),
+    ("version: 1\nsteps:\n  - drive: [1, 2, 3, 4]\n", "step 0 (drive)"),
+    ("version: 1\nsteps:\n  - drive: {left: 1, speed: 2}\n", "step 0 (drive)"),
+    ("version: 1\nsteps:\n  - drive: [1, 2, 2 * TURNN]\n", "Unknown constant TURNN"),
+    ("version: 1\nsteps:\n  - {drive: [1, 2], wait: 1}\n", "expected one step name"),
+    ("version: 1\nsteps:\n  - phase: {name: x, urgency: 1}\n", "step 0 (phase)"),
+])
+def test_compile_errors(tmp_path, text, message):
+    with pytest.raises(MissionError, match=re.escape(message)):
+        mission(tmp_path, text, {"drive": drive})
+
+
+def test_arguments_constants_and_refs(tmp_path):
+    calls = []
+    m = mission(tmp_path, """
+version: 1
+constants:
+  TURN: 0.5
+  FAST: SPEED + 10
+steps:
+  - measure: {}
+    store: width
+  - drive: {left: FAST, right: -FAST, duration: 2 * TURN}
+  - record: [$width, min_jerk, not reached]
+""", {
+        "measure": lambda: 7,
+        "drive": lambda **kwargs: calls.append(kwargs),
+        "record": lambda *args: calls.append(args),
+    }, {"SPEED": 90})
+    state = asyncio.run(m.run())
+    assert state == {"width": 7}
+    assert calls == [{"left": 100, "right": -100, "duration": 1.0}, (7, "min_jerk", "not reached")]
+
+
+def test_phases_group_the_steps(tmp_path):
+    ran = []
+
+    def failing():
+        raise StepFailed("no line")
+
+    m = mission(tmp_path, """
+version: 1
+steps:
+  - mark: setup
+  - phase: {name: first, priority: 2, estimate: 1}
+  - mark: a
+  - fail
+  - mark: dropped
+  - phase: {name: second}
+  - mark: b
+""", {"mark": ran.append, "fail": failing})
+    assert [phase.name for phase in m.phases] == ["start", "first", "second"]
+    assert [len(phase.steps) for phase in m.phases] == [1, 3, 1]
+    asyncio.run(m.run())
+    # The failed step drops the rest of its phase, the next phase still runs
+    assert ran == ["setup", "a", "b"]
+
+
+def test_reload_keeps_the_steps_on_errors(tmp_path):
+    m = mission(tmp_path, "version: 1\nsteps:\n  - drive: [1, 2]\n", {"drive": drive})
+    (tmp_path / "mission.yaml").write_text("version: 1\nsteps:\n  - fly: 1\n")
+    with pytest.raises(MissionError):
+        m.reload()
+    assert [step.name for step in m.steps] == ["drive"]
+
+
+def test_phase_requires_an_earlier_phase(tmp_path):
+    with pytest.raises(MissionError, match="requires"):
+        mission(tmp_path, "version: 1\nsteps:\n  - phase: {name: fill, requires: drinkpods}\n  - drive: [1, 2]\n",
+                {"drive": drive})
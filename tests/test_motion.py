@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+import pytest
+
+from motion import Motion
+
+
+class FakeRobot:
+    """Records motor speeds and holds servo positions."""
+
+    def __init__(self):
+        self.speeds = {}
+        self.commands = []
+        self.servos = {0: 0}
+        self.positions = []
+
+    def motor(self, port, speed):
+        self.speeds[port] = speed
+        self.commands.append((port, speed))
+
+    def set_servo(self, port, position):
+        self.servos[port] = position
+        self.positions.append(position)
+
+    def get_servo(self, port):
+        return self.servos[port]
+
+
+def motion(robot):
+    return Motion(0, 1, rate=200, motor=robot.motor, set_servo=robot.set_servo, get_servo=robot.get_servo)
+
+
+def test_drive_for_a_duration_stops_the_motors():
+    robot = FakeRobot()
+    start = time.monotonic()
+    assert asyncio.run(motion(robot).drive(80, 100, 0.05))
+    assert time.monotonic() - start >= 0.05
+    assert robot.commands == [(0, 80), (1, 100), (0, 0), (1, 0)]
+    robot.commands.clear()
+    asyncio.run(motion(robot).turn(50, 0.01, stop=False))
+    assert robot.commands == [(0, 50), (1, -50)]
+
+
+def test_drive_needs_duration_or_until():
+    robot = FakeRobot()
+    with pytest.raises(ValueError):
+        asyncio.run(motion(robot).drive(50, 50))
+    with pytest.raises(ValueError):
+        asyncio.run(motion(robot).drive(50, 50, 1, until=lambda: True))
+    assert robot.speeds == {0: 0, 1: 0}
+
+
+def test_drive_until_a_polled_condition():
+    robot = FakeRobot()
+    deadline = time.monotonic() + 0.05
+    assert asyncio.run(motion(robot).drive(50, 50, until=lambda: time.monotonic() >= deadline, timeout=1))
+    assert time.monotonic() >= deadline
+    assert not asyncio.run(motion(robot).drive(50, 50, until=lambda: False, timeout=0.05))
+    assert robot.speeds == {0: 0, 1: 0}
+
+
+def test_drive_until_a_future():
+    robot = FakeRobot()
+
+    async def drive(resolve_after, timeout):
+        future = asyncio.get_running_loop().create_future()
+        asyncio.get_running_loop().call_later(resolve_after, future.set_result, None)
+        return await motion(robot).drive(50, 50, until=future, timeout=timeout)
+
+    assert asyncio.run(drive(0.02, 1))
+    assert not asyncio.run(drive(1, 0.02))
+    assert robot.speeds == {0: 0, 1: 0}
+
+
+def test_cancelled_drive_stops_the_motors():
+    robot = FakeRobot()
+
+    async def cancel():
+        task = asyncio.ensure_future(motion(robot).drive(50, 50, 10))
+        await asyncio.sleep(0.02)
+        assert robot.speeds == {0: 50, 1: 50}
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel())
+    assert robot.speeds == {0: 0, 1: 0}
+
+
+def test_servo_ramp_runs_alongside_a_drive():
+    robot = FakeRobot()
+    move = motion(robot)
+
+    async def both():
+        await asyncio.gather(move.drive(50, 50, 0.1), move.servo_ramp(0, 1000, 0.1))
+
+    start = time.monotonic()
+    asyncio.run(both())
+    # Gathered, not one after the other
+    assert time.monotonic() - start < 0.18
+    assert robot.positions == sorted(robot.positions)
+    assert len(robot.positions) > 5 and robot.positions[-1] == 1000
+    with pytest.raises(RuntimeError):
+        asyncio.run(move.servo_move({0: 500}, 0.1))
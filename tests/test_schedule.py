@@ -0,0 +1,76 @@
+import asyncio
+import json
+import os
+import time
+
+from mission import Mission
+from schedule import Phase, Scheduler, measured_estimates
+
+
+def scheduler_at(elapsed: float, **kwargs) -> Scheduler:
+    scheduler = Scheduler(**kwargs)
+    scheduler.start()
+    scheduler.start_time -= elapsed
+    return scheduler
+
+
+def test_later_higher_priority_phases_keep_their_estimate():
+    phases = [Phase("drinkpods", priority=1, estimate=27), Phase("fill", priority=3, estimate=16)]
+    assert abs(scheduler_at(50, budget=119).allowance(phases, 0) - 53) < 0.1
+    # 119 - 80 - 16 leaves 23 s, less than the 27 s drinkpods needs
+    assert scheduler_at(80, budget=119).allowance(phases, 0) is None
+    assert scheduler_at(80, budget=119).allowance(phases, 1) is not None
+
+
+def test_minimum_and_deadline():
+    phases = [Phase("poms", estimate=30, minimum=5, deadline=60)]
+    assert abs(scheduler_at(50, budget=119).allowance(phases, 0) - 10) < 0.1
+    assert scheduler_at(56, budget=119).allowance(phases, 0) is None
+    assert scheduler_at(0, budget=None).allowance([Phase("free")], 0) == float("inf")
+
+
+def test_measured_estimates_fill_in():
+    scheduler = scheduler_at(100, budget=119, estimates={"ice": 25})
+    assert scheduler.allowance([Phase("ice")], 0) is None
+    assert scheduler.allowance([Phase("unknown")], 0) is not None
+
+
+def test_skipped_and_cut_phases_are_profiled(tmp_path):
+    halted = []
+    path = tmp_path / "mission.yaml"
+    path.write_text("""
+version: 1
+steps:
+  - phase: {name: slow, priority: 1, estimate: 0.1, deadline: 0.1, minimum: 0.05}
+  - nap: 0.05
+  - nap: 0.05
+  - nap: 0.05
+  - phase: {name: hopeless, priority: 1, estimate: 5}
+  - nap: 0
+  - phase: {name: last, priority: 2, estimate: 0.1}
+  - nap: 0
+""")
+    mission = Mission(str(path), {"nap": time.sleep})
+    profiles = tmp_path / "profiles"
+    asyncio.run(mission.run(Scheduler(budget=1, profile_dir=str(profiles), halt=lambda: halted.append(True))))
+
+    profile, = [json.load(open(os.path.join(profiles, name))) for name in os.listdir(profiles)]
+    assert [(phase["name"], phase["status"]) for phase in profile["phases"]] == [
+        ("slow", "cut"), ("hopeless", "skipped"), ("last", "done")]
+    assert halted == [True]
+    assert measured_estimates(str(profiles)) == {"last": profile["phases"][2]["duration"]}
+
+
+def test_required_phases_are_skipped_together():
+    drinkpods = Phase("drinkpods", priority=1, estimate=18)
+    fill = Phase("fill", priority=3, estimate=16, requires="drinkpods")
+    phases = [drinkpods, fill]
+    # Both fit: fill is not reserved against the phase it needs
+    assert abs(scheduler_at(80, budget=119).allowance(phases, 0) - 39) < 0.1
+    # Only drinkpods would fit, starting it is pointless
+    assert scheduler_at(90, budget=119).allowance(phases, 0) is None
+    scheduler = scheduler_at(0, budget=119)
+    scheduler.record(drinkpods, "skipped", 0)
+    assert scheduler.allowance(phases, 1) is None
+    scheduler.phases[-1]["status"] = "done"
+    assert scheduler.allowance(phases, 1) is not None
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+import segmentation
+from segmentation import LutSegmenter, build_lut, cached_lut
+
+# Overlapping on purpose: hue 80 is both green and blue, as in utils.COLORS
+COLORS = {
+    "pink": {"lower_hue": 150, "upper_hue": 179, "lower_saturation": 50, "upper_saturation": 220,
+             "lower_value": 150, "upper_value": 255},
+    "green": {"lower_hue": 40, "upper_hue": 80, "lower_saturation": 70, "upper_saturation": 255,
+              "lower_value": 150, "upper_value": 255},
+    "blue": {"lower_hue": 80, "upper_hue": 110, "lower_saturation": 70, "upper_saturation": 255,
+             "lower_value": 100, "upper_value": 255},
+}
+
+
+def random_hsv(seed: int, shape=(120, 160)) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return np.dstack([rng.integers(0, 180, shape), rng.integers(0, 256, shape), rng.integers(0, 256, shape)]).astype(np.uint8)
+
+
+def in_range(hsv: np.ndarray, values: dict[str, int]) -> np.ndarray:
+    lower = np.array([values["lower_hue"], values["lower_saturation"], values["lower_value"]])
+    upper = np.array([values["upper_hue"], values["upper_saturation"], values["upper_value"]])
+    return cv2.inRange(hsv, lower, upper)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_lut_labels_equal_in_range(seed):
+    hsv = random_hsv(seed)
+    # Every boundary value of every color, where an off-by-one would show
+    for values in COLORS.values():
+        for h in (values["lower_hue"], values["upper_hue"]):
+            for s in (values["lower_saturation"] - 1, values["lower_saturation"], values["upper_saturation"], values["upper_saturation"] + 1):
+                for v in (values["lower_value"] - 1, values["lower_value"], values["upper_value"]):
+                    hsv[seed, (h + s + v) % hsv.shape[1]] = (h, min(s, 255), v)
+    labels = LutSegmenter(COLORS, 0).label(hsv)
+    for bit, (name, values) in enumerate(COLORS.items()):
+        assert np.array_equal((labels & (1 << bit)) != 0, in_range(hsv, values) != 0), name
+
+
+def test_segment_masks_equal_the_per_color_passes():
+    hsv = random_hsv(3)
+    # Solid blocks that survive the morphology, on top of the noise
+    hsv[10:60, 10:60] = (60, 200, 200)
+    hsv[60:110, 90:150] = (80, 200, 200)
+    segmenter = LutSegmenter(COLORS, 100)
+    masks, contours = segmenter.segment(hsv)
+    kernel = np.ones((5, 5), np.uint8)
+    for name, values in COLORS.items():
+        expected = cv2.morphologyEx(cv2.morphologyEx(in_range(hsv, values), cv2.MORPH_OPEN, kernel), cv2.MORPH_CLOSE, kernel)
+        assert np.array_equal(masks[name], expected), name
+    # The hue 80 block is both green and blue
+    assert len(contours["green"]) == 2 and len(contours["blue"]) == 1
+    masks, contours = segmenter.segment(hsv, only=["blue"])
+    assert list(masks) == ["blue"]
+
+
+def test_quantized_lut_is_smaller():
+    assert build_lut(COLORS).shape == (180, 256, 256)
+    assert build_lut(COLORS, 2).shape == (180, 64, 64)
+    hsv = random_hsv(4)
+    labels = LutSegmenter(COLORS, 0, shift=2).label(hsv)
+    # Bins are decided by their lowest value, so the quantized table agrees on multiples of 4
+    lowest = np.dstack([hsv[..., 0], hsv[..., 1] & 0xFC, hsv[..., 2] & 0xFC])
+    assert np.array_equal(labels, LutSegmenter(COLORS, 0).label(lowest))
+
+
+def test_more_than_eight_colors_are_refused():
+    with pytest.raises(ValueError):
+        build_lut({str(i): COLORS["pink"] for i in range(9)})
+
+
+def test_cached_lut_is_reused(tmp_path, monkeypatch):
+    lut = cached_lut(COLORS, directory=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 1
+
+    def build_again(*args):
+        raise AssertionError("built although cached")
+
+    monkeypatch.setattr(segmentation, "build_lut", build_again)
+    assert np.array_equal(cached_lut(COLORS, directory=str(tmp_path)), lut)
+    # Other colors get their own table
+    with pytest.raises(AssertionError):
+        cached_lut(dict(COLORS, pink=COLORS["green"]), directory=str(tmp_path))
@@ -0,0 +1,86 @@
+import threading
+import time
+
+from sensor_hub import SensorHub
+
+
+class FakePorts:
+    """Analog values set by the test, a spike can be injected for exactly one read."""
+
+    def __init__(self):
+        self.values = {}
+        self.spikes = {}
+
+    def analog(self, port):
+        if port in self.spikes:
+            return self.spikes.pop(port)
+        return self.values.get(port, 0)
+
+    def digital(self, port):
+        return port % 2
+
+
+def hub(ports, median=3):
+    return SensorHub([0, 1], [2, 3], rate=1000, median=median, analog_read=ports.analog, digital_read=ports.digital).start()
+
+
+def test_start_returns_with_a_snapshot():
+    ports = FakePorts()
+    ports.values = {0: 100, 1: 200}
+    sensors = hub(ports)
+    try:
+        assert sensors.snapshot is not None
+        assert sensors.wait_until(lambda snapshot: snapshot.sequence >= 3, 1) is not None
+        assert sensors.analog(0) == 100 and sensors.analog(1) == 200
+        assert sensors.digital(2) == 0 and sensors.digital(3) == 1
+    finally:
+        sensors.stop()
+
+
+def test_median_filter_drops_a_single_spike():
+    ports = FakePorts()
+    ports.values = {0: 100}
+    sensors = hub(ports)
+    try:
+        sensors.wait_until(lambda snapshot: snapshot.sequence >= 3, 1)
+        seen = []
+        sensors.add_listener(lambda snapshot: seen.append(snapshot.analog[0]))
+        ports.spikes[0] = 4000
+        sensors.wait_until(lambda snapshot: 0 not in ports.spikes and len(seen) > 3, 1)
+        assert 4000 not in seen
+    finally:
+        sensors.stop()
+
+    # Without the filter the spike comes through
+    ports = FakePorts()
+    ports.values = {0: 100}
+    sensors = hub(ports, median=1)
+    try:
+        ports.spikes[0] = 4000
+        assert sensors.wait_until(lambda snapshot: snapshot.analog[0] == 4000, 1) is not None
+    finally:
+        sensors.stop()
+
+
+def test_wait_until_returns_the_matching_snapshot():
+    ports = FakePorts()
+    sensors = hub(ports, median=1)
+    try:
+        threading.Timer(0.05, lambda: ports.values.update({1: 3000})).start()
+        snapshot = sensors.wait_until(lambda snapshot: snapshot.analog[1] > 2000, 1)
+        assert snapshot is not None and snapshot.analog[1] == 3000
+    finally:
+        sensors.stop()
+
+
+def test_wait_until_gives_up_on_timeout_and_stop():
+    ports = FakePorts()
+    sensors = hub(ports)
+    try:
+        start = time.monotonic()
+        assert sensors.wait_until(lambda snapshot: False, 0.05) is None
+        assert 0.05 <= time.monotonic() - start < 0.5
+        threading.Timer(0.05, sensors.stop).start()
+        assert sensors.wait_until(lambda snapshot: False) is None
+    finally:
+        sensors.stop()
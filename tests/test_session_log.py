@@ -0,0 +1,49 @@
+from session_log import CHECKPOINT, SessionArchive, SessionRecorder
+
+
+def record(recorder: SessionRecorder, script: str, count: int, end: bool = True) -> None:
+    recorder.start_run(script)
+    for i in range(count):
+        recorder.record(i / 100, [f"{script} line {i}"])
+    if end:
+        recorder.end_run("finished", 0.05)
+    recorder.flush()
+
+
+def test_lines_are_read_across_checkpoints(tmp_path):
+    recorder = SessionRecorder(str(tmp_path))
+    record(recorder, "long", CHECKPOINT * 3 + 10)
+    record(recorder, "short", 5)
+    recorder.close()
+
+    archive = SessionArchive(str(tmp_path))
+    long, short = archive.runs
+    assert archive.line_count(long) == CHECKPOINT * 3 + 10
+    assert archive.line_count(short) == 5
+    for first in (0, CHECKPOINT - 1, CHECKPOINT, 2 * CHECKPOINT + 7, CHECKPOINT * 3 + 8):
+        lines = archive.read_lines(long, first, 3)
+        assert [text for _, text in lines] == [f"long line {i}" for i in range(first, min(first + 3, CHECKPOINT * 3 + 10))]
+        assert lines[0][0] == first / 100
+    assert [text for _, text in archive.read_lines(short, 0, 10)] == [f"short line {i}" for i in range(5)]
+    assert short["startup"] == 0.05
+    archive.close()
+
+
+def test_cut_off_run_is_incomplete(tmp_path):
+    recorder = SessionRecorder(str(tmp_path))
+    record(recorder, "done", 3)
+    record(recorder, "killed", CHECKPOINT + 4, end=False)
+
+    archive = SessionArchive(str(tmp_path))
+    done, killed = archive.runs
+    assert done["status"] == "finished"
+    assert killed["status"] == "incomplete"
+    assert archive.line_count(killed) == CHECKPOINT + 4
+    assert archive.read_lines(killed, CHECKPOINT + 3, 5)[0][1] == f"killed line {CHECKPOINT + 3}"
+    archive.close()
+
+    # The next recorder continues the numbering after the cut off run
+    recorder.close()
+    recorder = SessionRecorder(str(tmp_path))
+    assert recorder.start_run("next") == 2
+    recorder.close()
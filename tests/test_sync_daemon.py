@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("paramiko")
+
+from codebridge import FileSet
+from sync_daemon import Robot
+
+
+class FakeSession:
+    def __init__(self):
+        self.connects = 0
+
+    def connect(self) -> None:
+        self.connects += 1
+
+    def close(self) -> None:
+        pass
+
+
+class FakeBatcher:
+    def __init__(self):
+        self.uploads = []
+
+    def upload(self, files: dict) -> dict:
+        self.uploads.append(files)
+        size = sum(len(data) for data in files.values())
+        return {"files": len(files), "size": size, "sent": size, "saved": 0, "throughput": 1e6}
+
+
+class FlakyRunner:
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.restarts = 0
+
+    def restart(self) -> None:
+        if self.failures:
+            self.failures -= 1
+            raise OSError("connection lost")
+        self.restarts += 1
+
+
+def test_failed_restart_is_retried_without_an_empty_upload(tmp_path):
+    session = FakeSession()
+    robot = Robot("bartender", session, [(FileSet(str(tmp_path)), "/home/bot")], transfer="batch")
+    robot.batcher = FakeBatcher()
+    robot.runner = FlakyRunner(failures=1)
+
+    async def scenario():
+        task = asyncio.create_task(robot.run())
+        robot.queue(str(tmp_path / "control.py"), b"print(1)", 0.0)
+        for _ in range(100):
+            if robot.runner.restarts:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(scenario())
+    assert robot.runner.restarts == 1
+    assert session.connects == 2
+    assert robot.batcher.uploads == [{"/home/bot/control.py": b"print(1)"}]
@@ -0,0 +1,108 @@
+import time
+
+from trajectory import ServoEngine, linear, min_jerk, trapezoid
+
+
+class FakeServos:
+    def __init__(self):
+        self.positions = {0: 0, 1: 0}
+        self.writes = []
+
+    def set(self, port: int, position: int) -> None:
+        self.positions[port] = position
+        self.writes.append((port, position))
+
+    def get(self, port: int) -> int:
+        return self.positions[port]
+
+
+def engine(servos: FakeServos) -> ServoEngine:
+    return ServoEngine(rate=200, set_servo=servos.set, get_servo=servos.get)
+
+
+def test_profiles_start_and_end():
+    for profile in (linear, trapezoid, min_jerk):
+        assert profile(0.0) == 0
+        assert abs(profile(1.0) - 1) < 1e-9
+        assert abs(profile(0.5) - 0.5) < 1e-9
+
+
+def test_move_reaches_target():
+    servos = FakeServos()
+    e = engine(servos)
+    try:
+        assert e.move(0, 100, 0.05).result(1) is True
+        assert servos.positions[0] == 100
+    finally:
+        e.stop()
+
+
+def test_retarget_twice_in_quick_succession():
+    servos = FakeServos()
+    e = engine(servos)
+    try:
+        first = e.move(0, 100, 0.5)
+        second = e.move(0, 200, 0.5)
+        third = e.move_many({0: 300, 1: 50}, 0.05)
+        assert first.result(1) is False
+        assert second.result(1) is False
+        assert third.result(1) is True
+        assert servos.positions == {0: 300, 1: 50}
+        # Continued from where the replaced moves were, no jump back to a stale position
+        assert all(position >= 0 for port, position in servos.writes if port == 0)
+    finally:
+        e.stop()
+
+
+def test_direct_set_between_moves_is_picked_up():
+    servos = FakeServos()
+    e = engine(servos)
+    try:
+        e.move(0, 100, 0.02).result(1)
+        servos.positions[0] = 500
+        start = time.monotonic()
+        future = e.move(0, 400, 0.1)
+        time.sleep(0.02)
+        assert servos.positions[0] > 400
+        assert future.result(1) is True
+        assert time.monotonic() - start < 1
+    finally:
+        e.stop()
+
+
+def test_retarget_as_the_move_completes():
+    servos = FakeServos()
+    e = engine(servos)
+    futures = []
+
+    def set_and_retarget(port: int, position: int) -> None:
+        servos.set(port, position)
+        if position == 100 and len(futures) == 1:
+            # On the engine thread, between writing the target and resolving the finished move
+            futures.append(e.move(0, 200, 0.02))
+
+    e.set_servo = set_and_retarget
+    try:
+        futures.append(e.move(0, 100, 0.02))
+        assert futures[0].result(1) is False
+        assert futures[1].result(1) is True
+        # The engine thread survived and still moves servos
+        assert e.move(0, 300, 0.02).result(1) is True
+        assert servos.positions[0] == 300
+    finally:
+        e.stop()
+
+
+def test_retargets_racing_completion_from_another_thread():
+    servos = FakeServos()
+    e = engine(servos)
+    try:
+        for i in range(50):
+            first = e.move(0, i * 10, 0.005)
+            time.sleep(0.005)
+            second = e.move(0, i * 10 + 5, 0.005)
+            assert first.result(1) in (True, False)
+            assert second.result(1) is True
+        assert e.thread.is_alive()
+    finally:
+        e.stop()
@@ -0,0 +1,114 @@
+import time
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+import camera
+import utils
+
+# Middle of every hand-tuned range, as BGR
+HSV = {"pink": (165, 135, 200), "green": (60, 160, 200), "blue": (95, 160, 180)}
+
+
+def bgr(name: str) -> tuple[int, int, int]:
+    return tuple(int(c) for c in cv2.cvtColor(np.uint8([[HSV[name]]]), cv2.COLOR_HSV2BGR)[0, 0])
+
+
+def scene(cups=("pink", "green", "blue"), drink="green") -> np.ndarray:
+    """A flipped frame with the cups left to right and the drink in the rightmost sixth."""
+    frame = np.zeros((240, 320, 3), np.uint8)
+    for i, name in enumerate(cups):
+        cv2.rectangle(frame, (20 + 70 * i, 100), (60 + 70 * i, 160), bgr(name), -1)
+    cv2.rectangle(frame, (280, 90), (310, 150), bgr(drink), -1)
+    return frame
+
+
+def boxes(contours: dict[str, list[np.ndarray]]) -> dict[str, list[tuple]]:
+    return {name: sorted(cv2.boundingRect(cnt) for cnt in found) for name, found in contours.items()}
+
+
+def test_coarse_pass_finds_the_full_resolution_contours():
+    frame = scene()
+    full_masks, full = utils.segment_roi(frame, (0, 0, 1, 1), 1.0)
+    coarse_masks, coarse = utils.segment_roi(frame, (0, 0, 1, 1), 0.25)
+    assert boxes(coarse) == boxes(full)
+    assert boxes(full)["green"] == [(20 + 70, 100, 41, 61), (280, 90, 31, 61)]
+    for name in utils.COLORS:
+        assert np.array_equal(coarse_masks[name], full_masks[name]), name
+
+
+def test_only_the_roi_is_searched():
+    frame = scene()
+    masks, contours = utils.segment_roi(frame, (0.0, 0.0, 0.5, 1.0), 0.25)
+    # Blue starts at x 160, the drink at 280, both right of the ROI
+    assert boxes(contours) == {"pink": [(20, 100, 41, 61)], "green": [(90, 100, 41, 61)], "blue": []}
+    for mask in masks.values():
+        assert mask.shape == frame.shape[:2] and not mask[:, 160:].any()
+
+
+def test_contours_come_back_in_frame_coordinates():
+    frame = scene()
+    _, contours = utils.segment_roi(frame, (0.25, 0.25, 1.0, 1.0), 1.0)
+    assert boxes(contours)["blue"] == [(160, 100, 41, 61)]
+    assert boxes(contours)["green"][0] == (90, 100, 41, 61)
+    # Left of the ROI, which starts at x 80
+    assert boxes(contours)["pink"] == []
+
+
+def test_overlapping_boxes_are_merged():
+    assert utils.merge_boxes([(0, 0, 10, 10), (20, 0, 30, 10), (5, 5, 15, 15)]) == [(0, 0, 15, 15), (20, 0, 30, 10)]
+
+
+def test_find_cups_takes_the_drink_color():
+    frame = scene(drink="blue")
+    masks, contours = utils.segment_roi(frame)
+    index, found = utils.find_cups(frame, masks, contours)
+    assert index == 2
+    assert [color for color, _ in found] == ["pink", "green", "blue", "blue"]
+
+
+def camera_of(tmp_path, frames: list[np.ndarray]) -> camera.CameraService:
+    for i, frame in enumerate(frames):
+        # The camera is upside down, detect_contours flips every frame
+        cv2.imwrite(str(tmp_path / f"{i}.png"), cv2.flip(frame, -1))
+    return camera.CameraService(camera.FakeCamera(str(tmp_path), fps=30, loop=False), warmup_frames=0).start()
+
+
+def test_vote_returns_early_once_confident(tmp_path):
+    cam = camera_of(tmp_path, [scene(drink="blue")] * 6)
+    try:
+        assert utils.vote_cup(cam, deadline=1, confidence=0.8, min_votes=3) == (2, 1.0, 3)
+    finally:
+        cam.stop()
+
+
+def test_vote_outlasts_a_wrong_frame(tmp_path):
+    cam = camera_of(tmp_path, [scene(drink="green")] + [scene(drink="blue")] * 4)
+    try:
+        assert utils.vote_cup(cam, deadline=1, confidence=0.8, min_votes=3) == (2, 0.8, 5)
+    finally:
+        cam.stop()
+
+
+def test_vote_without_cups_has_no_result(tmp_path, capsys):
+    cam = camera_of(tmp_path, [np.zeros((240, 320, 3), np.uint8)] * 3)
+    try:
+        # The stream ends before the deadline
+        assert utils.vote_cup(cam, deadline=1) == (None, 0.0, 3)
+    finally:
+        cam.stop()
+    assert "skipped" in capsys.readouterr().out
+
+
+def test_vote_takes_the_leader_at_the_deadline(tmp_path):
+    cam = camera_of(tmp_path, [scene(drink="green"), scene(drink="blue")])
+    cam.backend.loop = True
+    try:
+        start = time.monotonic()
+        index, share, frames = utils.vote_cup(cam, deadline=0.2, confidence=0.8, min_votes=3)
+        assert time.monotonic() - start < 0.4
+        assert index in (1, 2) and share < 0.8 and frames >= 3
+    finally:
+        cam.stop()